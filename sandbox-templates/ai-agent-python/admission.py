@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional
+
+# Чем меньше значение, тем раньше запрос получает слот провайдера
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен к провайдеру: 429 - превышен лимит клиента, 503 - перегрузка"""
+
+    def __init__(self, reason: str, status_code: int = 503, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None, cost: float = 1.0) -> float:
+        """0, если выданы ``cost`` токенов, иначе секунды до их появления"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class ClientLimiter:
+    """Token bucket на каждого клиента; ``rate <= 0`` отключает ограничение.
+
+    Хранится не более ``max_clients`` бакетов, давно не обращавшиеся клиенты
+    вытесняются (их бакет все равно успел бы наполниться).
+    """
+
+    def __init__(self, rate: float = 5.0, burst: float = 20.0, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rejected = 0
+
+    def check(self, client: str, now: Optional[float] = None, cost: float = 1.0):
+        """Списать ``cost`` токенов клиента (по одному на вызов LLM) или отказать с 429"""
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        retry_after = bucket.take(now, cost)
+        if retry_after:
+            self.rejected += 1
+            raise AdmissionRejected("rate_limited", 429, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets), "rejected": self.rejected}
+
+
+class Ticket:
+    """Допуск запроса: приоритет, крайний срок начала вызова и суммарное ожидание в очередях"""
+
+    def __init__(self, priority: int = PRIORITIES["normal"], timeout: Optional[float] = None):
+        self.priority = priority
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.queue_wait = 0.0
+
+    def attempt(self) -> "Ticket":
+        """Допуск отдельной попытки вызова: тот же приоритет и срок, свое ожидание в очереди"""
+        attempt = Ticket(self.priority)
+        attempt.deadline = self.deadline
+        return attempt
+
+
+class PriorityLimiter:
+    """Ограничение параллелизма с очередью по приоритету и крайнему сроку.
+
+    Освободившийся слот передается ожидающему с наивысшим приоритетом, при
+    равном приоритете - пришедшему раньше. Запрос, не получивший слот до
+    крайнего срока, снимается с очереди; при переполнении очереди отказ
+    мгновенный. В обоих случаях - ``AdmissionRejected`` со статусом 503.
+    """
+
+    def __init__(self, limit: int, max_queue: Optional[int] = None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_use = 0
+        self.queued = 0
+        self._waiters = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.rejected: Dict[str, int] = defaultdict(int)
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, 503)
+
+    async def acquire(self, priority: int = PRIORITIES["normal"], deadline: Optional[float] = None) -> float:
+        """Занять слот; возвращает время ожидания в очереди в секундах"""
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if timeout is not None and timeout <= 0:
+            self._reject("deadline")
+        if self.in_use < self.limit and not self.queued:
+            self.in_use += 1
+            self.admitted += 1
+            return 0.0
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Слот уже передан этому запросу - отдаем его следующему
+                self.release()
+            else:
+                future.cancel()
+                self.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("deadline")
+            raise
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.total_wait += waited
+        return waited
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Слот переходит ожидающему без освобождения
+                self.queued -= 1
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_use,
+            "limit": self.limit,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "avg_queue_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "rejected": dict(self.rejected),
+        }
@@ -1,96 +1,332 @@
 import os
-import logging
+import json
+import math
+import time
+import uuid
+import asyncio
+import structlog
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
+from admission import PRIORITIES, AdmissionRejected, ClientLimiter, Ticket
+from coalesce import SingleFlight, context_key, request_key
 from dashboard import AgentDashboard
-from fastapi import FastAPI
-from langchain.llms import OpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_mistralai import ChatMistralAI
-from langchain_groq import ChatGroq
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='\033[36m%(asctime)s\033[0m | \033[32m%(levelname)s\033[0m | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-logger = logging.getLogger(__name__)
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.messages import BaseMessageChunk, HumanMessage, SystemMessage, get_buffer_string
+from logs import configure_logging, sampled, truncate
+from metrics import MetricsChannel
+from pool import ProviderPool
+from pydantic import BaseModel
+from router import LazyModel, LLMRouter
+from semantic_cache import SemanticCache, sentence_transformer_embedder
+from sessions import SessionStore, SQLiteSessionBackend
+
+# Структурированные логи: запись через фоновую очередь, содержимое - для выборки запросов
+configure_logging(os.getenv("AGENT_LOG_FORMAT", "json"), os.getenv("AGENT_LOG_LEVEL", "INFO"))
+logger = structlog.get_logger()
+LOG_SAMPLE_RATE = float(os.getenv("AGENT_LOG_SAMPLE_RATE", "0.01"))
+LOG_MAX_CHARS = int(os.getenv("AGENT_LOG_MAX_CHARS", "500"))
+
+def content_fields(**payload) -> dict:
+    """Тексты запроса и ответа для лога: только для выборки запросов и в обрезанном виде"""
+    if not sampled(LOG_SAMPLE_RATE):
+        return {}
+    return {key: truncate(value, LOG_MAX_CHARS) for key, value in payload.items()}
+
+def init_dashboard() -> AgentDashboard:
+    """Дашборд воркера; метрики публикуются в общую память для процесса dashboard.py"""
+    channel_name = os.getenv("AGENT_METRICS_CHANNEL", "ai-agent-metrics")
+    if channel_name:
+        try:
+            return AgentDashboard(channel=MetricsChannel(channel_name))
+        except Exception as e:
+            logger.warning("Канал метрик недоступен, метрики только в процессе", error=str(e))
+    return AgentDashboard()
+
+dashboard = init_dashboard()
+dashboard.attach_logs()
 
 app = FastAPI()
-dashboard = AgentDashboard()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
 
 class LLMProvider(Enum):
     OPENAI = "openai"
     ANTHROPIC = "anthropic"
     MISTRAL = "mistral"
     GROQ = "groq"
+    # Офлайн-провайдер с записанными ответами для тестов и бенчмарков
+    FAKE = "fake"
 
-def init_llm(provider: LLMProvider = LLMProvider.OPENAI) -> Optional[OpenAI]:
+# Общие HTTP-клиенты и лимиты параллелизма по провайдерам
+REQUEST_TIMEOUT = float(os.getenv("AGENT_REQUEST_TIMEOUT_S", "30"))
+provider_pool = ProviderPool(
+    max_connections=int(os.getenv("AGENT_HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("AGENT_HTTP_MAX_KEEPALIVE", "20")),
+    timeout=REQUEST_TIMEOUT,
+    stream_timeout=float(os.getenv("AGENT_STREAM_MAX_S", "600")),
+    concurrency={
+        provider.value: int(os.getenv(f"AGENT_MAX_CONCURRENCY_{provider.name}"))
+        for provider in LLMProvider
+        if os.getenv(f"AGENT_MAX_CONCURRENCY_{provider.name}")
+    },
+    default_concurrency=int(os.getenv("AGENT_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("AGENT_MAX_QUEUE", "256")),
+)
+
+# Допуск запросов: token bucket на клиента и крайний срок ожидания слота провайдера
+QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT_S", "10"))
+client_limiter = ClientLimiter(
+    rate=float(os.getenv("AGENT_CLIENT_RATE", "5")),
+    burst=float(os.getenv("AGENT_CLIENT_BURST", "20")),
+)
+
+def admit(request: Request, default_priority: str = "normal", cost: int = 1) -> Ticket:
+    """Проверка лимита клиента и параметры очереди запроса.
+
+    Клиент определяется заголовком ``X-Client-Id`` (иначе по адресу),
+    приоритет - ``X-Priority`` (high, normal, low), ``X-Queue-Timeout-Ms``
+    сокращает допустимое ожидание слота провайдера. ``cost`` - число
+    вопросов к LLM, списываемое с лимита клиента.
+    """
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+    client_limiter.check(client, cost=cost)
+    priority = PRIORITIES.get(request.headers.get("x-priority", default_priority).lower(), PRIORITIES["normal"])
+    timeout = QUEUE_TIMEOUT
+    try:
+        timeout = min(timeout, float(request.headers["x-queue-timeout-ms"]) / 1000)
+    except (KeyError, ValueError):
+        pass
+    return Ticket(priority, timeout)
+
+def rejected_response(e: AdmissionRejected) -> JSONResponse:
+    error_msg = (
+        "Превышен лимит запросов клиента" if e.status_code == 429
+        else "Сервис перегружен, повторите запрос позже"
+    )
+    return JSONResponse({
+        "error": error_msg,
+        "type": type(e).__name__,
+        "metadata": {"status": "rejected", "reason": e.reason, "retry_after": e.retry_after}
+    }, status_code=e.status_code, headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+def init_llm(provider: LLMProvider = LLMProvider.OPENAI):
     """Инициализация LLM с поддержкой разных провайдеров"""
     try:
         if provider == LLMProvider.OPENAI:
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
-                logger.warning("OPENAI_API_KEY не установлен")
+                logger.warning("API ключ не установлен", env="OPENAI_API_KEY")
                 return None
-            return OpenAI(
+            # SDK провайдера импортируется только при первом выборе провайдера
+            from langchain_openai import ChatOpenAI
+            return ChatOpenAI(
                 temperature=0.7,
                 model_name="gpt-4",
                 openai_api_key=api_key,
                 max_retries=3,
-                request_timeout=30
+                request_timeout=REQUEST_TIMEOUT,
+                http_client=provider_pool.sync_client(provider.value),
+                http_async_client=provider_pool.async_client(provider.value)
             )
         elif provider == LLMProvider.ANTHROPIC:
             api_key = os.getenv("ANTHROPIC_API_KEY")
             if not api_key:
-                logger.warning("ANTHROPIC_API_KEY не установлен")
+                logger.warning("API ключ не установлен", env="ANTHROPIC_API_KEY")
                 return None
+            from langchain_anthropic import ChatAnthropic
+            # SDK Anthropic держит собственный пул соединений на экземпляр модели
             return ChatAnthropic(
                 model="claude-3-opus-20240229",
                 temperature=0.7,
                 anthropic_api_key=api_key,
                 max_retries=3,
-                timeout=30
+                timeout=REQUEST_TIMEOUT
             )
         elif provider == LLMProvider.MISTRAL:
             api_key = os.getenv("MISTRAL_API_KEY")
             if not api_key:
-                logger.warning("MISTRAL_API_KEY не установлен")
+                logger.warning("API ключ не установлен", env="MISTRAL_API_KEY")
                 return None
+            client_params = {
+                "base_url": os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai/v1"),
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                    "Authorization": f"Bearer {api_key}"
+                }
+            }
+            from langchain_mistralai import ChatMistralAI
             return ChatMistralAI(
                 model="mistral-large-latest",
                 temperature=0.7,
                 mistral_api_key=api_key,
                 max_retries=3,
-                timeout=30
+                timeout=REQUEST_TIMEOUT,
+                client=provider_pool.sync_client(provider.value, **client_params),
+                async_client=provider_pool.async_client(provider.value, **client_params)
             )
         elif provider == LLMProvider.GROQ:
             api_key = os.getenv("GROQ_API_KEY")
             if not api_key:
-                logger.warning("GROQ_API_KEY не установлен")
+                logger.warning("API ключ не установлен", env="GROQ_API_KEY")
                 return None
+            from langchain_groq import ChatGroq
             return ChatGroq(
                 model="mixtral-8x7b-32768",
                 temperature=0.7,
                 groq_api_key=api_key,
                 max_retries=3,
-                timeout=30
+                timeout=REQUEST_TIMEOUT,
+                http_client=provider_pool.sync_client(provider.value),
+                http_async_client=provider_pool.async_client(provider.value)
             )
+        elif provider == LLMProvider.FAKE:
+            from fake_llm import ReplayChatModel
+            params = {
+                "first_token_latency": float(os.getenv("AGENT_FAKE_FIRST_TOKEN_MS", "200")) / 1000,
+                "token_latency": float(os.getenv("AGENT_FAKE_TOKEN_MS", "20")) / 1000,
+            }
+            path = os.getenv("AGENT_FAKE_RECORDINGS")
+            return ReplayChatModel.from_file(path, **params) if path else ReplayChatModel(**params)
     except Exception as e:
-        logger.error(f"Ошибка инициализации {provider.value}: {str(e)}")
+        logger.error("Ошибка инициализации провайдера", provider=provider.value, error=str(e))
         return None
 
-llm = init_llm()
-memory = ConversationBufferMemory()
-conversation = ConversationChain(llm=llm, memory=memory) if llm else None
+def init_providers() -> dict:
+    """Провайдеры с API-ключами; LLM_PROVIDER задает предпочтительный порядок.
+
+    Модели создаются лениво при первом выборе провайдера роутером, поэтому
+    SDK ненужных провайдеров не загружаются и старт сервиса не ждет импортов.
+    """
+    preferred = os.getenv("LLM_PROVIDER", LLMProvider.OPENAI.value)
+    if preferred == LLMProvider.FAKE.value:
+        # Офлайн-режим: настоящие провайдеры не используются, даже если ключи заданы
+        return {preferred: LazyModel(lambda: init_llm(LLMProvider.FAKE))}
+    providers = {}
+    for provider in sorted(LLMProvider, key=lambda provider: provider.value != preferred):
+        if provider == LLMProvider.FAKE:
+            continue
+        env = f"{provider.name}_API_KEY"
+        if not os.getenv(env):
+            logger.warning("API ключ не установлен", env=env)
+            continue
+        providers[provider.value] = LazyModel(lambda provider=provider: load_provider(provider))
+    return providers
+
+# Запись ответов настоящих провайдеров для последующего воспроизведения (LLM_PROVIDER=fake)
+RECORD_PATH = os.getenv("AGENT_RECORD_LLM")
+
+def load_provider(provider: LLMProvider):
+    model = init_llm(provider)
+    if model is not None and RECORD_PATH:
+        from fake_llm import RecordingModel
+        model = RecordingModel(model, RECORD_PATH)
+    return model
+
+# Маршрутизация между провайдерами: самый быстрый здоровый, переключение при ошибках
+router = LLMRouter(
+    init_providers(),
+    provider_pool,
+    window=int(os.getenv("AGENT_ROUTER_WINDOW", "100")),
+    max_error_rate=float(os.getenv("AGENT_ROUTER_MAX_ERROR_RATE", "0.5")),
+    failure_threshold=int(os.getenv("AGENT_ROUTER_FAILURE_THRESHOLD", "3")),
+    cooldown=float(os.getenv("AGENT_ROUTER_COOLDOWN_S", "30")),
+    error_window=float(os.getenv("AGENT_ROUTER_ERROR_WINDOW_S", "60")),
+    hedge=os.getenv("AGENT_HEDGE_REQUESTS", "false").lower() == "true",
+    hedge_min_samples=int(os.getenv("AGENT_HEDGE_MIN_SAMPLES", "20")),
+)
+
+def model_name(model) -> str:
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+SUMMARY_PROMPT = """Кратко перескажи диалог, сохранив факты, важные для продолжения разговора.
+
+Текущее резюме:
+{summary}
+
+Новые реплики:
+{dialog}
+
+Обновленное резюме:"""
+
+async def summarize_history(summary: str, messages) -> str:
+    """Сворачивание старых реплик в резюме через маршрутизатор: пул, таймауты и переключение провайдеров"""
+    prompt = SUMMARY_PROMPT.format(summary=summary or "-", dialog=get_buffer_string(messages))
+    # Резюме - фоновая работа: в очереди пула уступает запросам пользователей
+    result, _ = await router.ainvoke(lambda llm: [HumanMessage(content=prompt)],
+                                     Ticket(PRIORITIES["low"], QUEUE_TIMEOUT))
+    return token_text(result).strip()
+
+# Память диалогов: отдельная ограниченная история для каждой сессии
+MEMORY_STRATEGY = os.getenv("AGENT_MEMORY_STRATEGY", "window")
+SESSION_DB_PATH = os.getenv("AGENT_SESSION_DB")
+sessions = SessionStore(
+    strategy=MEMORY_STRATEGY,
+    max_turns=int(os.getenv("AGENT_MEMORY_MAX_TURNS", "10")),
+    token_budget=int(os.getenv("AGENT_MEMORY_TOKEN_BUDGET", "2000")),
+    max_sessions=int(os.getenv("AGENT_MAX_SESSIONS", "1000")),
+    idle_ttl=float(os.getenv("AGENT_SESSION_TTL_S", "3600")),
+    backend=SQLiteSessionBackend(SESSION_DB_PATH) if SESSION_DB_PATH else None,
+    summarizer=summarize_history if MEMORY_STRATEGY == "summary" else None,
+)
+
+def new_session_id(session_id: Optional[str]) -> str:
+    """Без ``session_id`` запрос получает собственную новую сессию, а не общую историю"""
+    return session_id or uuid.uuid4().hex
+
+async def get_session(session_id: str):
+    """Память сессии; загрузка из SQLite выполняется в пуле потоков"""
+    if sessions.backend:
+        return await asyncio.to_thread(sessions.get, session_id)
+    return sessions.get(session_id)
+
+# Семантический кэш ответов на локальных эмбеддингах sentence-transformers
+semantic_cache = SemanticCache(
+    sentence_transformer_embedder(os.getenv("AGENT_SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")),
+    threshold=float(os.getenv("AGENT_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("AGENT_SEMANTIC_CACHE_TTL_S", "3600")),
+    max_entries=int(os.getenv("AGENT_SEMANTIC_CACHE_SIZE", "1000")),
+    path=os.getenv("AGENT_SEMANTIC_CACHE_PATH"),
+) if os.getenv("AGENT_SEMANTIC_CACHE", "false").lower() == "true" else None
+
+async def cached_answer(memory, message: str):
+    """Ответ из семантического кэша и ключ для записи нового ответа (эмбеддинг, контекст).
+
+    Ответ с историей зависит от контекста диалога, поэтому записи ищутся
+    только среди сохраненных при той же истории; у вопроса без истории
+    контекст пустой и общий для всех сессий.
+    """
+    if semantic_cache is None:
+        return None, None
+    context = context_key(*memory.snapshot()) if memory is not None else ""
+    try:
+        vector = await asyncio.to_thread(semantic_cache.encode, message)
+    except Exception as e:
+        logger.warning("Семантический кэш недоступен", error=str(e))
+        return None, None
+    return semantic_cache.lookup(message, vector, context), (vector, context)
+
+def remember_answer(message: str, response: str, cache_key):
+    if cache_key is not None and response:
+        vector, context = cache_key
+        semantic_cache.add(message, response, vector, context)
+
+# Одинаковые одновременные вопросы с одинаковым контекстом сессии разделяют один вызов LLM
+single_flight = SingleFlight() if os.getenv("AGENT_COALESCE_REQUESTS", "true").lower() == "true" else None
+
+async def ask_llm(memory, message: str, ticket: Optional[Ticket] = None):
+    """Ответ роутера ((результат, провайдер), присоединился ли запрос к уже идущему)"""
+    def call():
+        return router.ainvoke(lambda llm: build_messages(memory, message, llm), ticket)
+
+    if single_flight is None:
+        return await call(), False
+    summary, history = memory.snapshot() if memory is not None else ("", [])
+    return await single_flight.run(request_key(message, summary, history), call)
 
 @app.get("/health")
 async def health_check():
@@ -102,10 +338,10 @@ async def health_check():
         "groq": bool(os.getenv("GROQ_API_KEY"))
     }
     
-    active_provider = os.getenv("LLM_PROVIDER", "openai")
+    active_provider, _ = router.primary()
     return {
-        "status": "ok" if llm else "degraded",
-        "llm_ready": bool(llm),
+        "status": "ok" if router.providers else "degraded",
+        "llm_ready": bool(router.providers),
         "active_provider": active_provider,
         "providers_status": providers_status,
         "dependencies": {
@@ -116,6 +352,12 @@ async def health_check():
             "langchain": True,
             "fastapi": True
         },
+        "sessions": sessions.stats(),
+        "provider_pool": provider_pool.stats(),
+        "router": router.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "coalescing": single_flight.stats() if single_flight else None,
+        "admission": {**client_limiter.stats(), "queue_timeout_s": QUEUE_TIMEOUT},
         "sandbox": {
             "timeout_ms": int(os.getenv("E2B_TIMEOUT_MS", 300000)),
             "remaining_ms": "N/A"
@@ -123,11 +365,32 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+# Прогрев основного провайдера после старта: /health доступен, не дожидаясь импорта SDK
+WARMUP_PROVIDER = os.getenv("AGENT_WARMUP_PROVIDER", "true").lower() == "true"
+warmup_task = None
+
+async def warm_up_provider():
+    try:
+        await router.warm_up()
+    except Exception as e:
+        logger.warning("Не удалось прогреть провайдера", error=str(e))
+
+@app.on_event("startup")
+async def startup_event():
+    global warmup_task
+    if WARMUP_PROVIDER:
+        warmup_task = asyncio.create_task(warm_up_provider())
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Обработчик завершения работы sandbox"""
     logger.info("Инициировано завершение работы sandbox")
-    # Логика очистки при необходимости
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    await provider_pool.aclose()
+    dashboard.close()
+    if semantic_cache:
+        semantic_cache.save()
 
 # Системный промпт для ИИ-агента
 SYSTEM_PROMPT = """Ты - профессиональный ИИ-ассистент. Следуй правилам:
@@ -159,61 +422,366 @@ print(response.json())
 \"\"\"
 """
 
+def build_messages(memory, message: str, llm=None) -> list:
+    """Сообщения для модели: системный промпт один раз в начале, затем история сессии и вопрос.
+
+    Без ``memory`` (пакетные запросы) вопрос отправляется без истории.
+    """
+    summary, history = memory.snapshot() if memory is not None else ("", [])
+    summary_text = f"Краткое содержание предыдущего диалога: {summary}" if summary else None
+    if type(getattr(llm, "wrapped", llm)).__name__ == "ChatAnthropic":
+        # Неизменный системный промпт помечается для prompt caching Anthropic
+        content = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+        if summary_text:
+            content.append({"type": "text", "text": summary_text})
+        system = SystemMessage(content=content)
+    else:
+        # Остальные провайдеры кэшируют совпадающий префикс автоматически
+        system = SystemMessage(content=f"{SYSTEM_PROMPT}\n\n{summary_text}" if summary_text else SYSTEM_PROMPT)
+    return [system, *history, HumanMessage(content=message)]
+
+def token_usage(message) -> dict:
+    """Расход токенов по ответу провайдера, включая чтение и запись кэша промпта"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    raw = (getattr(message, "response_metadata", None) or {}).get("usage") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "cache_read_tokens": raw.get("cache_read_input_tokens") or 0,
+        "cache_creation_tokens": raw.get("cache_creation_input_tokens") or 0
+    }
+
 @app.post("/chat")
-async def chat(message: str):
+async def chat(message: str, request: Request, session_id: Optional[str] = None):
     """Основной endpoint для взаимодействия с агентом"""
-    if not conversation:
+    session_id = new_session_id(session_id)
+    if not router.providers:
         error_msg = "Сервис LLM недоступен. Проверьте API ключ и логи."
-        logger.error(error_msg)
-        return {"error": error_msg}, 503
+        logger.error("Нет доступных провайдеров LLM")
+        return JSONResponse({"error": error_msg}, status_code=503)
+    try:
+        ticket = admit(request)
+    except AdmissionRejected as e:
+        logger.warning("Запрос отклонен", session_id=session_id, reason=e.reason)
+        return rejected_response(e)
         
+    memory = await get_session(session_id)
     start_time = datetime.now()
-    logger.info(f"\n{'='*40}\n📩 Входящий запрос: {message}\n{'='*40}")
     
     try:
-        # Логируем системный промпт
-        logger.info(f"\n📝 Системный промпт:\n{SYSTEM_PROMPT}\n{'-'*40}")
-        
-        # Добавляем системный промпт к сообщению
-        full_message = f"{SYSTEM_PROMPT}\n\nВопрос: {message}"
-        logger.info(f"\n💭 Полный промпт для ИИ:\n{full_message}\n{'-'*40}")
-        
-        # Получаем ответ от ИИ
-        response = conversation.predict(input=full_message)
-        logger.info(f"\n🤖 Ответ ИИ (сырой):\n{response}\n{'-'*40}")
+        hit, cache_key = await cached_answer(memory, message)
+        if hit:
+            response, similarity = hit
+            await memory.asave_context({"input": message}, {"response": response})
+            exec_time = (datetime.now() - start_time).total_seconds()
+            logger.info("Ответ из семантического кэша", session_id=session_id, similarity=round(similarity, 3),
+                        processing_time=exec_time, **content_fields(message=message, response=response))
+            dashboard.update_stats(True, exec_time, "cache")
+            return {
+                "response": response,
+                "metadata": {
+                    "processing_time": exec_time,
+                    "cached": True,
+                    "similarity": similarity,
+                    "session_id": session_id,
+                    "history_tokens": memory.token_count,
+                    "status": "success"
+                }
+            }
         
-        # Очистка ответа
-        clean_response = response.replace(SYSTEM_PROMPT, "").strip()
-        logger.info(f"\n✨ Очищенный ответ:\n{clean_response}\n{'-'*40}")
+        # Системный промпт идет отдельным system-сообщением, а не внутри каждого вопроса.
+        # Роутер выбирает провайдера и переключается на следующий при ошибке
+        (result, provider), coalesced = await ask_llm(memory, message, ticket)
+        response = token_text(result).strip()
+        # Резюмирование истории и запись в SQLite выполняются вне event loop
+        await memory.asave_context({"input": message}, {"response": response})
+        if not coalesced:
+            remember_answer(message, response, cache_key)
         
-        # Логируем время выполнения
+        # Одна запись на запрос; тексты попадают в лог только для выборки
         exec_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"⏱ Время выполнения: {exec_time:.2f} сек\n{'='*40}\n")
+        usage = token_usage(result)
+        logger.info("Запрос обработан", session_id=session_id, provider=provider, processing_time=exec_time,
+                    queue_wait=ticket.queue_wait, coalesced=coalesced, history_tokens=memory.token_count, **usage,
+                    **content_fields(message=message, response=response))
         
-        # Обновляем дашборд
-        dashboard.update_stats(True, exec_time)
+        # Обновляем дашборд; токены общего вызова учитываются один раз
+        dashboard.update_stats(True, exec_time, provider)
+        if not coalesced:
+            dashboard.record_usage(usage)
         return {
-            "response": clean_response,
+            "response": response,
             "metadata": {
                 "processing_time": exec_time,
-                "model": "gpt-4" if llm else "none",
+                "provider": provider,
+                "model": model_name(router.model(provider)),
+                "cached": False,
+                "coalesced": coalesced,
+                # Ожидание слота провайдера отдельно от времени ответа LLM
+                "queue_wait": ticket.queue_wait,
+                "llm_time": exec_time - ticket.queue_wait,
+                "session_id": session_id,
+                "history_tokens": memory.token_count,
+                "usage": usage,
                 "status": "success"
             }
         }
+    except AdmissionRejected as e:
+        logger.warning("Запрос не дождался слота провайдера", session_id=session_id, reason=e.reason,
+                       queue_wait=ticket.queue_wait)
+        return rejected_response(e)
     except Exception as e:
-        error_msg = f"Ошибка обработки запроса: {str(e)}"
-        logger.error(f"\n❌ Ошибка:\n{error_msg}\nТип: {type(e).__name__}\n{'='*40}")
+        timed_out = isinstance(e, asyncio.TimeoutError)
+        error_msg = (
+            f"Превышен таймаут ответа LLM ({REQUEST_TIMEOUT:.0f} сек)" if timed_out
+            else f"Ошибка обработки запроса: {str(e)}"
+        )
+        logger.error("Ошибка обработки запроса", session_id=session_id, error=str(e), error_type=type(e).__name__,
+                     timed_out=timed_out, **content_fields(message=message))
         # Обновляем дашборд при ошибке
-        dashboard.update_stats(False, 0)
-        return {
+        dashboard.update_stats(False, (datetime.now() - start_time).total_seconds())
+        return JSONResponse({
             "error": error_msg,
             "type": type(e).__name__,
             "metadata": {
                 "status": "error",
-                "model": "gpt-4" if llm else "none"
+                "providers": list(router.providers)
+            }
+        }, status_code=504 if timed_out else 500)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def token_text(chunk) -> str:
+    """Текст токена: чат-модели отдают AIMessageChunk, обычные LLM - строки"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, list):
+        # Anthropic может отдавать content блоками
+        return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+    return content or ""
+
+def stream_event(event: str, data: dict, ndjson: bool) -> str:
+    """Кодирование события потока в SSE или NDJSON"""
+    if ndjson:
+        return json.dumps({"type": event, **data}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(message: str, request: Request, session_id: Optional[str] = None):
+    """Потоковый endpoint: токены провайдера отправляются по мере генерации (SSE или NDJSON)"""
+    session_id = new_session_id(session_id)
+    if not router.providers:
+        error_msg = "Сервис LLM недоступен. Проверьте API ключ и логи."
+        logger.error("Нет доступных провайдеров LLM")
+        return JSONResponse({"error": error_msg}, status_code=503)
+    
+    try:
+        ticket = admit(request)
+    except AdmissionRejected as e:
+        logger.warning("Запрос отклонен", session_id=session_id, reason=e.reason)
+        return rejected_response(e)
+    
+    ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    memory = await get_session(session_id)
+    
+    async def generate():
+        started = time.perf_counter()
+        ttft = None
+        parts = []
+        aggregate = None
+        provider = None
+        try:
+            hit, cache_key = await cached_answer(memory, message)
+            if hit:
+                response, similarity = hit
+                yield stream_event("token", {"content": response}, ndjson)
+                await memory.asave_context({"input": message}, {"response": response})
+                exec_time = time.perf_counter() - started
+                dashboard.update_stats(True, exec_time, "cache")
+                yield stream_event("done", {
+                    "metadata": {
+                        "processing_time": exec_time,
+                        "time_to_first_token": exec_time,
+                        "cached": True,
+                        "similarity": similarity,
+                        "session_id": session_id,
+                        "history_tokens": memory.token_count,
+                        "status": "success"
+                    }
+                }, ndjson)
+                return
+            
+            chunks = router.astream(lambda llm: build_messages(memory, message, llm), ticket)
+            async for provider, chunk in chunks:
+                if isinstance(chunk, BaseMessageChunk):
+                    # Сумма чанков несет итоговый usage_metadata
+                    aggregate = chunk if aggregate is None else aggregate + chunk
+                text = token_text(chunk)
+                if not text:
+                    continue
+                if ttft is None:
+                    # Время до первого токена - отдельная метрика
+                    ttft = time.perf_counter() - started
+                    dashboard.record_ttft(ttft)
+                parts.append(text)
+                yield stream_event("token", {"content": text}, ndjson)
+            
+            response = "".join(parts)
+            await memory.asave_context({"input": message}, {"response": response})
+            remember_answer(message, response, cache_key)
+            exec_time = time.perf_counter() - started
+            usage = token_usage(aggregate)
+            logger.info("Потоковый запрос обработан", session_id=session_id, provider=provider, ttft=ttft,
+                        processing_time=exec_time, queue_wait=ticket.queue_wait, **usage, **content_fields(message=message, response=response))
+            dashboard.update_stats(True, exec_time, provider)
+            dashboard.record_usage(usage)
+            yield stream_event("done", {
+                "metadata": {
+                    "processing_time": exec_time,
+                    "time_to_first_token": ttft,
+                    "queue_wait": ticket.queue_wait,
+                    "provider": provider,
+                    "model": model_name(router.model(provider)) if provider else None,
+                    "cached": False,
+                    "session_id": session_id,
+                    "history_tokens": memory.token_count,
+                    "usage": usage,
+                    "status": "success"
+                }
+            }, ndjson)
+        except Exception as e:
+            error_msg = f"Ошибка обработки запроса: {str(e)}"
+            logger.error("Ошибка потока", session_id=session_id, error=str(e), error_type=type(e).__name__,
+                         **content_fields(message=message))
+            dashboard.update_stats(False, time.perf_counter() - started, provider)
+            error = {"error": error_msg, "error_type": type(e).__name__}
+            if isinstance(e, AdmissionRejected):
+                # Заголовки уже отправлены: отказ по очереди приходит событием с кодом
+                error.update(status_code=e.status_code, reason=e.reason, retry_after=e.retry_after)
+            yield stream_event("error", error, ndjson)
+    
+    return StreamingResponse(
+        generate(),
+        media_type=NDJSON_MEDIA_TYPE if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id}
+    )
+
+# Пакетная обработка: независимые вопросы без истории сессии
+BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "8"))
+
+class BatchRequest(BaseModel):
+    prompts: List[str]
+    concurrency: Optional[int] = None
+
+def batch_error(index: int, e: Exception, exec_time: float) -> dict:
+    error = {"index": index, "error": str(e), "error_type": type(e).__name__, "processing_time": exec_time}
+    if isinstance(e, AdmissionRejected):
+        error.update(status_code=e.status_code, reason=e.reason)
+    return error
+
+@app.post("/chat/batch")
+async def chat_batch(batch: BatchRequest, request: Request):
+    """Пакет вопросов через роутер с ограничением параллелизма, результаты в NDJSON по мере готовности.
+
+    Ошибка одного вопроса приходит событием ``error`` с его индексом и не
+    прерывает остальные; итоговое событие ``done`` содержит сводку.
+    """
+    if not router.providers:
+        error_msg = "Сервис LLM недоступен. Проверьте API ключ и логи."
+        logger.error("Нет доступных провайдеров LLM")
+        return JSONResponse({"error": error_msg}, status_code=503)
+    if len(batch.prompts) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"В пакете больше {BATCH_MAX_ITEMS} вопросов"}, status_code=400)
+    if client_limiter.rate > 0 and len(batch.prompts) > client_limiter.burst:
+        # Такой пакет не уложится в лимит клиента никогда, а не только сейчас
+        return JSONResponse({"error": f"В пакете больше {client_limiter.burst:g} вопросов - лимита клиента"},
+                            status_code=400)
+    try:
+        # Каждый вопрос списывается с лимита клиента, как отдельный запрос;
+        # пакетные задания по умолчанию уступают слоты интерактивным запросам
+        ticket = admit(request, default_priority="low", cost=len(batch.prompts))
+    except AdmissionRejected as e:
+        logger.warning("Пакет отклонен", reason=e.reason)
+        return rejected_response(e)
+    
+    concurrency = max(1, min(batch.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    
+    async def answer(index: int, prompt: str):
+        async with semaphore:
+            item_started = time.perf_counter()
+            # Срок ожидания слота провайдера отсчитывается от запуска вопроса, а не пакета
+            item_ticket = Ticket(ticket.priority, QUEUE_TIMEOUT)
+            try:
+                hit, cache_key = await cached_answer(None, prompt)
+                if hit:
+                    exec_time = time.perf_counter() - item_started
+                    dashboard.update_stats(True, exec_time, "cache")
+                    return "result", {"index": index, "response": hit[0], "cached": True, "processing_time": exec_time}
+                (result, provider), coalesced = await ask_llm(None, prompt, item_ticket)
+                response = token_text(result).strip()
+                if not coalesced:
+                    remember_answer(prompt, response, cache_key)
+                exec_time = time.perf_counter() - item_started
+                usage = token_usage(result)
+                dashboard.update_stats(True, exec_time, provider)
+                if not coalesced:
+                    dashboard.record_usage(usage)
+                return "result", {
+                    "index": index,
+                    "response": response,
+                    "provider": provider,
+                    "cached": False,
+                    "coalesced": coalesced,
+                    "processing_time": exec_time,
+                    "queue_wait": item_ticket.queue_wait,
+                    "usage": usage
+                }
+            except Exception as e:
+                exec_time = time.perf_counter() - item_started
+                dashboard.update_stats(False, exec_time)
+                return "error", batch_error(index, e, exec_time)
+    
+    async def fan_out():
+        tasks = [asyncio.ensure_future(answer(index, prompt)) for index, prompt in enumerate(batch.prompts)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # Клиент отключился - оставшиеся вопросы не нужны
+            for task in tasks:
+                task.cancel()
+    
+    async def generate():
+        counts = {"result": 0, "error": 0}
+        async for event, item in fan_out():
+            counts[event] += 1
+            yield stream_event(event, item, True)
+        
+        exec_time = time.perf_counter() - started
+        logger.info("Пакет обработан", items=len(batch.prompts), succeeded=counts["result"], failed=counts["error"],
+                    concurrency=concurrency, processing_time=exec_time)
+        yield stream_event("done", {
+            "metadata": {
+                "items": len(batch.prompts),
+                "succeeded": counts["result"],
+                "failed": counts["error"],
+                "concurrency": concurrency,
+                "processing_time": exec_time,
+                "status": "success" if not counts["error"] else "partial"
             }
-        }, 500
+        }, True)
+    
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Сброс истории сессии"""
+    sessions.delete(session_id)
+    return {"session_id": session_id, "status": "deleted"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
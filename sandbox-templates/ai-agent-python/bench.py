@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from metrics import percentiles
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MESSAGES = [
+    "Как прочитать CSV в pandas?",
+    "Объясни разницу между списком и кортежем в Python",
+    "Напиши функцию сортировки пузырьком",
+    "Как настроить логирование в FastAPI?",
+]
+# Локальный агент с офлайн-провайдером: без ключей, лимитов клиента и канала метрик
+OFFLINE_ENV = {
+    "LLM_PROVIDER": "fake",
+    "AGENT_CLIENT_RATE": "0",
+    "AGENT_METRICS_CHANNEL": "",
+    "AGENT_LOG_LEVEL": "WARNING",
+}
+
+
+@contextmanager
+def local_agent(port: int, env: Optional[Dict[str, str]] = None, timeout: float = 60.0):
+    """Запустить агента в uvicorn на ``port`` и дождаться ответа /health"""
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "agent:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env={**os.environ, **OFFLINE_ENV, **(env or {})},
+    )
+    try:
+        started = time.perf_counter()
+        while True:
+            try:
+                if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None or time.perf_counter() - started > timeout:
+                raise RuntimeError("Агент не запустился")
+            time.sleep(0.05)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def chat_once(http: httpx.AsyncClient, message: str, session_id: str, stream: bool) -> Dict[str, Any]:
+    """Один запрос: задержка, время до первого токена и статус"""
+    params = {"message": message, "session_id": session_id}
+    started = time.perf_counter()
+    if not stream:
+        response = await http.post("/chat", params=params)
+        latency = time.perf_counter() - started
+        metadata = response.json().get("metadata", {}) if response.status_code < 500 else {}
+        return {"status": response.status_code, "ok": response.status_code == 200, "latency": latency,
+                "ttft": latency, "queue_wait": metadata.get("queue_wait")}
+
+    ttft = None
+    ok = False
+    async with http.stream("POST", "/chat/stream", params=params,
+                           headers={"Accept": "application/x-ndjson"}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "token" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif event["type"] == "done":
+                ok = True
+            elif event["type"] == "error":
+                ok = False
+    return {"status": response.status_code, "ok": ok and response.status_code == 200,
+            "latency": time.perf_counter() - started, "ttft": ttft, "queue_wait": None}
+
+
+async def run_benchmark(url: str, requests: int = 200, concurrency: int = 10, stream: bool = False,
+                        messages: Optional[List[str]] = None, distinct: bool = True,
+                        warmup: int = 5) -> Dict[str, Any]:
+    """Нагрузка ``requests`` запросами с ``concurrency`` одновременными клиентами"""
+    messages = messages or DEFAULT_MESSAGES
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120.0) as http:
+        for index in range(warmup):
+            await chat_once(http, messages[index % len(messages)], f"bench-warmup-{index}", stream)
+
+        counter = itertools.count()
+        results = []
+
+        async def client():
+            while (index := next(counter)) < requests:
+                message = messages[index % len(messages)]
+                if distinct:
+                    # Уникальный вопрос: объединение одинаковых запросов не искажает замер
+                    message = f"{message} #{index}"
+                try:
+                    results.append(await chat_once(http, message, f"bench-{index}", stream))
+                except httpx.HTTPError as e:
+                    results.append({"status": type(e).__name__, "ok": False, "latency": None, "ttft": None,
+                                    "queue_wait": None})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+
+    def summary(key: str) -> Dict[str, Optional[float]]:
+        values = np.array([result[key] for result in results if result["ok"] and result[key] is not None])
+        return {**percentiles(values, (0.5, 0.95, 0.99)), "mean": float(values.mean()) if len(values) else None}
+
+    succeeded = sum(result["ok"] for result in results)
+    return {
+        "endpoint": "/chat/stream" if stream else "/chat",
+        "requests": len(results),
+        "concurrency": concurrency,
+        "succeeded": succeeded,
+        "errors": len(results) - succeeded,
+        "statuses": dict(Counter(str(result["status"]) for result in results)),
+        "duration_s": duration,
+        "throughput_rps": succeeded / duration if duration else 0.0,
+        "latency": summary("latency"),
+        "ttft": summary("ttft"),
+        "queue_wait": summary("queue_wait"),
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    def ms(value: Optional[float]) -> str:
+        return f"{value * 1000:.1f}" if value is not None else "-"
+
+    lines = [
+        f"{report['endpoint']}: {report['requests']} запросов, {report['concurrency']} одновременно, "
+        f"{report['duration_s']:.2f} сек",
+        f"  Успешно: {report['succeeded']}, ошибок: {report['errors']} {report['statuses']}",
+        f"  Пропускная способность: {report['throughput_rps']:.1f} запр/сек",
+    ]
+    for key, title in (("latency", "Задержка"), ("ttft", "Первый токен")):
+        stats = report[key]
+        lines.append(f"  {title}, мс: p50 {ms(stats['p50'])}  p95 {ms(stats['p95'])}  p99 {ms(stats['p99'])}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк агента на записанных ответах")
+    parser.add_argument("--url", help="Адрес запущенного агента; по умолчанию агент запускается локально с LLM_PROVIDER=fake")
+    parser.add_argument("--port", type=int, default=8766, help="Порт локального агента")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="Нагружать /chat/stream вместо /chat")
+    parser.add_argument("--recordings", help="Файл записей JSON lines для офлайн-провайдера")
+    parser.add_argument("--first-token-ms", type=float, default=200, help="Задержка первого токена офлайн-провайдера")
+    parser.add_argument("--token-ms", type=float, default=20, help="Задержка каждого следующего токена")
+    parser.add_argument("--same-messages", action="store_true", help="Повторять вопросы без уникального суффикса")
+    parser.add_argument("--output", help="Куда сохранить отчет в JSON")
+    args = parser.parse_args(argv)
+
+    options = dict(requests=args.requests, concurrency=args.concurrency, stream=args.stream,
+                   distinct=not args.same_messages)
+    if args.url:
+        report = asyncio.run(run_benchmark(args.url, **options))
+    else:
+        env = {"AGENT_FAKE_FIRST_TOKEN_MS": str(args.first_token_ms), "AGENT_FAKE_TOKEN_MS": str(args.token_ms)}
+        if args.recordings:
+            env["AGENT_FAKE_RECORDINGS"] = os.path.abspath(args.recordings)
+        with local_agent(args.port, env) as url:
+            report = asyncio.run(run_benchmark(url, **options))
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0 if report["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+def normalize_prompt(text: str) -> str:
+    """Вопрос без различий в регистре и пробелах"""
+    return " ".join(text.split()).casefold()
+
+
+def request_key(message: str, summary: str, history: List[Any]) -> str:
+    """Ключ запроса: нормализованный вопрос и контекст сессии (резюме и история)"""
+    payload = json.dumps(
+        [normalize_prompt(message), summary, [(item.type, item.content) for item in history]],
+        ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def context_key(summary: str, history: List[Any]) -> str:
+    """Отпечаток контекста сессии; пустой контекст - пустая строка"""
+    if not summary and not history:
+        return ""
+    payload = json.dumps([summary, [(item.type, item.content) for item in history]], ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов в один вызов.
+
+    Первый запрос с ключом запускает вызов отдельной задачей, остальные
+    ждут ее результата (или ошибки). Отмена одного из ожидающих, например
+    при разрыве соединения клиентом, не прерывает общий вызов. Ключ
+    освобождается сразу после завершения: результат не кэшируется.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Результат вызова и признак, что запрос присоединился к уже идущему"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Ошибка считается полученной, даже если все ожидающие были отменены
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / requests if requests else 0.0,
+        }
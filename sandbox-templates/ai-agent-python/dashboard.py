@@ -1,104 +1,274 @@
-from rich.console import Console
-from rich.layout import Layout
-from rich.panel import Panel
-from rich.table import Table
-from rich.live import Live
-from rich.text import Text
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, TextIO
+import json
+import logging
+import os
+import sys
 import time
 from datetime import datetime
+from metrics import LOG_LINES, WINDOW, LogRing, MetricsChannel, WorkerMetrics, aggregate, merged_logs
+
+if TYPE_CHECKING:
+    from rich.layout import Layout
+
+# Служебные поля structlog, не показываемые в панели логов
+LOG_SERVICE_FIELDS = ("event", "logger", "level", "timestamp")
+
+
+class DashboardLogHandler(logging.Handler):
+    """Записи логгера агента в кольце строк ``WorkerMetrics.logs``.
+
+    Строка собирается при записи и копируется в кольцо фиксированного
+    размера; с каналом метрик кольцо лежит в общей памяти, и панель логов
+    отдельного процесса dashboard.py показывает записи всех воркеров.
+    """
+
+    def __init__(self, ring: LogRing, level: int = logging.INFO):
+        super().__init__(level)
+        self.ring = ring
+
+    def emit(self, record: logging.LogRecord):
+        self.ring.record(record.created, self.render(record))
+
+    @staticmethod
+    def render(record: logging.LogRecord, width: int = 200) -> str:
+        if isinstance(record.msg, dict):
+            # Событие structlog: текст события и его поля
+            fields = " ".join(
+                f"{key}={value}" for key, value in record.msg.items() if key not in LOG_SERVICE_FIELDS
+            )
+            message = f"{record.msg.get('event', '')} {fields}".strip()
+        else:
+            message = record.getMessage()
+        line = f"[{time.strftime('%H:%M:%S', time.localtime(record.created))}] {record.levelname} {message}"
+        return line[:width]
+
+
+def format_percentiles(values: Dict[str, Optional[float]]) -> str:
+    if values.get("p50") is None:
+        return "N/A"
+    return f"{values['p50']:.2f} / {values['p95']:.2f} / {values['p99']:.2f} сек"
 
 
 class AgentDashboard:
     """Интерактивный дашборд для мониторинга работы ИИ-агента"""
     
-    def __init__(self):
-        self.console = Console()
-        self.layout = Layout()
-        self.stats = {
-            "total_requests": 0,
-            "successful": 0,
-            "errors": 0,
-            "avg_response_time": 0,
-            "last_request": None
-        }
-        
-        # Настройка layout
-        self.layout.split(
-            Layout(name="header", size=3),
-            Layout(name="main", ratio=1),
-            Layout(name="footer", size=7)
-        )
-        
-        self.layout["main"].split_row(
-            Layout(name="requests", ratio=2),
-            Layout(name="logs", ratio=3)
-        )
-        
-    def update_stats(self, success: bool, exec_time: float):
-        """Обновление статистики"""
-        self.stats["total_requests"] += 1
-        if success:
-            self.stats["successful"] += 1
+    def __init__(self, window: int = WINDOW, log_lines: int = LOG_LINES,
+                 channel: Optional[MetricsChannel] = None, publish: bool = True):
+        # Память фиксирована: кольцевые буферы задержек и посекундные счетчики.
+        # С каналом метрики пишутся в общую память и видны процессу дашборда;
+        # publish=False - только чтение сводки всех воркеров
+        self.channel = channel
+        if channel is None:
+            self.metrics = WorkerMetrics.local(window)
         else:
-            self.stats["errors"] += 1
+            self.metrics = channel.publisher() if publish else None
+        self.log_lines = log_lines
+        self.log_handler = DashboardLogHandler(self.metrics.logs) if self.metrics is not None else None
+        # Версии данных, по которым отрисованы регионы; регион перерисовывается при их изменении
+        self.rendered: Dict[str, Any] = {}
+        # rich загружается при первой отрисовке: воркеру агента нужны только метрики
+        self._layout = None
+    
+    @property
+    def layout(self) -> "Layout":
+        if self._layout is None:
+            from rich.layout import Layout
             
-        # Обновляем среднее время выполнения
-        prev_avg = self.stats["avg_response_time"]
-        new_count = self.stats["successful"] + self.stats["errors"]
-        self.stats["avg_response_time"] = (
-            (prev_avg * (new_count - 1) + exec_time) / new_count
-        )
+            # Настройка layout
+            layout = Layout()
+            layout.split(
+                Layout(name="header", size=3),
+                Layout(name="main", ratio=1),
+                Layout(name="footer", size=7)
+            )
+            
+            layout["main"].split_row(
+                Layout(name="requests", ratio=2),
+                Layout(name="logs", ratio=3)
+            )
+            self._layout = layout
+        return self._layout
         
-        self.stats["last_request"] = datetime.now().strftime("%H:%M:%S")
+    def attach_logs(self, logger: Optional[logging.Logger] = None):
+        """Показывать в панели логов реальные записи логгера (по умолчанию корневого)"""
+        if self.log_handler is not None:
+            (logger or logging.getLogger()).addHandler(self.log_handler)
     
-    def generate_layout(self) -> Layout:
-        """Генерация обновленного layout"""
-        # Header
+    def update_stats(self, success: bool, exec_time: float, provider: Optional[str] = None):
+        """Обновление статистики; время учитывается только для успешных запросов"""
+        self.metrics.record_request(success, exec_time, provider)
+    
+    def record_ttft(self, ttft: float):
+        """Учет времени до первого токена для потоковых ответов"""
+        self.metrics.record_ttft(ttft)
+    
+    def record_usage(self, usage: Dict[str, int]):
+        """Накопление расхода токенов, включая чтение из кэша промпта"""
+        self.metrics.record_usage(usage)
+    
+    def workers(self) -> List[WorkerMetrics]:
+        return self.channel.workers() if self.channel else [self.metrics]
+    
+    def logs(self, workers: Optional[List[WorkerMetrics]] = None) -> List[str]:
+        """Последние строки логов всех воркеров"""
+        return merged_logs(self.workers() if workers is None else workers, self.log_lines)
+    
+    def snapshot(self, workers: Optional[List[WorkerMetrics]] = None) -> Dict[str, Any]:
+        """Текущие метрики: счетчики, перцентили (сек) и RPS за скользящие окна по всем воркерам"""
+        return aggregate(self.workers() if workers is None else workers)
+    
+    @staticmethod
+    def metrics_version(workers: List[WorkerMetrics], now: float) -> tuple:
+        """Версия метрик: счетчики каждого воркера меняются при любой записи"""
+        version = tuple((int(worker.pid[0]), *worker.counters.tolist(), worker.ttft.count) for worker in workers)
+        last_request = max((float(worker.last_request[0]) for worker in workers), default=0.0)
+        # RPS за скользящие окна меняется и без новых запросов, пока окно не опустеет
+        return version, int(now) if now - last_request < 60 else None
+    
+    def close(self):
+        """Освободить слот в канале метрик"""
+        if self.channel and self.metrics:
+            self.channel.release(self.metrics)
+    
+    def render_header(self):
+        from rich.panel import Panel
+        from rich.text import Text
         title = Text("🤖 ИИ-Агент Дашборд", style="bold blue")
         self.layout["header"].update(
             Panel(title, subtitle="Мониторинг в реальном времени")
         )
+    
+    def render_requests(self, snapshot: Dict[str, Any]):
+        from rich.console import Group
+        from rich.panel import Panel
+        from rich.table import Table
         
-        # Requests panel
         requests_table = Table(title="Статистика запросов")
         requests_table.add_column("Метрика")
         requests_table.add_column("Значение", justify="right")
         
-        requests_table.add_row("Всего запросов", str(self.stats["total_requests"]))
-        requests_table.add_row("Успешных", f"[green]{self.stats['successful']}[/green]")
-        requests_table.add_row("Ошибок", f"[red]{self.stats['errors']}[/red]")
-        requests_table.add_row("Среднее время", f"{self.stats['avg_response_time']:.2f} сек")
-        requests_table.add_row("Последний запрос", self.stats["last_request"] or "N/A")
-        
-        self.layout["requests"].update(Panel(requests_table))
+        requests_table.add_row("Воркеров", str(snapshot["workers"]))
+        requests_table.add_row("Всего запросов", str(snapshot["total_requests"]))
+        requests_table.add_row("Успешных", f"[green]{snapshot['successful']}[/green]")
+        requests_table.add_row("Ошибок", f"[red]{snapshot['errors']}[/red]")
+        requests_table.add_row("RPS 10с / 60с", f"{snapshot['rps_10s']:.2f} / {snapshot['rps_60s']:.2f}")
+        requests_table.add_row("Время p50/p95/p99", format_percentiles(snapshot["latency"]))
+        requests_table.add_row("До 1-го токена p50/p95/p99", format_percentiles(snapshot["ttft"]))
+        requests_table.add_row(
+            "Токены вход/выход/кэш",
+            f"{snapshot['input_tokens']}/{snapshot['output_tokens']}/{snapshot['cache_read_tokens']}"
+        )
+        last_request = snapshot["last_request"]
+        requests_table.add_row(
+            "Последний запрос",
+            datetime.fromtimestamp(last_request).strftime("%H:%M:%S") if last_request else "N/A"
+        )
         
-        # Logs panel
-        logs = Text("\n".join([
-            f"[{datetime.now().strftime('%H:%M:%S')}] Пример лога 1",
-            f"[{datetime.now().strftime('%H:%M:%S')}] Пример лога 2",
-            f"[{datetime.now().strftime('%H:%M:%S')}] Пример лога 3"
-        ]))
+        # Разбивка по провайдерам
+        providers_table = Table(title="Провайдеры")
+        providers_table.add_column("Провайдер")
+        providers_table.add_column("Запросов", justify="right")
+        providers_table.add_column("Ошибок", justify="right")
+        providers_table.add_column("p50/p95/p99", justify="right")
+        for name, breakdown in snapshot["providers"].items():
+            providers_table.add_row(
+                name, str(breakdown["requests"]), f"[red]{breakdown['errors']}[/red]", format_percentiles(breakdown)
+            )
         
+        self.layout["requests"].update(Panel(Group(requests_table, providers_table)))
+    
+    def render_logs(self, workers: Optional[List[WorkerMetrics]] = None):
+        from rich.panel import Panel
+        from rich.text import Text
+        logs = Text("\n".join(self.logs(workers)) or "Нет записей")
         self.layout["logs"].update(Panel(logs, title="Последние логи"))
-        
-        # Footer
+    
+    def render_footer(self):
+        from rich.panel import Panel
+        from rich.text import Text
         footer_text = Text("🔄 Обновляется в реальном времени | Ctrl+C для выхода")
         self.layout["footer"].update(Panel(footer_text))
-        
+    
+    def refresh(self, now: Optional[float] = None) -> List[str]:
+        """Перерисовать только регионы с изменившимися данными; возвращает их имена"""
+        now = time.time() if now is None else now
+        workers = self.workers()
+        versions = {
+            "header": True,
+            "requests": self.metrics_version(workers, now),
+            "logs": tuple((int(worker.pid[0]), worker.logs.count) for worker in workers),
+            "footer": True,
+        }
+        changed = [region for region, version in versions.items() if self.rendered.get(region) != version]
+        for region in changed:
+            if region == "requests":
+                self.render_requests(self.snapshot(workers))
+            elif region == "logs":
+                self.render_logs(workers)
+            else:
+                getattr(self, f"render_{region}")()
+            self.rendered[region] = versions[region]
+        return changed
+    
+    def generate_layout(self) -> "Layout":
+        """Генерация обновленного layout"""
+        self.refresh()
         return self.layout
     
-    def start(self):
-        """Запуск интерактивного дашборда"""
-        with Live(self.layout, refresh_per_second=4) as live:
+    def start(self, min_interval: float = 0.25, max_interval: float = 2.0):
+        """Запуск интерактивного дашборда.
+        
+        Кадр выводится только при изменении данных; без изменений интервал
+        опроса удваивается до ``max_interval`` и сбрасывается при первом изменении.
+        """
+        from rich.console import Console
+        from rich.live import Live
+        
+        console = Console()
+        interval = min_interval
+        with Live(self.layout, auto_refresh=False, console=console) as live:
             try:
                 while True:
-                    live.update(self.generate_layout())
-                    time.sleep(0.25)
+                    if self.refresh():
+                        live.refresh()
+                        interval = min_interval
+                    else:
+                        interval = min(interval * 2, max_interval)
+                    time.sleep(interval)
             except KeyboardInterrupt:
-                self.console.print("[yellow]Дашборд остановлен[/yellow]")
+                console.print("[yellow]Дашборд остановлен[/yellow]")
+    
+    def run_headless(self, stream: TextIO = sys.stdout, interval: float = 1.0, iterations: Optional[int] = None):
+        """Вывод снимков метрик строками JSON для сбора без терминала; неизменившиеся снимки пропускаются"""
+        version = None
+        count = 0
+        while iterations is None or count < iterations:
+            now = time.time()
+            workers = self.workers()
+            current = self.metrics_version(workers, now)
+            if current != version:
+                version = current
+                stream.write(json.dumps({"timestamp": now, **self.snapshot(workers)}, ensure_ascii=False) + "\n")
+                stream.flush()
+            count += 1
+            if iterations is None or count < iterations:
+                time.sleep(interval)
 
 
 if __name__ == "__main__":
-    dashboard = AgentDashboard()
-    dashboard.start()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Дашборд ИИ-агента")
+    parser.add_argument("--headless", action="store_true", help="Снимки метрик строками JSON в stdout")
+    parser.add_argument("--interval", type=float, default=1.0, help="Интервал опроса в режиме --headless, сек")
+    args = parser.parse_args()
+    
+    # Отдельный процесс читает метрики, которые публикуют воркеры агента
+    channel = MetricsChannel(os.getenv("AGENT_METRICS_CHANNEL") or "ai-agent-metrics")
+    dashboard = AgentDashboard(channel=channel, publish=False)
+    if args.headless:
+        try:
+            dashboard.run_headless(interval=args.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        dashboard.start()
\ No newline at end of file
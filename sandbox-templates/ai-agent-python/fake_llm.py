@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from coalesce import normalize_prompt
+
+
+def last_prompt(messages: Any) -> str:
+    """Текст последнего вопроса пользователя: ключ записи"""
+    if isinstance(messages, str):
+        return messages
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+
+def split_tokens(text: str) -> List[str]:
+    """Псевдотокены для потоковой выдачи: слова вместе с пробелами после них"""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def load_recordings(path: str) -> Dict[str, str]:
+    """Записи JSON lines ``{"prompt": ..., "response": ...}``; ключ - нормализованный вопрос"""
+    recordings = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings[normalize_prompt(entry["prompt"])] = entry["response"]
+    return recordings
+
+
+class ReplayChatModel(BaseChatModel):
+    """Детерминированный офлайн-провайдер: воспроизводит записанные ответы.
+
+    Ответ ищется по нормализованному последнему вопросу. Для незаписанного
+    вопроса берется ``default_response``, иначе одна из записей, выбранная
+    по хэшу вопроса (без записей - эхо вопроса). Ответ выдается
+    псевдотокенами: первый через ``first_token_latency`` секунд, каждый
+    следующий - через ``token_latency``. Расход токенов оценивается по
+    числу слов, чтобы метрики usage заполнялись как у настоящих провайдеров.
+    """
+
+    recordings: Dict[str, str] = {}
+    default_response: Optional[str] = None
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    model_name: str = "replay"
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "ReplayChatModel":
+        return cls(recordings=load_recordings(path), **kwargs)
+
+    def respond(self, messages: List[BaseMessage]) -> str:
+        prompt = last_prompt(messages)
+        response = self.recordings.get(normalize_prompt(prompt))
+        if response is not None:
+            return response
+        if self.default_response is not None:
+            return self.default_response
+        if not self.recordings:
+            return f"Ответ на: {prompt}"
+        answers = list(self.recordings.values())
+        return answers[int(hashlib.sha256(prompt.encode()).hexdigest(), 16) % len(answers)]
+
+    def usage(self, messages: List[BaseMessage], response: str) -> Dict[str, int]:
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        output_tokens = len(response.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def delays(self, tokens: List[str]) -> Iterator[float]:
+        for index, _ in enumerate(tokens):
+            yield self.first_token_latency if index == 0 else self.token_latency
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        response = self.respond(messages)
+        time.sleep(sum(self.delays(split_tokens(response))))
+        message = AIMessage(content=response, usage_metadata=self.usage(messages, response))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        response = self.respond(messages)
+        await asyncio.sleep(sum(self.delays(split_tokens(response))))
+        message = AIMessage(content=response, usage_metadata=self.usage(messages, response))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        response = self.respond(messages)
+        tokens = split_tokens(response)
+        for token, delay in zip(tokens, self.delays(tokens)):
+            await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        # Итоговый usage приходит последним чанком, как у OpenAI с include_usage
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self.usage(messages, response)))
+
+
+class RecordingModel:
+    """Обертка над настоящим провайдером, дописывающая пары вопрос-ответ в JSON lines"""
+
+    def __init__(self, wrapped: Any, path: str):
+        self.wrapped = wrapped
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.wrapped, name)
+
+    def record(self, messages: Any, response: str):
+        line = json.dumps({"prompt": last_prompt(messages), "response": response}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def invoke(self, messages: Any, *args: Any, **kwargs: Any):
+        # Синхронно вызывается только резюмирование истории - его не записываем
+        return self.wrapped.invoke(messages, *args, **kwargs)
+
+    async def ainvoke(self, messages: Any, *args: Any, **kwargs: Any):
+        result = await self.wrapped.ainvoke(messages, *args, **kwargs)
+        self.record(messages, result.content if isinstance(result.content, str) else str(result.content))
+        return result
+
+    async def astream(self, messages: Any, *args: Any, **kwargs: Any):
+        parts = []
+        async for chunk in self.wrapped.astream(messages, *args, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        self.record(messages, "".join(parts))
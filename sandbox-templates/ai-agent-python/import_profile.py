@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# SDK провайдеров и отрисовка дашборда не должны загружаться при старте сервиса
+# (сами rich и rich.live подтягивают structlog и httpx, поэтому проверяется rich.layout)
+DEFAULT_FORBIDDEN = ("langchain_openai", "langchain_anthropic", "langchain_mistralai", "langchain_groq", "rich.layout")
+# Фиктивные ключи: все провайдеры считаются настроенными, как в рабочем sandbox
+PROFILE_ENV = {name: "import-profile" for name in (
+    "OPENAI_API_KEY", "ANTHROPIC_API_KEY", "MISTRAL_API_KEY", "GROQ_API_KEY"
+)}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile_env() -> Dict[str, str]:
+    env = {**os.environ, "AGENT_METRICS_CHANNEL": ""}
+    for name, value in PROFILE_ENV.items():
+        env.setdefault(name, value)
+    return env
+
+
+def profile_imports(module: str = "agent") -> List[Tuple[str, int, int]]:
+    """Время импорта каждого модуля по ``python -X importtime``: (модуль, собственное, накопленное) в мкс"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, env=profile_env(), capture_output=True, text=True, check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def build_report(entries: List[Tuple[str, int, int]], module: str = "agent", top: int = 20,
+                 forbidden=DEFAULT_FORBIDDEN) -> Dict:
+    packages = defaultdict(int)
+    for name, self_us, _ in entries:
+        packages[name.split(".")[0]] += self_us
+    total_us = next((cumulative for name, _, cumulative in entries if name == module),
+                    sum(self_us for _, self_us, _ in entries))
+    loaded = {name for name, _, _ in entries}
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(entries),
+        "top_modules": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for name, self_us, cumulative_us in sorted(entries, key=lambda entry: -entry[2])[:top]
+        ],
+        "top_packages": [
+            {"package": name, "self_ms": round(self_us / 1000, 1)}
+            for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        ],
+        "forbidden_loaded": sorted(name for name in forbidden if name in loaded),
+    }
+
+
+def time_to_healthy(port: int = 8765, timeout: float = 60.0) -> float:
+    """Секунды от запуска uvicorn до первого успешного ответа /health"""
+    import httpx
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "agent:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=profile_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn завершился до готовности /health")
+            time.sleep(0.02)
+        raise TimeoutError(f"/health не ответил за {timeout} сек")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Профиль времени импорта агента для CI")
+    parser.add_argument("--module", default="agent")
+    parser.add_argument("--top", type=int, default=20, help="Сколько самых медленных модулей показать")
+    parser.add_argument("--budget-ms", type=float, help="Порог времени импорта; превышение - код возврата 1")
+    parser.add_argument("--health", action="store_true", help="Также измерить время до первого ответа /health")
+    parser.add_argument("--output", help="Куда сохранить отчет в JSON")
+    args = parser.parse_args(argv)
+
+    report = build_report(profile_imports(args.module), args.module, args.top)
+    if args.health:
+        report["time_to_healthy_s"] = round(time_to_healthy(), 3)
+
+    print(f"Импорт {report['module']}: {report['total_ms']} мс, модулей: {report['modules']}")
+    for entry in report["top_modules"]:
+        print(f"  {entry['cumulative_ms']:>9.1f} мс  {entry['module']}")
+    if "time_to_healthy_s" in report:
+        print(f"Время до первого ответа /health: {report['time_to_healthy_s']} сек")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    failed = False
+    if report["forbidden_loaded"]:
+        print(f"❌ При старте загружены: {', '.join(report['forbidden_loaded'])}")
+        failed = True
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"❌ Импорт дольше бюджета {args.budget_ms} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
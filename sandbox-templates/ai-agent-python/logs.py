@@ -0,0 +1,81 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Optional, TextIO
+
+import structlog
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Передает запись в очередь как есть: форматирование и вывод выполняет фоновый поток"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(fmt: str = "json", level: str = "INFO",
+                      stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """Структурированные логи как в mlops-fastapi, с записью через фоновую очередь.
+
+    В потоке запроса остается только сборка словаря события; рендеринг в
+    JSON (``fmt="json"``) или цветной вывод (``fmt="console"``) и запись в
+    поток выполняет ``QueueListener``.
+    """
+    timestamper = structlog.processors.TimeStamper(fmt="iso")
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            timestamper,
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    if fmt == "console":
+        renderer = structlog.dev.ConsoleRenderer()
+    else:
+        renderer = structlog.processors.JSONRenderer(ensure_ascii=False)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(structlog.stdlib.ProcessorFormatter(
+        processor=renderer,
+        # Записи сторонних библиотек (uvicorn, httpx) приводятся к тому же формату
+        foreign_pre_chain=[structlog.stdlib.add_logger_name, structlog.stdlib.add_log_level, timestamper],
+    ))
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(stop_listener, listener)
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(records)]
+    root.setLevel(level.upper())
+    return listener
+
+
+def stop_listener(listener: logging.handlers.QueueListener):
+    """Дописать оставшиеся записи; повторная остановка безопасна"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def sampled(rate: float) -> bool:
+    """Попадает ли запрос в выборку для логирования содержимого"""
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... (+{len(text) - limit} симв.)"
@@ -0,0 +1,351 @@
+import fcntl
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+WINDOW = 1024
+PROVIDER_WINDOW = 256
+HORIZON = 300
+MAX_PROVIDERS = 8
+LOG_LINES = 50
+LOG_LINE_BYTES = 240
+COUNTERS = ("total_requests", "successful", "errors", "input_tokens", "output_tokens", "cache_read_tokens")
+
+
+def percentiles(values: np.ndarray, qs: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+    ordered = np.sort(values)
+    return {
+        f"p{round(q * 100)}": float(ordered[min(int(q * len(ordered)), len(ordered) - 1)]) if len(ordered) else None
+        for q in qs
+    }
+
+
+class LatencyWindow:
+    """Кольцевой буфер последних ``size`` замеров с фиксированным объемом памяти.
+
+    Хранилище может быть срезом общей памяти: тогда буфер видят другие процессы.
+    """
+
+    def __init__(self, size: int = WINDOW, values: Optional[np.ndarray] = None,
+                 count: Optional[np.ndarray] = None):
+        self.size = size
+        self._values = np.zeros(size) if values is None else values
+        self._count = np.zeros(1, dtype=np.int64) if count is None else count
+
+    @property
+    def count(self) -> int:
+        return int(self._count[0])
+
+    def record(self, value: float):
+        count = self.count
+        self._values[count % self.size] = value
+        self._count[0] = count + 1
+
+    def values(self) -> np.ndarray:
+        return self._values[:min(self.count, self.size)]
+
+    def percentiles(self, qs: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+        """Перцентили по буферу; сортировка выполняется только при чтении"""
+        return percentiles(self.values(), qs)
+
+
+class RateWindow:
+    """Счетчики событий по секундам в кольце на ``horizon`` секунд"""
+
+    def __init__(self, horizon: int = HORIZON, seconds: Optional[np.ndarray] = None,
+                 counts: Optional[np.ndarray] = None):
+        self.horizon = horizon
+        self._seconds = np.zeros(horizon, dtype=np.int64) if seconds is None else seconds
+        self._counts = np.zeros(horizon, dtype=np.int64) if counts is None else counts
+
+    def record(self, now: Optional[float] = None):
+        second = int(time.time() if now is None else now)
+        slot = second % self.horizon
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += 1
+
+    def total(self, window: int, now: Optional[float] = None) -> int:
+        age = int(time.time() if now is None else now) - self._seconds
+        return int(self._counts[(age >= 0) & (age < min(window, self.horizon))].sum())
+
+    def rate(self, window: int, now: Optional[float] = None) -> float:
+        """Событий в секунду за последние ``window`` секунд"""
+        return self.total(window, now) / min(window, self.horizon)
+
+
+class LogRing:
+    """Кольцо последних ``size`` строк лога с фиксированным объемом памяти.
+
+    Строки хранятся байтами UTF-8 длиной до ``LOG_LINE_BYTES``, поэтому кольцо
+    может лежать в общей памяти, как и буферы задержек.
+    """
+
+    def __init__(self, size: int = LOG_LINES, created: Optional[np.ndarray] = None,
+                 text: Optional[np.ndarray] = None, count: Optional[np.ndarray] = None):
+        self.size = size
+        self._created = np.zeros(size) if created is None else created
+        self._text = np.zeros(size, dtype=f"S{LOG_LINE_BYTES}") if text is None else text
+        self._count = np.zeros(1, dtype=np.int64) if count is None else count
+
+    @property
+    def count(self) -> int:
+        return int(self._count[0])
+
+    def record(self, created: float, line: str):
+        count = self.count
+        # Лишние байты отбрасывает numpy; разрезанный символ пропускается при чтении
+        self._text[count % self.size] = line.encode()
+        self._created[count % self.size] = created
+        self._count[0] = count + 1
+
+    def entries(self) -> List[Tuple[float, str]]:
+        """Записи (время, строка) от старых к новым"""
+        count = self.count
+        slots = [index % self.size for index in range(max(count - self.size, 0), count)]
+        return [(float(self._created[slot]), self._text[slot].decode(errors="ignore")) for slot in slots]
+
+
+def slot_dtype(window: int = WINDOW, provider_window: int = PROVIDER_WINDOW,
+               horizon: int = HORIZON, max_providers: int = MAX_PROVIDERS,
+               log_lines: int = LOG_LINES) -> np.dtype:
+    """Раскладка метрик одного процесса; одинакова для локальной и общей памяти"""
+    return np.dtype([
+        ("pid", np.int64),
+        ("counters", np.int64, (len(COUNTERS),)),
+        ("last_request", np.float64),
+        ("latency_count", np.int64, (1,)),
+        ("latency", np.float64, (window,)),
+        ("ttft_count", np.int64, (1,)),
+        ("ttft", np.float64, (window,)),
+        ("rate_seconds", np.int64, (horizon,)),
+        ("rate_counts", np.int64, (horizon,)),
+        ("provider_names", "S32", (max_providers,)),
+        ("provider_counters", np.int64, (max_providers, 2)),
+        ("provider_latency_count", np.int64, (max_providers, 1)),
+        ("provider_latency", np.float64, (max_providers, provider_window)),
+        ("log_count", np.int64, (1,)),
+        ("log_created", np.float64, (log_lines,)),
+        ("log_text", f"S{LOG_LINE_BYTES}", (log_lines,)),
+    ])
+
+
+class WorkerMetrics:
+    """Метрики одного процесса поверх строки структурированного массива.
+
+    Запись метрики - несколько присваиваний в numpy без блокировок: у строки
+    один писатель, читатели допускают мгновенно несогласованные значения.
+    """
+
+    def __init__(self, slots: np.ndarray, index: int, owner: Any = None):
+        row = slots[index:index + 1]
+        # Ссылка на владельца общей памяти: сегмент не должен закрыться раньше представлений
+        self.owner = owner
+        self.row = row
+        self.pid = row["pid"]
+        self.counters = row["counters"][0]
+        self.last_request = row["last_request"]
+        self.latency = LatencyWindow(slots.dtype["latency"].shape[0], row["latency"][0], row["latency_count"][0])
+        self.ttft = LatencyWindow(slots.dtype["ttft"].shape[0], row["ttft"][0], row["ttft_count"][0])
+        self.throughput = RateWindow(slots.dtype["rate_seconds"].shape[0], row["rate_seconds"][0], row["rate_counts"][0])
+        self.provider_names = row["provider_names"][0]
+        self.provider_counters = row["provider_counters"][0]
+        provider_window = slots.dtype["provider_latency"].shape[1]
+        self.provider_latency = [
+            LatencyWindow(provider_window, values, count)
+            for values, count in zip(row["provider_latency"][0], row["provider_latency_count"][0])
+        ]
+        self.logs = LogRing(slots.dtype["log_created"].shape[0], row["log_created"][0], row["log_text"][0],
+                            row["log_count"][0])
+        self._provider_index: Dict[str, int] = {}
+
+    @classmethod
+    def local(cls, window: int = WINDOW) -> "WorkerMetrics":
+        """Метрики в памяти процесса, без публикации"""
+        return cls(np.zeros(1, dtype=slot_dtype(window, max(window // 4, 1))), 0)
+
+    def reset(self, pid: int = 0):
+        self.row[0] = np.zeros(1, dtype=self.row.dtype)[0]
+        self.pid[0] = pid
+        self._provider_index.clear()
+
+    def provider_index(self, name: str) -> Optional[int]:
+        index = self._provider_index.get(name)
+        if index is None:
+            encoded = name.encode()[:32]
+            names = list(self.provider_names)
+            if encoded in names:
+                index = names.index(encoded)
+            elif b"" in names:
+                index = names.index(b"")
+                self.provider_names[index] = encoded
+            else:
+                return None
+            self._provider_index[name] = index
+        return index
+
+    def record_request(self, success: bool, latency: float, provider: Optional[str] = None,
+                       now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.counters[0] += 1
+        self.counters[1 if success else 2] += 1
+        if success:
+            self.latency.record(latency)
+        self.throughput.record(now)
+        self.last_request[0] = now
+
+        index = self.provider_index(provider) if provider else None
+        if index is not None:
+            self.provider_counters[index, 0] += 1
+            if success:
+                self.provider_latency[index].record(latency)
+            else:
+                self.provider_counters[index, 1] += 1
+
+    def record_ttft(self, ttft: float):
+        self.ttft.record(ttft)
+
+    def record_usage(self, usage: Dict[str, int]):
+        for offset, key in enumerate(COUNTERS[3:], start=3):
+            self.counters[offset] += usage.get(key, 0)
+
+    def providers(self) -> Dict[str, Any]:
+        return {
+            name.decode(): (self.provider_counters[index], self.provider_latency[index])
+            for index, name in enumerate(self.provider_names) if name
+        }
+
+
+def aggregate(workers: List[WorkerMetrics], now: Optional[float] = None) -> Dict[str, Any]:
+    """Сводные метрики нескольких процессов: суммы счетчиков и перцентили по объединенным буферам"""
+    now = time.time() if now is None else now
+    counters = sum((worker.counters for worker in workers), np.zeros(len(COUNTERS), dtype=np.int64))
+    last_request = max((float(worker.last_request[0]) for worker in workers), default=0.0)
+
+    providers: Dict[str, Dict[str, Any]] = {}
+    for worker in workers:
+        for name, (provider_counters, latency) in worker.providers().items():
+            merged = providers.setdefault(name, {"requests": 0, "errors": 0, "latency": []})
+            merged["requests"] += int(provider_counters[0])
+            merged["errors"] += int(provider_counters[1])
+            merged["latency"].append(latency.values())
+
+    def merged_percentiles(windows: List[np.ndarray]) -> Dict[str, Optional[float]]:
+        return percentiles(np.concatenate(windows) if windows else np.zeros(0))
+
+    return {
+        **{key: int(value) for key, value in zip(COUNTERS, counters)},
+        "last_request": last_request or None,
+        "workers": len(workers),
+        "latency": merged_percentiles([worker.latency.values() for worker in workers]),
+        "ttft": merged_percentiles([worker.ttft.values() for worker in workers]),
+        "rps_10s": sum(worker.throughput.rate(10, now) for worker in workers),
+        "rps_60s": sum(worker.throughput.rate(60, now) for worker in workers),
+        "providers": {
+            name: {"requests": merged["requests"], "errors": merged["errors"], **merged_percentiles(merged["latency"])}
+            for name, merged in sorted(providers.items())
+        },
+    }
+
+
+def merged_logs(workers: List[WorkerMetrics], limit: int = LOG_LINES) -> List[str]:
+    """Последние ``limit`` строк логов всех процессов в порядке записи"""
+    entries = sorted(entry for worker in workers for entry in worker.logs.entries())
+    return [line for _, line in entries[-limit:]] if limit > 0 else []
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _shared_memory(name: str, create: bool, size: int = 0) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    except TypeError:
+        # До Python 3.13 resource_tracker удаляет сегмент при выходе любого
+        # процесса, открывшего его; сегмент должен переживать воркеры
+        segment = shared_memory.SharedMemory(name, create=create, size=size)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class MetricsChannel:
+    """Сегмент общей памяти, в который воркеры агента публикуют метрики.
+
+    Каждый воркер занимает свою строку (слот) и пишет в нее без блокировок
+    метрики и кольцо последних строк лога; процесс дашборда читает строки
+    живых воркеров и агрегирует их. Файловая
+    блокировка нужна только при создании сегмента и захвате слота.
+    """
+
+    MAGIC = 0x41474D54
+    VERSION = 2
+    HEADER = 4
+
+    def __init__(self, name: str = "ai-agent-metrics", slots: int = 16):
+        self.name = name
+        self.dtype = slot_dtype()
+        header_bytes = self.HEADER * 8
+        with self._locked():
+            try:
+                self.segment = _shared_memory(name, create=True, size=header_bytes + slots * self.dtype.itemsize)
+                header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.segment.buf)
+                header[:] = (self.MAGIC, self.VERSION, slots, self.dtype.itemsize)
+            except FileExistsError:
+                self.segment = _shared_memory(name, create=False)
+                header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.segment.buf)
+                if tuple(header[[0, 1, 3]]) != (self.MAGIC, self.VERSION, self.dtype.itemsize):
+                    raise ValueError(f"Сегмент {name} имеет несовместимый формат метрик")
+        self.slots = np.ndarray((int(header[2]),), dtype=self.dtype, buffer=self.segment.buf, offset=header_bytes)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def publisher(self, pid: Optional[int] = None) -> WorkerMetrics:
+        """Слот текущего процесса; слоты завершившихся воркеров переиспользуются"""
+        pid = os.getpid() if pid is None else pid
+        with self._locked():
+            owners = [int(owner) for owner in self.slots["pid"]]
+            if pid in owners:
+                return WorkerMetrics(self.slots, owners.index(pid), self)
+            for index, owner in enumerate(owners):
+                if owner == 0 or not _pid_alive(owner):
+                    metrics = WorkerMetrics(self.slots, index, self)
+                    metrics.reset(pid)
+                    return metrics
+        raise RuntimeError(f"В канале метрик {self.name} нет свободных слотов")
+
+    def release(self, metrics: WorkerMetrics):
+        with self._locked():
+            metrics.pid[0] = 0
+
+    def workers(self) -> List[WorkerMetrics]:
+        """Слоты живых воркеров"""
+        return [
+            WorkerMetrics(self.slots, index, self)
+            for index, owner in enumerate(self.slots["pid"]) if owner and _pid_alive(int(owner))
+        ]
+
+    def unlink(self):
+        if not hasattr(self.segment, "_track"):
+            # Сегмент снят с учета resource_tracker при открытии; unlink снимает его повторно
+            resource_tracker.register(self.segment._name, "shared_memory")
+        self.segment.unlink()
@@ -0,0 +1,142 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
+
+import httpx
+
+from admission import AdmissionRejected, PriorityLimiter, Ticket
+
+
+class ProviderPool:
+    """Общие HTTP-клиенты и лимиты параллелизма для провайдеров LLM.
+
+    На каждого провайдера создается по одному httpx-клиенту с пулом
+    keep-alive соединений и один ``PriorityLimiter``, ограничивающий число
+    одновременных запросов: сверх лимита запросы ждут в очереди по
+    приоритету и крайнему сроку из ``Ticket``. Таймауты реализованы через
+    asyncio и не блокируют event loop; для потоков ``timeout`` ограничивает
+    ожидание каждого чанка, а ``stream_timeout`` - суммарное ожидание ответа.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 30.0,
+        stream_timeout: float = 600.0,
+        concurrency: Optional[Dict[str, int]] = None,
+        default_concurrency: int = 32,
+        max_queue: Optional[int] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.max_queue = max_queue
+
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._limiters: Dict[str, PriorityLimiter] = {}
+        self.timeouts: Dict[str, int] = defaultdict(int)
+
+    def async_client(self, provider: str, **kwargs: Any) -> httpx.AsyncClient:
+        """Асинхронный клиент провайдера; kwargs (base_url, headers) учитываются при создании"""
+        client = self._async_clients.get(provider)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, **kwargs)
+            self._async_clients[provider] = client
+        return client
+
+    def sync_client(self, provider: str, **kwargs: Any) -> httpx.Client:
+        """Синхронный клиент для редких блокирующих вызовов (резюме истории и т.п.)"""
+        client = self._sync_clients.get(provider)
+        if client is None:
+            client = httpx.Client(limits=self.limits, timeout=self.timeout, **kwargs)
+            self._sync_clients[provider] = client
+        return client
+
+    def limit(self, provider: str) -> int:
+        return self.concurrency.get(provider, self.default_concurrency)
+
+    @asynccontextmanager
+    async def slot(self, provider: str, ticket: Optional[Ticket] = None):
+        """Занять один из слотов параллелизма провайдера; ожидание добавляется в ``ticket.queue_wait``"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            limiter = self._limiters.setdefault(provider, PriorityLimiter(self.limit(provider), self.max_queue))
+        if ticket is None:
+            await limiter.acquire()
+        else:
+            ticket.queue_wait += await limiter.acquire(ticket.priority, ticket.deadline)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    async def run(self, provider: str, call: Awaitable, timeout: Optional[float] = None,
+                  ticket: Optional[Ticket] = None):
+        """Выполнить вызов провайдера с ограничением параллелизма и таймаутом"""
+        try:
+            async with self.slot(provider, ticket):
+                try:
+                    return await asyncio.wait_for(call, timeout or self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts[provider] += 1
+                    raise
+        except AdmissionRejected:
+            # Вызов так и не начался
+            if asyncio.iscoroutine(call):
+                call.close()
+            raise
+
+    async def stream(self, provider: str, chunks: AsyncIterator, timeout: Optional[float] = None,
+                     ticket: Optional[Ticket] = None):
+        """Проксировать поток чанков.
+
+        ``timeout`` - простой между чанками, поэтому длинная генерация не
+        обрывается; суммарное ожидание провайдера ограничено ``stream_timeout``.
+        Время, пока потребитель обрабатывает чанк, не учитывается.
+        """
+        loop = asyncio.get_running_loop()
+        idle_timeout = timeout or self.timeout
+        async with self.slot(provider, ticket):
+            waited = 0.0
+            iterator = chunks.__aiter__()
+            while True:
+                started = loop.time()
+                try:
+                    chunk = await asyncio.wait_for(
+                        iterator.__anext__(), max(min(idle_timeout, self.stream_timeout - waited), 0)
+                    )
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self.timeouts[provider] += 1
+                    await iterator.aclose()
+                    raise
+                waited += loop.time() - started
+                yield chunk
+
+    async def aclose(self):
+        for client in self._async_clients.values():
+            await client.aclose()
+        for client in self._sync_clients.values():
+            client.close()
+        self._async_clients.clear()
+        self._sync_clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        providers = set(self._limiters) | set(self._async_clients)
+        return {
+            provider: {
+                **(self._limiters[provider].stats() if provider in self._limiters
+                   else {"in_flight": 0, "limit": self.limit(provider)}),
+                "timeouts": self.timeouts[provider],
+            }
+            for provider in sorted(providers)
+        }
@@ -0,0 +1,291 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from admission import AdmissionRejected, Ticket
+from pool import ProviderPool
+
+
+class NoProviderAvailable(RuntimeError):
+    """Нет ни одного настроенного провайдера"""
+
+
+class LazyModel:
+    """Модель провайдера, создаваемая при первом выборе: импорт SDK откладывается до него"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._model = None
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self._model = self.factory()
+                    self.loaded = True
+        return self._model
+
+
+class ProviderHealth:
+    """Скользящая статистика провайдера: задержки, ошибки и автоматический выключатель.
+
+    После ``failure_threshold`` ошибок подряд провайдер считается нездоровым
+    на ``cooldown`` секунд и используется только как последний резерв. Доля
+    ошибок считается по исходам за последние ``error_window`` секунд: иначе
+    провайдер, ушедший в конец очереди, не получал бы трафика и не восстанавливался.
+    """
+
+    def __init__(self, window: int = 100, failure_threshold: int = 3, cooldown: float = 30.0,
+                 error_window: float = 60.0):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.error_window = error_window
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.outcomes.append((time.monotonic(), True))
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append((time.monotonic(), False))
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    @property
+    def error_rate(self) -> float:
+        since = time.monotonic() - self.error_window
+        recent = [ok for at, ok in self.outcomes if at >= since]
+        return recent.count(False) / len(recent) if recent else 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class LLMRouter:
+    """Маршрутизация запросов между провайдерами с учетом задержек и ошибок.
+
+    Запрос уходит самому быстрому здоровому провайдеру (по скользящей p50);
+    провайдеры без статистики пробуются первыми в порядке конфигурации. При
+    ошибке запрос автоматически повторяется у следующего. В режиме ``hedge``
+    резервный запрос ко второму провайдеру отправляется, если первый не
+    ответил за свою p95, и используется ответ, пришедший раньше.
+
+    ``messages_for(model)`` строит сообщения под конкретную модель, так как
+    формат системного промпта зависит от провайдера. ``ticket`` передается
+    в пул: отказ в допуске (``AdmissionRejected``) не считается ошибкой
+    провайдера.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, Any],
+        pool: ProviderPool,
+        window: int = 100,
+        max_error_rate: float = 0.5,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        error_window: float = 60.0,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+    ):
+        self.providers = dict(providers)
+        self.pool = pool
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.health = {
+            name: ProviderHealth(window, failure_threshold, cooldown, error_window) for name in self.providers
+        }
+        self.failovers = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def ranked(self) -> List[str]:
+        """Провайдеры в порядке предпочтения"""
+        order = list(self.providers)
+
+        def key(name: str):
+            health = self.health[name]
+            p50 = health.percentile(0.5)
+            return (
+                not health.healthy,
+                health.error_rate > self.max_error_rate,
+                p50 is not None,
+                p50 or 0.0,
+                order.index(name),
+            )
+
+        return sorted(order, key=key)
+
+    def model(self, name: str) -> Any:
+        """Модель провайдера; ленивая модель создается при первом обращении"""
+        model = self.providers[name]
+        if isinstance(model, LazyModel):
+            model = model.get()
+            if model is None:
+                raise NoProviderAvailable(f"Провайдер {name} не инициализирован")
+        return model
+
+    def primary(self) -> Tuple[Optional[str], Any]:
+        ranked = self.ranked()
+        if not ranked:
+            return None, None
+        return ranked[0], self.model(ranked[0])
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        health = self.health[name]
+        if not self.hedge or len(health.latencies) < self.hedge_min_samples:
+            return None
+        return health.percentile(0.95)
+
+    async def _call(self, name: str, messages_for: Callable[[Any], list], ticket: Optional[Ticket] = None):
+        # У каждой попытки свой допуск: ожидание параллельной резервной попытки
+        # не смешивается с ожиданием этой. В ``ticket`` оно добавляется, только
+        # если попытка завершилась, а не была отменена
+        attempt = ticket.attempt() if ticket else None
+        started = time.perf_counter()
+        try:
+            model = await self._resolve(name)
+            result = await self.pool.run(name, model.ainvoke(messages_for(model)), ticket=attempt)
+        except AdmissionRejected:
+            self._add_wait(ticket, attempt)
+            raise
+        except Exception:
+            self._add_wait(ticket, attempt)
+            self.health[name].record_failure()
+            raise
+        self._add_wait(ticket, attempt)
+        # Ожидание в очереди пула не относится к задержке провайдера
+        waited = attempt.queue_wait if attempt else 0.0
+        self.health[name].record_success(time.perf_counter() - started - waited)
+        return result
+
+    @staticmethod
+    def _add_wait(ticket: Optional[Ticket], attempt: Optional[Ticket]):
+        if ticket is not None:
+            ticket.queue_wait += attempt.queue_wait
+
+    async def _resolve(self, name: str) -> Any:
+        """Модель провайдера без блокировки event loop импортом SDK"""
+        model = self.providers[name]
+        if isinstance(model, LazyModel) and not model.loaded:
+            return await asyncio.to_thread(self.model, name)
+        return self.model(name)
+
+    async def warm_up(self):
+        """Заранее создать модель основного провайдера"""
+        order = self.ranked()
+        if order:
+            await self._resolve(order[0])
+
+    async def ainvoke(self, messages_for: Callable[[Any], list],
+                      ticket: Optional[Ticket] = None) -> Tuple[Any, str]:
+        """Ответ первого успешно ответившего провайдера: (результат, имя провайдера)"""
+        order = self.ranked()
+        if not order:
+            raise NoProviderAvailable("Нет настроенных провайдеров LLM")
+
+        errors = []
+        tasks: Dict[asyncio.Future, str] = {}
+        position = 0
+        try:
+            while position < len(order):
+                name = order[position]
+                tasks = {asyncio.ensure_future(self._call(name, messages_for, ticket)): name}
+                position += 1
+
+                delay = self.hedge_delay(name)
+                if delay is not None and position < len(order):
+                    done, _ = await asyncio.wait(set(tasks), timeout=delay)
+                    if not done:
+                        # Основной запрос медленнее своей p95 - отправляем резервный
+                        self.hedged += 1
+                        tasks[asyncio.ensure_future(self._call(order[position], messages_for, ticket))] = order[position]
+                        position += 1
+
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if tasks[task] != name:
+                                self.hedge_wins += 1
+                            return task.result(), tasks[task]
+                        errors.append(task.exception())
+                self.failovers += 1
+        finally:
+            # Проигравшая попытка и попытки отмененного вызывающего не остаются
+            # висеть запросами к провайдерам
+            for task in tasks:
+                task.cancel()
+
+        raise errors[-1]
+
+    async def astream(self, messages_for: Callable[[Any], list], ticket: Optional[Ticket] = None):
+        """Поток чанков (провайдер, чанк); переключение возможно только до первого чанка"""
+        order = self.ranked()
+        if not order:
+            raise NoProviderAvailable("Нет настроенных провайдеров LLM")
+
+        errors = []
+        for name in order:
+            started = time.perf_counter()
+            waited = ticket.queue_wait if ticket else 0.0
+            streamed = False
+            try:
+                model = await self._resolve(name)
+                async for chunk in self.pool.stream(name, model.astream(messages_for(model)), ticket=ticket):
+                    streamed = True
+                    yield name, chunk
+            except Exception as e:
+                if not isinstance(e, AdmissionRejected):
+                    self.health[name].record_failure()
+                if streamed:
+                    raise
+                errors.append(e)
+                self.failovers += 1
+                continue
+            waited = ticket.queue_wait - waited if ticket else 0.0
+            self.health[name].record_success(time.perf_counter() - started - waited)
+            return
+        raise errors[-1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": self.ranked(),
+            "failovers": self.failovers,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "providers": {name: health.stats() for name, health in self.health.items()},
+        }
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def sentence_transformer_embedder(model_name: str = "all-MiniLM-L6-v2") -> Callable[[List[str]], np.ndarray]:
+    """Локальная модель sentence-transformers; загружается при первом вызове"""
+    model = None
+    lock = threading.Lock()
+
+    def embed(texts: List[str]) -> np.ndarray:
+        nonlocal model
+        with lock:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name, device="cpu")
+        return model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+    return embed
+
+
+class SemanticCache:
+    """Кэш ответов по смысловой близости вопросов.
+
+    Вопросы хранятся как нормированные эмбеддинги в одной матрице, поиск -
+    одно матричное умножение. Ответ возвращается, если косинусная близость
+    не ниже ``threshold``. Ответ зависит от контекста диалога, поэтому
+    запись находится только при том же ``context`` (отпечатке истории).
+    Записи живут ``ttl`` секунд; при заполнении вытесняется давно не
+    использованная. С ``path`` индекс сохраняется на диск (``.npz`` с
+    эмбеддингами и ``.json`` с ответами) и загружается при старте.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], np.ndarray],
+        threshold: float = 0.92,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+        path: Optional[str] = None,
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+
+        self._vectors: Optional[np.ndarray] = None
+        self._questions: List[str] = []
+        self._answers: List[str] = []
+        self._contexts: List[str] = []
+        self._created = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if path and os.path.exists(f"{path}.npz"):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def encode(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embed([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, text: str, vector: Optional[np.ndarray] = None,
+               context: str = "") -> Optional[Tuple[str, float]]:
+        """Ответ на самый близкий живой вопрос в том же контексте и его близость либо None"""
+        vector = self.encode(text) if vector is None else vector
+        now = time.time()
+        with self._lock:
+            best = None
+            if self._answers:
+                count = len(self._answers)
+                scores = self._vectors[:count] @ vector
+                scores[now - self._created[:count] > self.ttl] = -np.inf
+                scores[np.asarray(self._contexts) != context] = -np.inf
+                index = int(np.argmax(scores))
+                if scores[index] >= self.threshold:
+                    best = index, float(scores[index])
+            if best is None:
+                self.misses += 1
+                return None
+            index, similarity = best
+            self.hits += 1
+            self._last_used[index] = now
+            return self._answers[index], similarity
+
+    def add(self, text: str, answer: str, vector: Optional[np.ndarray] = None, context: str = ""):
+        vector = self.encode(text) if vector is None else vector
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            count = len(self._answers)
+            if count < self.max_entries:
+                index = count
+                self._questions.append(text)
+                self._answers.append(answer)
+                self._contexts.append(context)
+            else:
+                expired = np.flatnonzero(now - self._created > self.ttl)
+                if len(expired):
+                    index = int(expired[0])
+                    self.expirations += 1
+                else:
+                    index = int(np.argmin(self._last_used))
+                    self.evictions += 1
+                self._questions[index] = text
+                self._answers[index] = answer
+                self._contexts[index] = context
+            self._vectors[index] = vector
+            self._created[index] = now
+            self._last_used[index] = now
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._questions = []
+            self._answers = []
+            self._contexts = []
+            self._created[:] = 0
+            self._last_used[:] = 0
+
+    def save(self):
+        if not self.path or self._vectors is None:
+            return
+        with self._lock:
+            count = len(self._answers)
+            np.savez(f"{self.path}.npz", vectors=self._vectors[:count], created=self._created[:count])
+            with open(f"{self.path}.json", "w", encoding="utf-8") as f:
+                json.dump({"questions": self._questions, "answers": self._answers, "contexts": self._contexts},
+                          f, ensure_ascii=False)
+
+    def load(self):
+        arrays = np.load(f"{self.path}.npz")
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            texts = json.load(f)
+        count = min(len(texts["answers"]), self.max_entries)
+        with self._lock:
+            vectors = arrays["vectors"][:count]
+            self._vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+            self._vectors[:count] = vectors
+            self._questions = texts["questions"][:count]
+            self._answers = texts["answers"][:count]
+            self._contexts = texts.get("contexts", [""] * count)[:count]
+            self._created[:count] = arrays["created"][:count]
+            self._last_used[:count] = arrays["created"][:count]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    get_buffer_string,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.pydantic_v1 import Field, PrivateAttr
+
+WINDOW = "window"
+SUMMARY = "summary"
+
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая оценка числа токенов (~4 символа на токен) без токенизатора"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def extractive_summary(summary: str, messages: List[BaseMessage], max_tokens: int) -> str:
+    """Резюме без LLM: прежнее резюме плюс начало каждой реплики, обрезанное по бюджету"""
+    lines = [summary] if summary else []
+    lines += [f"{message.type}: {message.content[:200]}" for message in messages]
+    return "\n".join(lines)[-max_tokens * 4:]
+
+
+class SessionMemory(BaseMemory):
+    """Память одной сессии с ограничением по токенам.
+
+    Стратегия ``window`` хранит последние ``max_turns`` обменов и отбрасывает
+    старые, пока история не уложится в ``token_budget``. Стратегия ``summary``
+    сворачивает старые реплики в резюме через асинхронный ``summarizer``.
+    Он вызывается из ``asave_context`` вне блокировки, поэтому ``snapshot()``
+    других запросов сессии не ждет ответа LLM; синхронный ``save_context``
+    сворачивает реплики без LLM.
+    """
+
+    session_id: str
+    strategy: str = WINDOW
+    max_turns: int = 10
+    token_budget: int = 2000
+    messages: List[BaseMessage] = Field(default_factory=list)
+    summary: str = ""
+    summarizer: Optional[Callable[[str, List[BaseMessage]], Awaitable[str]]] = None
+    token_counter: Callable[[str], int] = estimate_tokens
+    on_change: Optional[Callable[["SessionMemory"], None]] = None
+    memory_key: str = "history"
+    last_used: float = Field(default_factory=time.monotonic)
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _folding: bool = PrivateAttr(default=False)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def token_count(self) -> int:
+        return self.token_counter(self.summary) + sum(self.token_counter(m.content) for m in self.messages)
+
+    @property
+    def buffer(self) -> str:
+        history = get_buffer_string(self.messages)
+        if self.summary:
+            return f"Краткое содержание предыдущего диалога: {self.summary}\n{history}"
+        return history
+
+    def snapshot(self) -> Tuple[str, List[BaseMessage]]:
+        """Резюме и копия сообщений для сборки запроса к модели"""
+        with self._lock:
+            return self.summary, list(self.messages)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            return {self.memory_key: self.buffer}
+
+    def _append(self, inputs: Dict[str, Any], outputs: Dict[str, str]):
+        user_input = inputs.get("input", next(iter(inputs.values()), ""))
+        response = outputs.get("response", next(iter(outputs.values()), ""))
+        self.messages.extend([HumanMessage(content=user_input), AIMessage(content=response)])
+
+    @property
+    def _summary_budget(self) -> int:
+        return max(self.token_budget // 2, 1)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        with self._lock:
+            self._append(inputs, outputs)
+            folded = self._trim()
+            if folded:
+                self._apply_summary(folded, extractive_summary(self.summary, folded, self._summary_budget))
+        if self.on_change:
+            self.on_change(self)
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        with self._lock:
+            self._append(inputs, outputs)
+            folded = self._trim()
+            summary = self.summary
+            self._folding = bool(folded)
+        if folded:
+            # LLM вызывается без блокировки: до подмены snapshot() видит
+            # прежнее резюме и еще не свернутые реплики
+            new_summary = None
+            try:
+                if self.summarizer:
+                    new_summary = await self.summarizer(summary, folded)
+                else:
+                    new_summary = extractive_summary(summary, folded, self._summary_budget)
+            finally:
+                with self._lock:
+                    self._folding = False
+                    if new_summary is not None:
+                        self._apply_summary(folded, new_summary)
+        if self.on_change:
+            await asyncio.to_thread(self.on_change, self)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.messages = []
+            self.summary = ""
+        if self.on_change:
+            self.on_change(self)
+
+    def _apply_summary(self, folded: List[BaseMessage], summary: str):
+        """Замена свернутых реплик резюме, если история не изменилась с начала свертки"""
+        if len(self.messages) < len(folded) or any(a is not b for a, b in zip(self.messages, folded)):
+            # Сессию очистили, пока шла свертка
+            return
+        del self.messages[:len(folded)]
+        self.summary = summary[-self._summary_budget * 4:]
+
+    def _trim(self) -> List[BaseMessage]:
+        """Удержание истории в пределах бюджета; последний обмен сохраняется всегда
+
+        Для стратегии ``summary`` возвращает старые реплики, которые нужно
+        свернуть в резюме; из истории их убирает ``_apply_summary``.
+        """
+        if self.strategy == SUMMARY:
+            if self._folding or self.token_count <= self.token_budget:
+                return []
+            # Свежие реплики занимают не больше половины бюджета, остальное - в резюме
+            keep, used = 2, sum(self.token_counter(m.content) for m in self.messages[-2:])
+            for message in reversed(self.messages[:-2]):
+                used += self.token_counter(message.content)
+                if used > self.token_budget // 2:
+                    break
+                keep += 1
+            return self.messages[:-keep]
+
+        del self.messages[:max(len(self.messages) - 2 * self.max_turns, 0)]
+        while len(self.messages) > 2 and self.token_count > self.token_budget:
+            del self.messages[:2]
+        return []
+
+
+class SQLiteSessionBackend:
+    """Хранение сессий в SQLite, чтобы история переживала вытеснение и рестарт"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    messages TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary, messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"summary": row[0], "messages": messages_from_dict(json.loads(row[1]))}
+
+    def save(self, memory: SessionMemory):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (memory.session_id, memory.summary,
+                 json.dumps(messages_to_dict(memory.messages), ensure_ascii=False), time.time())
+            )
+
+    def delete(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+class SessionStore:
+    """LRU-хранилище памяти сессий.
+
+    В оперативной памяти держится не больше ``max_sessions`` сессий; сессии,
+    простаивающие дольше ``idle_ttl`` секунд, и самые давние при переполнении
+    вытесняются. С ``backend`` вытесненная сессия загружается заново при
+    следующем обращении.
+    """
+
+    def __init__(
+        self,
+        strategy: str = WINDOW,
+        max_turns: int = 10,
+        token_budget: int = 2000,
+        max_sessions: int = 1000,
+        idle_ttl: float = 3600.0,
+        backend: Optional[SQLiteSessionBackend] = None,
+        summarizer: Optional[Callable[[str, List[BaseMessage]], Awaitable[str]]] = None,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        if strategy not in (WINDOW, SUMMARY):
+            raise ValueError(f"Неизвестная стратегия памяти: {strategy}")
+        self.strategy = strategy
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+
+        self._sessions: "OrderedDict[str, SessionMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> SessionMemory:
+        """Память сессии; создается или загружается из backend при первом обращении"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = self._create(session_id)
+                self._sessions[session_id] = memory
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            self._sessions.move_to_end(session_id)
+            memory.last_used = now
+            return memory
+
+    def _create(self, session_id: str) -> SessionMemory:
+        memory = SessionMemory(
+            session_id=session_id,
+            strategy=self.strategy,
+            max_turns=self.max_turns,
+            token_budget=self.token_budget,
+            summarizer=self.summarizer,
+            token_counter=self.token_counter,
+            on_change=self.backend.save if self.backend else None,
+        )
+        stored = self.backend.load(session_id) if self.backend else None
+        if stored:
+            memory.summary = stored["summary"]
+            memory.messages = stored["messages"]
+        return memory
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, memory = next(iter(self._sessions.items()))
+            if now - memory.last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.backend:
+            self.backend.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "strategy": self.strategy,
+                "token_budget": self.token_budget,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "persistent": self.backend is not None,
+            }
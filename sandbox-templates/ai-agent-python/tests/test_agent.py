@@ -1,40 +1,902 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
-from agent import app
 from unittest.mock import patch
 
+# Агент запускается с офлайн-провайдером на записанных ответах
+os.environ.update({
+    "LLM_PROVIDER": "fake",
+    "AGENT_FAKE_RECORDINGS": os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings.jsonl"),
+    "AGENT_FAKE_FIRST_TOKEN_MS": "0",
+    "AGENT_FAKE_TOKEN_MS": "0",
+})
+
+from agent import app
+from fake_llm import ReplayChatModel
+
 client = TestClient(app)
 
 def test_health_check():
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
-
-@patch('agent.OpenAI')
-def test_chat_endpoint(mock_openai):
-    mock_openai.return_value = "Formatted response\nwith code examples"
-    test_message = {"message": "Hello"}
-    
-    response = client.post("/chat", json=test_message)
+    assert response.json()["status"] == "ok"
+    assert response.json()["active_provider"] == "fake"
+
+def test_chat_endpoint():
+    response = client.post("/chat", params={"message": "Hello"})
     assert response.status_code == 200
     response_data = response.json()
     assert "response" in response_data
     assert "code" in response_data["response"].lower()
 
-@patch('agent.OpenAI')
-def test_multilingual_support(mock_openai):
-    mock_openai.return_value = "Ответ на русском"
-    response = client.post("/chat", json={"message": "Привет"})
+def test_multilingual_support():
+    response = client.post("/chat", params={"message": "Привет"})
     assert "русск" in response.json()["response"].lower()
 
 def test_error_handling_with_details():
-    with patch('agent.conversation.predict', side_effect=Exception("Test error")):
-        response = client.post("/chat", json={"message": "error"})
+    with patch.object(ReplayChatModel, "_agenerate", side_effect=Exception("Test error")):
+        response = client.post("/chat", params={"message": "error"})
         assert response.status_code == 500
         assert "type" in response.json()
 
 def test_error_handling():
-    with patch('agent.conversation.predict', side_effect=Exception("Test error")):
-        response = client.post("/chat", json={"message": "error"})
+    with patch.object(ReplayChatModel, "_agenerate", side_effect=Exception("Test error")):
+        response = client.post("/chat", params={"message": "error"})
         assert response.status_code == 500
-        assert "error" in response.json()
\ No newline at end of file
+        assert "error" in response.json()
+
+def fake_llm(responses):
+    """Детерминированная потоковая чат-модель вместо провайдера"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    return FakeListChatModel(responses=responses)
+
+def use_llm(*models):
+    """Подмена провайдеров роутера тестовыми моделями"""
+    from agent import provider_pool
+    from router import LLMRouter
+
+    return patch('agent.router', LLMRouter({f"fake-{i}": model for i, model in enumerate(models)}, provider_pool))
+
+def test_chat_stream_sse():
+    with use_llm(fake_llm(["Потоковый ответ"])):
+        response = client.post("/chat/stream", params={"message": "Привет"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[0].startswith("event: token")
+    assert events[-1].startswith("event: done")
+    assert '"time_to_first_token"' in events[-1]
+
+def test_chat_stream_ndjson_saves_history():
+    import json
+    from agent import sessions
+    with use_llm(fake_llm(["abc"])):
+        response = client.post("/chat/stream", params={"message": "Hi", "session_id": "stream"},
+                               headers={"Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert "".join(line["content"] for line in lines if line["type"] == "token") == "abc"
+    assert lines[-1]["type"] == "done"
+    assert "abc" in sessions.get("stream").buffer
+
+def test_chat_stream_ndjson_error_keeps_event_type():
+    import json
+    with use_llm(StubModel("сбой", fail=True)):
+        response = client.post("/chat/stream", params={"message": "Hi"}, headers={"Accept": "application/x-ndjson"})
+    event = json.loads(response.text.splitlines()[-1])
+    assert event["type"] == "error"
+    assert event["error_type"] == "RuntimeError"
+
+def test_chat_stream_without_llm():
+    with use_llm():
+        response = client.post("/chat/stream", params={"message": "Hi"})
+    assert response.status_code == 503
+
+def test_sessions_have_separate_history():
+    from agent import sessions
+    with use_llm(fake_llm(["ответ"])):
+        client.post("/chat", params={"message": "секрет alice", "session_id": "alice"})
+        client.post("/chat", params={"message": "вопрос bob", "session_id": "bob"})
+    assert "секрет alice" in sessions.get("alice").buffer
+    assert "секрет alice" not in sessions.get("bob").buffer
+
+def test_requests_without_session_id_do_not_share_history():
+    from agent import sessions
+    with use_llm(fake_llm(["ответ"])):
+        first = client.post("/chat", params={"message": "секрет анонима"}).json()["metadata"]["session_id"]
+        second = client.post("/chat", params={"message": "другой вопрос"}).json()["metadata"]["session_id"]
+        stream = client.post("/chat/stream", params={"message": "поток"})
+    assert first != second
+    assert "секрет анонима" in sessions.get(first).buffer
+    assert "секрет анонима" not in sessions.get(second).buffer
+    assert stream.headers["X-Session-Id"] not in (first, second)
+
+def test_window_memory_stays_within_budget():
+    from sessions import SessionMemory
+    memory = SessionMemory(session_id="s", max_turns=3, token_budget=50)
+    for i in range(20):
+        memory.save_context({"input": f"вопрос {i} " * 5}, {"response": f"ответ {i} " * 5})
+    assert len(memory.messages) <= 6
+    assert memory.token_count <= 50
+    assert "ответ 19" in memory.buffer
+
+def test_summary_memory_folds_old_turns():
+    import asyncio
+    from sessions import SUMMARY, SessionMemory
+    folded = []
+
+    async def summarizer(summary, messages):
+        folded.append(len(messages))
+        return f"резюме {len(folded)}"
+
+    memory = SessionMemory(session_id="s", strategy=SUMMARY, token_budget=60, summarizer=summarizer)
+
+    async def main():
+        for i in range(10):
+            await memory.asave_context({"input": "x" * 40}, {"response": "y" * 40})
+
+    asyncio.run(main())
+    assert folded
+    assert memory.summary.startswith("резюме")
+    assert memory.token_count <= 60 + memory.token_counter(memory.summary)
+
+def test_summarizer_runs_outside_session_lock():
+    import asyncio
+    from sessions import SUMMARY, SessionMemory
+
+    async def main():
+        in_summarizer, release = asyncio.Event(), asyncio.Event()
+
+        async def summarizer(summary, messages):
+            in_summarizer.set()
+            await release.wait()
+            return "резюме"
+
+        memory = SessionMemory(session_id="s", strategy=SUMMARY, token_budget=30, summarizer=summarizer)
+        memory.save_context({"input": "x" * 40}, {"response": "y" * 40})
+        saving = asyncio.create_task(memory.asave_context({"input": "x" * 40}, {"response": "y" * 40}))
+        await in_summarizer.wait()
+        # Пока LLM сворачивает историю, snapshot() не блокируется и видит ее целиком
+        summary, history = memory.snapshot()
+        release.set()
+        await saving
+        return summary, history, memory
+
+    summary, history, memory = asyncio.run(main())
+    assert len(history) == 4 and summary != "резюме"
+    assert memory.summary == "резюме" and len(memory.messages) == 2
+
+def test_session_store_lru_and_sqlite(tmp_path):
+    from sessions import SessionStore, SQLiteSessionBackend
+    store = SessionStore(max_sessions=2, backend=SQLiteSessionBackend(str(tmp_path / "sessions.db")))
+    store.get("a").save_context({"input": "привет"}, {"response": "здравствуйте"})
+    store.get("b")
+    store.get("c")
+    assert store.stats()["active_sessions"] == 2
+    assert store.evictions == 1
+    # Вытесненная сессия восстанавливается из SQLite
+    assert "здравствуйте" in store.get("a").buffer
+
+def test_system_prompt_sent_once_per_request():
+    from agent import SYSTEM_PROMPT, build_messages, sessions
+    with use_llm(fake_llm(["ответ"])):
+        for _ in range(3):
+            client.post("/chat", params={"message": "вопрос", "session_id": "system-once"})
+        messages = build_messages(sessions.get("system-once"), "еще вопрос")
+    assert messages[0].type == "system"
+    assert sum(SYSTEM_PROMPT in str(message.content) for message in messages) == 1
+    assert len(messages) == 1 + 3 * 2 + 1
+
+def test_anthropic_system_prompt_is_cacheable():
+    from langchain_anthropic import ChatAnthropic
+    from langchain_anthropic.chat_models import _format_messages
+    from agent import SYSTEM_PROMPT, build_messages, sessions
+    anthropic = ChatAnthropic(model="claude-3-opus-20240229", anthropic_api_key="test")
+    system, _ = _format_messages(build_messages(sessions.get("anthropic"), "Привет", anthropic))
+    assert system[0]["text"] == SYSTEM_PROMPT
+    assert system[0]["cache_control"] == {"type": "ephemeral"}
+
+def test_chat_reports_token_usage():
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    reply = AIMessage(
+        content="ok",
+        usage_metadata={"input_tokens": 120, "output_tokens": 5, "total_tokens": 125},
+        response_metadata={"usage": {"cache_read_input_tokens": 100}}
+    )
+    with use_llm(GenericFakeChatModel(messages=iter([reply]))):
+        response = client.post("/chat", params={"message": "Hi", "session_id": "usage"})
+    usage = response.json()["metadata"]["usage"]
+    assert usage["input_tokens"] == 120
+    assert usage["cache_read_tokens"] == 100
+
+def test_provider_pool_limits_concurrency():
+    import asyncio
+    from pool import ProviderPool
+    pool = ProviderPool(concurrency={"openai": 2})
+    peak = []
+
+    async def call():
+        async with pool.slot("openai"):
+            peak.append(pool.stats()["openai"]["in_flight"])
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+        await pool.aclose()
+
+    asyncio.run(main())
+    assert max(peak) == 2
+
+def test_provider_pool_timeout_does_not_block():
+    import asyncio
+    from pool import ProviderPool
+    pool = ProviderPool(timeout=0.05)
+
+    async def main():
+        slow = pool.run("groq", asyncio.sleep(5))
+        fast = asyncio.sleep(0.01, result="fast")
+        return await asyncio.gather(slow, fast, return_exceptions=True)
+
+    slow, fast = asyncio.run(main())
+    assert isinstance(slow, asyncio.TimeoutError)
+    assert fast == "fast"
+    assert pool.timeouts["groq"] == 1
+
+def test_provider_pool_stream_timeout_is_per_chunk():
+    import asyncio
+    from pool import ProviderPool
+    pool = ProviderPool(timeout=0.05, stream_timeout=1.0)
+
+    async def chunks(gaps):
+        for gap in gaps:
+            await asyncio.sleep(gap)
+            yield gap
+
+    async def consume(gaps, pause=0.0):
+        received = []
+        async for chunk in pool.stream("openai", chunks(gaps)):
+            received.append(chunk)
+            # Медленный потребитель не расходует таймаут провайдера
+            await asyncio.sleep(pause)
+        return received
+
+    # Длинный ответ с короткими паузами дочитывается целиком
+    assert len(asyncio.run(consume([0.01] * 15, pause=0.01))) == 15
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(consume([0.01, 0.2]))
+    pool.stream_timeout = 0.05
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(consume([0.02] * 5))
+    assert pool.timeouts["openai"] == 2
+
+def test_chat_timeout_returns_504():
+    import asyncio
+    from unittest.mock import AsyncMock, MagicMock
+    async def slow(messages):
+        await asyncio.sleep(5)
+
+    slow_llm = MagicMock()
+    slow_llm.ainvoke = AsyncMock(side_effect=slow)
+    with use_llm(slow_llm), patch('agent.provider_pool.timeout', 0.05):
+        response = client.post("/chat", params={"message": "Hi", "session_id": "timeout"})
+    assert response.status_code == 504
+    assert "error" in response.json()
+
+class StubModel:
+    """Офлайн-провайдер с заданной задержкой и ошибками"""
+
+    def __init__(self, reply="ok", delay=0.0, fail=False):
+        self.reply = reply
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        import asyncio
+        from langchain_core.messages import AIMessage
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.reply} недоступен")
+        return AIMessage(content=self.reply)
+
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+        message = await self.ainvoke(messages)
+        for token in message.content:
+            yield AIMessageChunk(content=token)
+
+def run_router(router, times=1):
+    import asyncio
+
+    async def main():
+        return [await router.ainvoke(lambda model: []) for _ in range(times)]
+
+    return asyncio.run(main())
+
+def test_router_fails_over_on_errors():
+    from pool import ProviderPool
+    from router import LLMRouter
+    broken, backup = StubModel("openai", fail=True), StubModel("groq")
+    router = LLMRouter({"openai": broken, "groq": backup}, ProviderPool(), failure_threshold=2)
+    results = run_router(router, times=3)
+    assert [provider for _, provider in results] == ["groq"] * 3
+    # Провайдер с высокой долей ошибок уходит в конец очереди
+    assert broken.calls == 1
+    assert router.failovers == 1
+    assert router.ranked() == ["groq", "openai"]
+    # Без резерва ошибки подряд размыкают выключатель
+    router.providers.pop("groq")
+    with pytest.raises(RuntimeError):
+        run_router(router)
+    assert not router.stats()["providers"]["openai"]["healthy"]
+
+def test_history_summary_goes_through_router():
+    import asyncio
+    from langchain_core.messages import HumanMessage
+    from agent import summarize_history
+    broken, backup = StubModel("основной", fail=True), StubModel("резюме")
+    with use_llm(broken, backup) as router:
+        summary = asyncio.run(summarize_history("", [HumanMessage(content="вопрос")]))
+    # Сбой основного провайдера не ломает сворачивание истории
+    assert summary == "резюме"
+    assert broken.calls == 1 and router.failovers == 1
+
+def test_router_demoted_provider_recovers_after_error_window():
+    import time
+    from pool import ProviderPool
+    from router import LLMRouter
+    flaky, backup = StubModel("openai", fail=True), StubModel("groq")
+    router = LLMRouter({"openai": flaky, "groq": backup}, ProviderPool(), error_window=0.05)
+    run_router(router)
+    assert router.ranked() == ["groq", "openai"]
+    # Ошибки стареют без трафика: провайдер возвращается в ротацию
+    time.sleep(0.06)
+    flaky.fail = False
+    assert router.ranked()[0] == "openai"
+    assert [provider for _, provider in run_router(router)] == ["openai"]
+
+def test_router_stream_latency_excludes_queue_wait():
+    import asyncio
+    from admission import Ticket
+    from pool import ProviderPool
+    from router import LLMRouter
+    pool = ProviderPool(concurrency={"openai": 1})
+    router = LLMRouter({"openai": StubModel("ok")}, pool)
+    ticket = Ticket()
+
+    async def main():
+        async def hold():
+            async with pool.slot("openai"):
+                await asyncio.sleep(0.1)
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        chunks = [chunk async for _, chunk in router.astream(lambda model: [], ticket)]
+        await holder
+        return chunks
+
+    assert len(asyncio.run(main())) == 2
+    assert ticket.queue_wait >= 0.09
+    assert router.health["openai"].percentile(0.5) < 0.05
+
+def test_router_prefers_fastest_provider():
+    from pool import ProviderPool
+    from router import LLMRouter
+    slow, fast = StubModel("slow", delay=0.03), StubModel("fast", delay=0.001)
+    router = LLMRouter({"slow": slow, "fast": fast}, ProviderPool())
+    results = run_router(router, times=4)
+    # Каждый провайдер сначала получает пробный запрос, затем выбирается быстрый
+    assert [provider for _, provider in results] == ["slow", "fast", "fast", "fast"]
+
+def test_router_hedges_slow_requests():
+    from pool import ProviderPool
+    from router import LLMRouter
+    primary, backup = StubModel("primary", delay=1.0), StubModel("backup", delay=0.01)
+    router = LLMRouter({"primary": primary, "backup": backup}, ProviderPool(),
+                       hedge=True, hedge_min_samples=3)
+    router.health["primary"].latencies.extend([0.01] * 3)
+    router.health["backup"].latencies.extend([0.02] * 3)
+    # Основной провайдер превысил свою p95 - отвечает резервный
+    (result, provider), = run_router(router)
+    assert provider == "backup"
+    assert result.content == "backup"
+    assert router.hedged == 1
+    assert router.hedge_wins == 1
+
+def test_router_cancels_hedged_attempts_with_caller():
+    import asyncio
+    from admission import Ticket
+    from pool import ProviderPool
+    from router import LLMRouter
+    primary, backup = StubModel("primary", delay=5), StubModel("backup", delay=5)
+    router = LLMRouter({"primary": primary, "backup": backup}, ProviderPool(),
+                       hedge=True, hedge_min_samples=3)
+    router.health["primary"].latencies.extend([0.01] * 3)
+    router.health["backup"].latencies.extend([0.02] * 3)
+
+    async def main():
+        call = asyncio.ensure_future(router.ainvoke(lambda model: [], Ticket()))
+        await asyncio.sleep(0.1)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.01)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    # Обе попытки отменены вместе с вызывающим и не считаются ошибками провайдеров
+    assert asyncio.run(main()) == []
+    assert router.hedged == 1
+    assert primary.calls == backup.calls == 1
+    assert router.health["primary"].errors == router.health["backup"].errors == 0
+
+def test_chat_stream_fails_over_before_first_token():
+    with use_llm(StubModel("первый", fail=True), StubModel("второй")):
+        response = client.post("/chat/stream", params={"message": "Привет", "session_id": "stream-failover"},
+                               headers={"Accept": "application/x-ndjson"})
+    import json
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert "".join(event["content"] for event in events if event["type"] == "token") == "второй"
+    assert events[-1]["metadata"]["provider"] == "fake-1"
+
+def word_embedder(texts):
+    """Офлайн-эмбеддинги: мешок слов вместо sentence-transformers"""
+    import zlib
+    import numpy as np
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().replace("?", "").split():
+            vectors[row, zlib.crc32(word.encode()) % 64] += 1
+    return vectors
+
+def test_semantic_cache_matches_near_duplicates(tmp_path):
+    from semantic_cache import SemanticCache
+    cache = SemanticCache(word_embedder, threshold=0.8, max_entries=2, path=str(tmp_path / "cache"))
+    cache.add("как установить pandas", "pip install pandas")
+    answer, similarity = cache.lookup("как установить pandas?")
+    assert answer == "pip install pandas"
+    assert similarity > 0.99
+    assert cache.lookup("что такое docker") is None
+
+    # Переполнение вытесняет давно не использованную запись
+    cache.add("что такое docker", "контейнеры")
+    cache.lookup("как установить pandas")
+    cache.add("что такое kubernetes", "оркестратор")
+    assert cache.evictions == 1
+    assert cache.lookup("что такое docker") is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+    cache.save()
+    restored = SemanticCache(word_embedder, threshold=0.8, max_entries=2, path=str(tmp_path / "cache"))
+    assert restored.lookup("что такое kubernetes")[0] == "оркестратор"
+
+    # Просроченные записи не возвращаются
+    restored.ttl = 0
+    assert restored.lookup("что такое kubernetes") is None
+
+def test_chat_serves_repeated_question_from_semantic_cache():
+    from semantic_cache import SemanticCache
+    cache = SemanticCache(word_embedder, threshold=0.9)
+    model = StubModel("pip install pandas")
+    with use_llm(model), patch('agent.semantic_cache', cache):
+        first = client.post("/chat", params={"message": "как установить pandas", "session_id": "cache-1"})
+        second = client.post("/chat", params={"message": "Как установить pandas?", "session_id": "cache-2"})
+        # Вопрос с историей зависит от контекста и в кэш не идет
+        third = client.post("/chat", params={"message": "как установить pandas", "session_id": "cache-1"})
+    assert first.json()["metadata"]["cached"] is False
+    assert second.json()["metadata"]["cached"] is True
+    assert second.json()["response"] == "pip install pandas"
+    assert third.json()["metadata"]["cached"] is False
+    assert model.calls == 2
+
+def test_semantic_cache_serves_consecutive_anonymous_callers():
+    from semantic_cache import SemanticCache
+    cache = SemanticCache(word_embedder, threshold=0.9)
+    model = StubModel("pip install pandas")
+    with use_llm(model), patch('agent.semantic_cache', cache):
+        first = client.post("/chat", params={"message": "как установить pandas"})
+        second = client.post("/chat", params={"message": "как установить pandas"})
+    assert first.json()["metadata"]["cached"] is False
+    assert second.json()["metadata"]["cached"] is True
+    assert model.calls == 1
+
+def test_structured_logs_are_rendered_off_the_request_path():
+    import io
+    import json
+    import logging
+    import structlog
+    from logs import configure_logging, stop_listener
+    root = logging.getLogger()
+    handlers = root.handlers
+    stream = io.StringIO()
+    listener = configure_logging(stream=stream)
+    try:
+        structlog.get_logger("test").info("Запрос обработан", session_id="s1", processing_time=0.5)
+        stop_listener(listener)
+    finally:
+        root.handlers = handlers
+    record = json.loads(stream.getvalue())
+    assert record["event"] == "Запрос обработан"
+    assert record["session_id"] == "s1"
+    assert record["level"] == "info"
+    assert "timestamp" in record
+
+def test_log_content_is_sampled_and_truncated():
+    from agent import content_fields
+    with patch('agent.LOG_SAMPLE_RATE', 0.0):
+        assert content_fields(message="секрет") == {}
+    with patch('agent.LOG_SAMPLE_RATE', 1.0), patch('agent.LOG_MAX_CHARS', 5):
+        fields = content_fields(message="очень длинный вопрос")
+    assert fields["message"].startswith("очень...")
+
+def test_dashboard_percentiles_ignore_errors_and_stay_bounded():
+    from dashboard import AgentDashboard
+    dashboard = AgentDashboard(window=100)
+    for i in range(1, 301):
+        dashboard.update_stats(True, i / 100, "openai" if i % 2 else "groq")
+    dashboard.update_stats(False, 30.0, "groq")
+    snapshot = dashboard.snapshot()
+    # В окне только последние 100 замеров, ошибки не влияют на время
+    assert len(dashboard.metrics.latency.values()) == 100
+    assert snapshot["latency"]["p50"] == 2.51
+    assert snapshot["latency"]["p99"] == 3.0
+    assert snapshot["errors"] == 1
+    assert snapshot["providers"]["groq"] == {"requests": 151, "errors": 1, "p50": 2.76, "p95": 2.98, "p99": 3.0}
+    assert snapshot["rps_10s"] == 30.1
+
+def test_rate_window_slides():
+    from metrics import RateWindow
+    window = RateWindow(horizon=60)
+    for second in range(100, 130):
+        window.record(second)
+    assert window.rate(10, now=129) == 1.0
+    assert window.rate(60, now=129) == 0.5
+    assert window.rate(10, now=200) == 0.0
+
+def test_dashboard_shows_real_log_records():
+    import logging
+    import structlog
+    from dashboard import AgentDashboard
+    dashboard = AgentDashboard(log_lines=2)
+    logger = logging.getLogger("dashboard-test")
+    logger.propagate = False
+    dashboard.attach_logs(logger)
+    for i in range(3):
+        structlog.get_logger("dashboard-test").info("Запрос обработан", request=i)
+    lines = dashboard.logs()
+    assert len(lines) == 2
+    assert "Запрос обработан request=2" in lines[-1]
+    dashboard.generate_layout()
+
+def test_metrics_channel_aggregates_workers():
+    import os
+    import uuid
+    from dashboard import AgentDashboard
+    from metrics import MetricsChannel
+    name = f"agent-metrics-test-{uuid.uuid4().hex[:8]}"
+    channel = MetricsChannel(name, slots=2)
+    try:
+        # Два воркера пишут в свои слоты, процесс дашборда читает сводку
+        first = channel.publisher(os.getpid())
+        second = MetricsChannel(name).publisher(os.getppid())
+        first.record_request(True, 0.1, "openai")
+        second.record_request(True, 0.3, "groq")
+        second.record_request(False, 5.0, "groq")
+        second.record_usage({"input_tokens": 10})
+        with pytest.raises(RuntimeError):
+            channel.publisher(1)
+
+        snapshot = AgentDashboard(channel=MetricsChannel(name), publish=False).snapshot()
+        assert snapshot["workers"] == 2
+        assert snapshot["total_requests"] == 3
+        assert snapshot["errors"] == 1
+        assert snapshot["input_tokens"] == 10
+        assert snapshot["latency"]["p99"] == 0.3
+        assert snapshot["providers"]["groq"]["errors"] == 1
+
+        channel.release(second)
+        assert channel.workers()[0].pid[0] == os.getpid()
+    finally:
+        channel.unlink()
+
+def test_external_dashboard_shows_worker_logs():
+    import logging
+    import uuid
+    from dashboard import AgentDashboard
+    from metrics import LOG_LINES, MetricsChannel
+    name = f"agent-metrics-test-{uuid.uuid4().hex[:8]}"
+    channel = MetricsChannel(name, slots=2)
+    try:
+        # Воркер пишет логи в свой слот, отдельный дашборд читает их из общей памяти
+        worker = AgentDashboard(channel=channel)
+        logger = logging.getLogger("dashboard-channel-test")
+        logger.propagate = False
+        worker.attach_logs(logger)
+        for i in range(LOG_LINES + 5):
+            logger.info("Запрос %d обработан", i)
+
+        external = AgentDashboard(channel=MetricsChannel(name), publish=False)
+        external.attach_logs(logger)
+        lines = external.logs()
+        assert len(lines) == LOG_LINES
+        assert lines[-1].endswith(f"Запрос {LOG_LINES + 4} обработан")
+        assert "logs" in external.refresh()
+        assert "Нет записей" not in str(external.layout["logs"].renderable.renderable)
+    finally:
+        channel.unlink()
+
+def test_dashboard_redraws_only_changed_regions():
+    from dashboard import AgentDashboard
+    dashboard = AgentDashboard()
+    assert dashboard.refresh(now=1000.0) == ["header", "requests", "logs", "footer"]
+    assert dashboard.refresh(now=1000.5) == []
+
+    dashboard.update_stats(True, 0.2, "openai")
+    now = float(dashboard.metrics.last_request[0])
+    assert dashboard.refresh(now=now) == ["requests"]
+    # RPS за окно убывает и без новых запросов, пока окно не опустеет
+    assert dashboard.refresh(now=now + 1) == ["requests"]
+    dashboard.refresh(now=now + 61)
+    assert dashboard.refresh(now=now + 62) == []
+
+    dashboard.log_handler.emit(logging_record("Запрос обработан"))
+    assert dashboard.refresh(now=now + 63) == ["logs"]
+
+def logging_record(message):
+    import logging
+    return logging.LogRecord("agent", logging.INFO, __file__, 0, message, None, None)
+
+def test_dashboard_headless_emits_json_lines():
+    import io
+    import json
+    from dashboard import AgentDashboard
+    dashboard = AgentDashboard()
+    dashboard.update_stats(True, 0.5, "groq")
+    stream = io.StringIO()
+    dashboard.run_headless(stream, interval=0, iterations=3)
+    lines = stream.getvalue().splitlines()
+    # Неизменившиеся снимки не повторяются
+    assert len(lines) == 1
+    snapshot = json.loads(lines[0])
+    assert snapshot["total_requests"] == 1
+    assert snapshot["providers"]["groq"]["p50"] == 0.5
+
+def test_import_does_not_load_provider_sdks():
+    import import_profile
+    report = import_profile.build_report(import_profile.profile_imports())
+    assert report["forbidden_loaded"] == []
+    assert report["top_modules"][0]["module"] == "agent"
+
+def test_lazy_model_is_built_on_first_use():
+    from pool import ProviderPool
+    from router import LazyModel, LLMRouter
+    created = []
+    lazy = LazyModel(lambda: created.append(1) or StubModel("ok"))
+    router = LLMRouter({"lazy": lazy}, ProviderPool())
+    assert not lazy.loaded and router.stats()["order"] == ["lazy"]
+    (result, provider), _ = run_router(router, times=2)
+    assert (result.content, provider) == ("ok", "lazy")
+    assert created == [1]
+
+def test_concurrent_identical_requests_share_one_call():
+    import asyncio
+    import httpx
+    model = StubModel("Общий ответ", delay=0.1)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as http:
+            messages = [("Привет", "flight-1"), ("  привет ", "flight-2"), ("ПРИВЕТ", "flight-3"), ("Пока", "flight-4")]
+            return await asyncio.gather(*(
+                http.post("/chat", params={"message": message, "session_id": session})
+                for message, session in messages
+            ))
+
+    with use_llm(model):
+        from agent import single_flight
+        before = single_flight.stats()
+        responses = asyncio.run(burst())
+        after = single_flight.stats()
+    assert [response.json()["response"] for response in responses] == ["Общий ответ"] * 4
+    assert [response.json()["metadata"]["coalesced"] for response in responses] == [False, True, True, False]
+    assert model.calls == 2
+    assert after["coalesced"] - before["coalesced"] == 2
+    assert after["in_flight"] == 0
+
+def test_single_flight_shares_errors_and_releases_key():
+    import asyncio
+    from coalesce import SingleFlight
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def main():
+        results = await asyncio.gather(*(flight.run("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        # После завершения ключ свободен: следующий запрос снова идет к провайдеру
+        await asyncio.gather(flight.run("key", failing), return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert flight.stats() == {"in_flight": 0, "calls": 2, "coalesced": 2, "coalesced_rate": 0.5}
+
+def test_priority_limiter_orders_waiters_and_enforces_deadlines():
+    import asyncio
+    import time
+    from admission import AdmissionRejected, PriorityLimiter
+    limiter = PriorityLimiter(limit=1, max_queue=4)
+    order = []
+
+    async def worker(name, priority, timeout=1.0):
+        await limiter.acquire(priority, time.monotonic() + timeout)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def main():
+        await limiter.acquire()
+        tasks = [asyncio.ensure_future(worker(name, priority)) for name, priority in
+                 [("low", 2), ("normal", 1), ("high", 0)]]
+        expired = asyncio.ensure_future(worker("expired", 0, timeout=0.02))
+        await asyncio.sleep(0)
+        # Очередь заполнена - отказ без ожидания
+        with pytest.raises(AdmissionRejected) as full:
+            await limiter.acquire()
+        await asyncio.sleep(0.05)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        with pytest.raises(AdmissionRejected):
+            await expired
+        return full.value
+
+    full = asyncio.run(main())
+    assert order == ["high", "normal", "low"]
+    assert (full.status_code, full.reason) == (503, "queue_full")
+    assert limiter.stats()["rejected"] == {"queue_full": 1, "deadline": 1}
+    assert limiter.stats()["in_flight"] == 0 and limiter.stats()["queued"] == 0
+
+def test_chat_rate_limits_each_client():
+    from admission import ClientLimiter
+    with use_llm(StubModel("ok")), patch('agent.client_limiter', ClientLimiter(rate=0.01, burst=2)):
+        statuses = [
+            client.post("/chat", params={"message": f"q{i}", "session_id": "bucket"},
+                        headers={"X-Client-Id": "widget"}).status_code
+            for i in range(3)
+        ]
+        other = client.post("/chat", params={"message": "q", "session_id": "bucket-2"},
+                            headers={"X-Client-Id": "other"})
+        limited = client.post("/chat", params={"message": "q3", "session_id": "bucket"},
+                              headers={"X-Client-Id": "widget"})
+    assert statuses == [200, 200, 429]
+    assert other.status_code == 200
+    assert limited.json()["metadata"]["reason"] == "rate_limited"
+    assert int(limited.headers["retry-after"]) >= 1
+
+def test_chat_reports_queue_wait_and_sheds_expired_requests():
+    import asyncio
+    import httpx
+    from pool import ProviderPool
+    from router import LLMRouter
+    model = StubModel("ok", delay=0.2)
+    router = LLMRouter({"slow": model}, ProviderPool(concurrency={"slow": 1}))
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as http:
+            requests = [("first", {}), ("impatient", {"X-Queue-Timeout-Ms": "50"}), ("patient", {})]
+            return await asyncio.gather(*(
+                http.post("/chat", params={"message": message, "session_id": f"queue-{message}"}, headers=headers)
+                for message, headers in requests
+            ))
+
+    with patch('agent.router', router):
+        first, impatient, patient = asyncio.run(burst())
+    assert first.status_code == 200 and patient.status_code == 200
+    assert impatient.status_code == 503
+    assert impatient.json()["metadata"]["reason"] == "deadline"
+    metadata = patient.json()["metadata"]
+    assert metadata["queue_wait"] >= 0.15
+    assert metadata["llm_time"] < metadata["processing_time"] - 0.15
+    # Отказ в допуске не считается ошибкой провайдера
+    assert router.stats()["providers"]["slow"]["errors"] == 0
+    assert model.calls == 2
+
+def test_replay_model_streams_recorded_answers_with_latency(tmp_path):
+    import asyncio
+    import json
+    import time
+    from fake_llm import ReplayChatModel
+    recordings = tmp_path / "recordings.jsonl"
+    recordings.write_text(json.dumps({"prompt": "Как дела?", "response": "Все отлично, спасибо"},
+                                     ensure_ascii=False) + "\n", encoding="utf-8")
+    model = ReplayChatModel.from_file(str(recordings), first_token_latency=0.05, token_latency=0.01)
+
+    async def main():
+        started = time.perf_counter()
+        chunks = [chunk async for chunk in model.astream("  как ДЕЛА? ")]
+        return chunks, time.perf_counter() - started
+
+    chunks, elapsed = asyncio.run(main())
+    assert "".join(chunk.content for chunk in chunks) == "Все отлично, спасибо"
+    assert len(chunks) == 4 and chunks[-1].usage_metadata["output_tokens"] == 3
+    assert elapsed >= 0.07
+    # Незаписанный вопрос детерминированно получает одну из записей
+    assert model.invoke("Другой вопрос").content == "Все отлично, спасибо"
+
+def test_recorded_provider_replays_through_init_llm(tmp_path, monkeypatch):
+    import asyncio
+    import agent
+    from fake_llm import RecordingModel
+    from pool import ProviderPool
+    from router import LazyModel, LLMRouter
+    path = str(tmp_path / "recorded.jsonl")
+    recorder = RecordingModel(StubModel("Записанный ответ"), path)
+    asyncio.run(recorder.ainvoke(agent.build_messages(agent.sessions.get("record"), "Вопрос для записи")))
+
+    monkeypatch.setenv("AGENT_FAKE_RECORDINGS", path)
+    monkeypatch.setenv("AGENT_FAKE_FIRST_TOKEN_MS", "0")
+    monkeypatch.setenv("AGENT_FAKE_TOKEN_MS", "0")
+    fake = LazyModel(lambda: agent.init_llm(agent.LLMProvider.FAKE))
+    with patch('agent.router', LLMRouter({"fake": fake}, ProviderPool())):
+        response = client.post("/chat", params={"message": "вопрос для записи", "session_id": "replay"})
+        stream = client.post("/chat/stream", params={"message": "Вопрос для записи", "session_id": "replay-2"},
+                             headers={"Accept": "application/x-ndjson"})
+    metadata = response.json()["metadata"]
+    assert response.json()["response"] == "Записанный ответ"
+    assert (metadata["provider"], metadata["model"]) == ("fake", "replay")
+    assert metadata["usage"]["output_tokens"] == 2
+    assert '"type": "done"' in stream.text and "Записанный" in stream.text
+
+def batch_events(response):
+    import json
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+def test_chat_batch_streams_results_and_isolates_errors():
+    from unittest.mock import MagicMock
+
+    async def answer(messages):
+        from langchain_core.messages import AIMessage
+        import asyncio
+        question = messages[-1].content
+        if question == "сломайся":
+            raise RuntimeError("provider error")
+        await asyncio.sleep(0.01 * len(question))
+        return AIMessage(content=question.upper())
+
+    model = MagicMock()
+    model.ainvoke = answer
+    prompts = ["ccc", "сломайся", "a", "bb"]
+    with use_llm(model):
+        response = client.post("/chat/batch", json={"prompts": prompts, "concurrency": 4})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = batch_events(response)
+    results = [event for event in events if event["type"] == "result"]
+    # Результаты приходят по мере готовности, индекс связывает их с вопросами
+    assert [event["index"] for event in results] == [2, 3, 0]
+    assert {event["index"]: event["response"] for event in results} == {0: "CCC", 2: "A", 3: "BB"}
+    errors = [event for event in events if event["type"] == "error"]
+    assert [(event["index"], event["error_type"]) for event in errors] == [(1, "RuntimeError")]
+    assert events[-1]["type"] == "done"
+    assert events[-1]["metadata"]["succeeded"] == 3 and events[-1]["metadata"]["failed"] == 1
+    assert events[-1]["metadata"]["status"] == "partial"
+
+def test_batch_charges_client_limit_per_prompt():
+    from admission import ClientLimiter
+    limiter = ClientLimiter(rate=0.01, burst=5)
+    with use_llm(StubModel("ok")), patch('agent.client_limiter', limiter):
+        headers = {"X-Client-Id": "batcher"}
+        too_large = client.post("/chat/batch", json={"prompts": ["q"] * 6}, headers=headers)
+        first = client.post("/chat/batch", json={"prompts": ["q"] * 4}, headers=headers)
+        # Осталось меньше токенов, чем вопросов во втором пакете
+        second = client.post("/chat/batch", json={"prompts": ["q"] * 2}, headers=headers)
+        single = client.post("/chat", params={"message": "q", "session_id": "batcher"}, headers=headers)
+    assert too_large.status_code == 400
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert single.status_code == 200
@@ -4,26 +4,42 @@ Production-ready ML model deployment with monitoring and experiment tracking
 """
 
 import asyncio
+import io
+import json
 import logging
 import os
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 import joblib
 import mlflow
 import numpy as np
 import pandas as pd
-from evidently.report import Report
-from evidently.metric_suite import DataDriftSuite
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, validator
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, classification_report
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from pydantic import BaseModel, ConfigDict, Field, model_validator, validator
 import structlog
 
+from batching import BATCH_SIZE_BUCKETS, MicroBatcher, predict_with_confidence
+from cache import PredictionCache
+from compiled import CompilationMismatch, CompiledForest, UnsupportedModel, compile_forest
+from drift import REFERENCE_ARTIFACT, DriftReportCache, StreamingDriftMonitor, build_drift_report
+from executors import BoundedPool, PoolSaturated
+from jobs import JobManager, JobStore
+from metrics import MetricsRegistry, PrometheusMiddleware
+from registry import LATEST, ModelNotFound, ModelRegistry
+from training import fit_and_log_model, generate_sample_data
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC payloads for /predict/batch are optional
+    pa = None
+
 # Configure structured logging
 structlog.configure(
     processors=[
@@ -53,6 +69,37 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Prometheus metrics; counters and histograms are sharded per thread so the
+# /predict hot path never contends on a lock
+metrics = MetricsRegistry()
+request_latency = metrics.histogram(
+    "mlops_http_request_duration_seconds", "HTTP request latency", ["endpoint", "method"]
+)
+http_errors = metrics.counter(
+    "mlops_http_errors", "HTTP responses with status >= 400", ["endpoint", "status"]
+)
+predictions_total = metrics.counter("mlops_predictions", "Rows predicted")
+inference_latency = metrics.histogram(
+    "mlops_model_inference_seconds", "Model predict_proba time per call"
+)
+validation_latency = metrics.histogram(
+    "mlops_request_validation_seconds", "Pydantic validation time per prediction request"
+)
+model_compilations = metrics.counter(
+    "mlops_model_compilations_total", "Forest compilation attempts at model load", ["outcome"]
+)
+started_at = time.monotonic()
+model_load_seconds = 0.0
+
+def timed_predict(model, features: np.ndarray):
+    """predict_with_confidence with inference timing and prediction counting"""
+    with inference_latency.time():
+        result = predict_with_confidence(model, features)
+    predictions_total.inc(len(features))
+    return result
+
+app.add_middleware(PrometheusMiddleware, latency=request_latency, errors=http_errors)
+
 # CORS middleware for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -63,9 +110,102 @@ app.add_middleware(
 )
 
 # Global variables for model and data
-current_model = None
+serving_model = (None, None)  # (model, registry version), always swapped as one tuple
 reference_data = None
 model_metrics = {}
+model_lock = threading.Lock()  # Serializes hot-swaps of the globals above
+
+# How often a worker checks the registry for a ``latest`` published by another worker
+MODEL_REFRESH_S = float(os.getenv("MLOPS_MODEL_REFRESH_S", "2"))
+last_model_refresh = 0.0
+
+# Streaming drift monitoring of live /predict traffic
+DRIFT_BINS = int(os.getenv("MLOPS_DRIFT_BINS", "10"))
+DRIFT_RESERVOIR_SIZE = int(os.getenv("MLOPS_DRIFT_RESERVOIR_SIZE", "2000"))
+DRIFT_PSI_THRESHOLD = float(os.getenv("MLOPS_DRIFT_PSI_THRESHOLD", "0.2"))
+DRIFT_REPORT_INTERVAL_S = float(os.getenv("MLOPS_DRIFT_REPORT_INTERVAL_S", "300"))
+DRIFT_MIN_SAMPLES = int(os.getenv("MLOPS_DRIFT_MIN_SAMPLES", "100"))
+drift_monitor: Optional[StreamingDriftMonitor] = None
+drift_reports = DriftReportCache(DRIFT_REPORT_INTERVAL_S, DRIFT_MIN_SAMPLES)
+
+# Opt-in compilation of forests to the vectorized NumPy inference path
+COMPILE_FORESTS = os.getenv("MLOPS_COMPILE_FORESTS", "false").lower() == "true"
+
+def prepare_model(model):
+    """Compile a loaded forest when enabled, keeping sklearn if the self-check fails"""
+    if not COMPILE_FORESTS or model is None:
+        return model
+    started = time.perf_counter()
+    try:
+        compiled = compile_forest(model)
+    except UnsupportedModel as e:
+        model_compilations.labels("unsupported").inc()
+        logger.info("Model not compiled", reason=str(e))
+        return model
+    except CompilationMismatch as e:
+        model_compilations.labels("mismatch").inc()
+        logger.warning("Compiled model failed self-check, serving sklearn", error=str(e))
+        return model
+    model_compilations.labels("compiled").inc()
+    logger.info("Model compiled", trees=compiled.n_trees, nodes=compiled.node_count,
+                compile_seconds=time.perf_counter() - started)
+    return compiled
+
+# Versioned model registry shared by all workers on the box
+MODELS_DIR = os.getenv("MLOPS_MODELS_DIR", "/home/user/models")
+model_registry = ModelRegistry(
+    MODELS_DIR,
+    memory_budget_bytes=int(os.getenv("MLOPS_MODEL_MEMORY_BUDGET_MB", "1024")) * 1024 ** 2,
+    prepare=prepare_model,
+)
+
+# Executor pools: threads for inference, processes for training and drift
+PROCESS_START_METHOD = os.getenv("MLOPS_PROCESS_START_METHOD", "spawn")
+inference_pool = BoundedPool(
+    "inference",
+    kind="thread",
+    max_workers=int(os.getenv("MLOPS_INFERENCE_WORKERS", "4")),
+    max_queue=int(os.getenv("MLOPS_INFERENCE_QUEUE", "256")),
+)
+training_pool = BoundedPool(
+    "training",
+    kind="process",
+    max_workers=int(os.getenv("MLOPS_TRAINING_WORKERS", "1")),
+    max_queue=int(os.getenv("MLOPS_TRAINING_QUEUE", "4")),
+    start_method=PROCESS_START_METHOD,
+)
+drift_pool = BoundedPool(
+    "drift",
+    kind="process",
+    max_workers=int(os.getenv("MLOPS_DRIFT_WORKERS", "1")),
+    max_queue=int(os.getenv("MLOPS_DRIFT_QUEUE", "2")),
+    start_method=PROCESS_START_METHOD,
+)
+executor_pools = (inference_pool, training_pool, drift_pool)
+
+# Asynchronous training jobs, persisted so they survive restarts
+JOBS_DB_PATH = os.getenv("MLOPS_JOBS_DB", "/home/user/data/jobs.db")
+
+# Opt-in dynamic micro-batching for /predict
+BATCHING_ENABLED = os.getenv("MLOPS_BATCHING_ENABLED", "false").lower() == "true"
+batcher = MicroBatcher(
+    timed_predict,
+    max_batch_size=int(os.getenv("MLOPS_BATCH_MAX_SIZE", "64")),
+    max_wait_ms=float(os.getenv("MLOPS_BATCH_MAX_WAIT_MS", "2")),
+    executor=inference_pool,
+)
+
+# Bounded LRU/TTL cache of /predict results, cleared on every model swap
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("MLOPS_PREDICTION_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("MLOPS_PREDICTION_CACHE_TTL_S", "300")),
+)
+
+# Payload formats accepted by /predict/batch
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_ROWS = int(os.getenv("MLOPS_STREAM_CHUNK_ROWS", "1024"))
 
 # Pydantic models for API
 class PredictionRequest(BaseModel):
@@ -78,6 +218,12 @@ class PredictionRequest(BaseModel):
         if len(v) == 0:
             raise ValueError('Features cannot be empty')
         return v
+    
+    @model_validator(mode="wrap")
+    @classmethod
+    def time_validation(cls, values, handler):
+        with validation_latency.time():
+            return handler(values)
 
 class PredictionResponse(BaseModel):
     """Response model for predictions"""
@@ -85,13 +231,16 @@ class PredictionResponse(BaseModel):
     confidence: float
     model_version: str
     timestamp: datetime
+    cached: bool = False
 
 class TrainingRequest(BaseModel):
     """Request model for model training"""
-    experiment_name: str = "default_experiment"
-    test_size: float = 0.2
+    model_config = ConfigDict(extra="forbid")
+    
+    experiment_name: str = Field("default_experiment", min_length=1)
+    test_size: float = Field(0.2, gt=0, lt=1)
     random_state: int = 42
-    n_estimators: int = 100
+    n_estimators: int = Field(100, ge=1)
 
 class ModelInfo(BaseModel):
     """Model information response"""
@@ -100,27 +249,9 @@ class ModelInfo(BaseModel):
     accuracy: Optional[float]
     created_at: datetime
     features_count: int
+    compiled: bool = False
 
 # Utility functions
-def generate_sample_data(n_samples: int = 1000) -> pd.DataFrame:
-    """Generate sample dataset for demonstration"""
-    np.random.seed(42)
-    
-    # TODO: Replace with your actual data loading logic
-    data = {
-        'feature_1': np.random.normal(0, 1, n_samples),
-        'feature_2': np.random.normal(0, 1, n_samples),
-        'feature_3': np.random.normal(0, 1, n_samples),
-        'feature_4': np.random.normal(0, 1, n_samples),
-    }
-    
-    df = pd.DataFrame(data)
-    
-    # Create target variable (binary classification)
-    df['target'] = (df['feature_1'] + df['feature_2'] > 0).astype(int)
-    
-    return df
-
 def save_model(model, model_name: str = "ml_model") -> str:
     """Save model using joblib"""
     model_path = f"/home/user/models/{model_name}.joblib"
@@ -129,16 +260,218 @@ def save_model(model, model_name: str = "ml_model") -> str:
     logger.info("Model saved", model_path=model_path)
     return model_path
 
-def load_model(model_path: str = "/home/user/models/ml_model.joblib"):
-    """Load model using joblib"""
+def decode_batch_features(body: bytes, content_type: str) -> np.ndarray:
+    """Decode a /predict/batch payload into a 2-D float matrix
+    
+    Rows are parsed straight into NumPy, skipping per-row pydantic validation.
+    """
     try:
-        model = joblib.load(model_path)
-        logger.info("Model loaded successfully", model_path=model_path)
+        if content_type == NPY_CONTENT_TYPE:
+            matrix = np.load(io.BytesIO(body), allow_pickle=False)
+        elif content_type == ARROW_CONTENT_TYPE:
+            if pa is None:
+                raise HTTPException(status_code=415, detail="Arrow payloads require pyarrow")
+            table = pa.ipc.open_stream(body).read_all()
+            matrix = np.column_stack([column.to_numpy() for column in table.columns])
+        else:
+            payload = json.loads(body)
+            rows = payload.get("features") if isinstance(payload, dict) else payload
+            matrix = np.asarray(rows, dtype=float)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch payload: {str(e)}")
+    
+    if matrix.ndim != 2 or matrix.size == 0:
+        raise HTTPException(
+            status_code=422,
+            detail="Batch features must be a non-empty 2-D array of rows"
+        )
+    return matrix.astype(float, copy=False)
+
+def format_batch_predictions(start: int, labels: np.ndarray, confidences: np.ndarray) -> str:
+    """NDJSON lines for one chunk of predictions starting at row ``start``"""
+    return "".join(
+        json.dumps({
+            "index": start + offset,
+            "prediction": int(label),
+            "confidence": float(confidence)
+        }) + "\n"
+        for offset, (label, confidence) in enumerate(zip(labels, confidences))
+    )
+
+async def iter_batch_predictions(model, matrix: np.ndarray, first_chunk: Tuple[np.ndarray, np.ndarray],
+                                 chunk_rows: int = STREAM_CHUNK_ROWS):
+    """Yield NDJSON prediction lines, one inference-pool call per chunk of rows
+    
+    The first chunk is predicted before the response starts so that a
+    saturated pool can still be reported as 429; a later failure ends the
+    stream with an ``error`` line.
+    """
+    yield format_batch_predictions(0, *first_chunk)
+    for start in range(chunk_rows, len(matrix), chunk_rows):
+        try:
+            labels, confidences = await inference_pool.run(
+                timed_predict, model, matrix[start:start + chunk_rows]
+            )
+        except Exception as e:
+            logger.error("Streaming batch prediction failed", error=str(e), index=start)
+            yield json.dumps({"index": start, "error": str(e)}) + "\n"
+            return
+        yield format_batch_predictions(start, labels, confidences)
+
+def load_model(model_path: str = "/home/user/models/ml_model.joblib", mmap_mode: Optional[str] = "r"):
+    """Load model using joblib, memory-mapping its arrays by default"""
+    global model_load_seconds
+    try:
+        started = time.perf_counter()
+        model = joblib.load(model_path, mmap_mode=mmap_mode)
+        model_load_seconds = time.perf_counter() - started
+        logger.info("Model loaded successfully", model_path=model_path,
+                    load_seconds=model_load_seconds)
         return model
     except FileNotFoundError:
         logger.warning("Model file not found", model_path=model_path)
         return None
 
+def observe_traffic(rows):
+    """Feed validated prediction inputs (a 2-D list or matrix) to the drift monitor"""
+    monitor = drift_monitor
+    if monitor is not None:
+        try:
+            monitor.observe(rows)
+        except ValueError:
+            # Rows that don't match the reference shape are not tracked
+            pass
+
+def activate_model(model, version: Optional[str], drift_reference: Optional[Dict[str, Any]],
+                   metrics: Dict[str, Any]):
+    """Atomically hot-swap the serving model and its metadata
+    
+    ``drift_reference`` is the registry artifact written at training time:
+    the reference bins and statistics plus the sample for Evidently reports.
+    """
+    global serving_model, reference_data, model_metrics
+    global drift_monitor, drift_reports
+    monitor, reference = None, None
+    if drift_reference is not None:
+        monitor = StreamingDriftMonitor.from_reference_state(
+            drift_reference["state"], reservoir_size=DRIFT_RESERVOIR_SIZE
+        )
+        reference = drift_reference["sample"]
+    with model_lock:
+        reference_data = reference
+        drift_monitor = monitor
+        drift_reports = DriftReportCache(DRIFT_REPORT_INTERVAL_S, DRIFT_MIN_SAMPLES)
+        model_metrics = metrics
+        serving_model = (model, version)
+        prediction_cache.clear()
+
+def load_registered_model(version: str = LATEST):
+    """Load a registry version, recording how long the load took"""
+    global model_load_seconds
+    started = time.perf_counter()
+    model = model_registry.get(version)
+    model_load_seconds = time.perf_counter() - started
+    return model
+
+def activate_registered_model(version: str):
+    """Serve a registry version with the metadata and drift reference recorded with it"""
+    model = load_registered_model(version)
+    info = model_registry.info(version)
+    activate_model(model, version, model_registry.load_artifact(version, REFERENCE_ARTIFACT), {
+        **info["metadata"],
+        "trained_at": datetime.fromisoformat(info["created_at"]),
+        "model_path": info["path"]
+    })
+
+async def refresh_serving_model():
+    """Swap in a newer ``latest`` registered by another worker
+    
+    Training jobs hot-swap only the worker that ran them; every other
+    worker notices the new registry version here, at most once per
+    ``MODEL_REFRESH_S``, and loads it on the inference pool.
+    """
+    global last_model_refresh
+    now = time.monotonic()
+    if now - last_model_refresh < MODEL_REFRESH_S:
+        return
+    last_model_refresh = now
+    try:
+        latest = model_registry.resolve(LATEST)
+    except ModelNotFound:
+        return
+    if latest == serving_model[1]:
+        return
+    try:
+        await inference_pool.run(activate_registered_model, latest)
+    except Exception as e:
+        # Keep serving the current model and retry on the next check
+        logger.warning("Model refresh failed", version=latest, error=str(e))
+        return
+    logger.info("Serving model refreshed from registry", model_version=latest)
+
+async def resolve_model(version: Optional[str]):
+    """Return (model, version) to serve; ``latest`` is the active model"""
+    if version in (None, LATEST):
+        await refresh_serving_model()
+        model, version = serving_model
+        if model is None:
+            raise HTTPException(
+                status_code=400, 
+                detail="No model available. Please train a model first."
+            )
+        return model, version or LATEST
+    
+    model = model_registry.cached(version)
+    if model is None:
+        try:
+            model = await inference_pool.run(model_registry.get, version)
+        except ModelNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return model, version
+
+def run_training_job(job_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Job runner: train in the process pool and wait for the result"""
+    future = training_pool.submit(
+        fit_and_log_model, params, mlflow.get_tracking_uri(), MODELS_DIR, job_id, JOBS_DB_PATH, DRIFT_BINS
+    )
+    return future.result()
+
+def complete_training_job(job_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Job completion hook: swap in the new model and summarize the run"""
+    version = result["model_version"]
+    activate_registered_model(version)
+    logger.info("Model training completed", 
+               job_id=job_id,
+               model_version=version,
+               accuracy=result["accuracy"], 
+               model_path=result["model_path"])
+    return {
+        "accuracy": result["accuracy"],
+        "model_version": version,
+        "model_path": result["model_path"],
+        "mlflow_run_id": result["mlflow_run_id"]
+    }
+
+# Each running job holds one training pool slot until its fit finishes, so
+# more concurrent jobs than the pool can accept would fail with PoolSaturated
+TRAINING_CONCURRENCY = int(os.getenv("MLOPS_TRAINING_CONCURRENCY", "1"))
+TRAINING_SLOTS = training_pool.max_workers + training_pool.max_queue
+if TRAINING_CONCURRENCY > TRAINING_SLOTS:
+    logger.warning("Training concurrency capped to training pool capacity",
+                   requested=TRAINING_CONCURRENCY, capped_to=TRAINING_SLOTS)
+    TRAINING_CONCURRENCY = TRAINING_SLOTS
+
+job_manager = JobManager(
+    JobStore(JOBS_DB_PATH),
+    runner=run_training_job,
+    on_complete=complete_training_job,
+    max_concurrency=TRAINING_CONCURRENCY,
+    max_pending=int(os.getenv("MLOPS_TRAINING_MAX_PENDING", "16")),
+    lease_s=float(os.getenv("MLOPS_JOB_LEASE_S", "60")),
+)
+
 # API Endpoints
 
 @app.get("/health")
@@ -147,7 +480,7 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "model_loaded": current_model is not None,
+        "model_loaded": serving_model[0] is not None,
         "service": "MLOps FastAPI Template"
     }
 
@@ -161,110 +494,86 @@ async def root():
         "health": "/health",
         "endpoints": {
             "train": "/train",
+            "train_status": "/train/{job_id}",
             "predict": "/predict", 
+            "predict_batch": "/predict/batch",
             "model_info": "/model/info",
+            "models": "/models",
             "drift_report": "/monitoring/drift"
         }
     }
 
-@app.post("/train")
-async def train_model(
-    request: TrainingRequest,
-    background_tasks: BackgroundTasks
-):
-    """Train a new model with experiment tracking"""
+@app.post("/train", status_code=202)
+async def train_model(request: TrainingRequest):
+    """Queue a training job and return its id immediately"""
     try:
-        logger.info("Starting model training", experiment=request.experiment_name)
-        
-        # Set MLflow experiment
-        mlflow.set_experiment(request.experiment_name)
-        
-        with mlflow.start_run():
-            # Generate or load training data
-            # TODO: Replace with your actual data loading logic
-            data = generate_sample_data(1000)
-            
-            X = data.drop('target', axis=1)
-            y = data['target']
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=request.test_size, random_state=request.random_state
-            )
-            
-            # Train model
-            model = RandomForestClassifier(
-                n_estimators=request.n_estimators,
-                random_state=request.random_state
-            )
-            model.fit(X_train, y_train)
-            
-            # Evaluate model
-            y_pred = model.predict(X_test)
-            accuracy = accuracy_score(y_test, y_pred)
-            
-            # Log parameters and metrics to MLflow
-            mlflow.log_param("n_estimators", request.n_estimators)
-            mlflow.log_param("test_size", request.test_size)
-            mlflow.log_param("random_state", request.random_state)
-            mlflow.log_metric("accuracy", accuracy)
-            
-            # Log model
-            mlflow.sklearn.log_model(model, "model")
-            
-            # Save model locally
-            model_path = save_model(model, f"model_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-            
-            # Update global model
-            global current_model, reference_data, model_metrics
-            current_model = model
-            reference_data = X_train  # Store for drift detection
-            model_metrics = {
-                "accuracy": accuracy,
-                "trained_at": datetime.now(),
-                "features": list(X.columns),
-                "model_path": model_path
-            }
-            
-            logger.info("Model training completed", 
-                       accuracy=accuracy, 
-                       model_path=model_path)
-            
-            return {
-                "message": "Model trained successfully",
-                "accuracy": accuracy,
-                "model_path": model_path,
-                "experiment_name": request.experiment_name,
-                "mlflow_run_id": mlflow.active_run().info.run_id
-            }
-            
+        job = job_manager.submit(request.model_dump())
+    except PoolSaturated as e:
+        logger.warning("Training rejected", error=str(e))
+        raise HTTPException(status_code=429, detail=f"Training rejected: {str(e)}")
     except Exception as e:
         logger.error("Training failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
+    
+    logger.info("Training job queued", job_id=job["id"], experiment=request.experiment_name)
+    
+    return {
+        "message": "Training job queued",
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/train/{job['id']}",
+        "experiment_name": request.experiment_name
+    }
+
+@app.get("/train/{job_id}")
+async def get_training_job(job_id: str):
+    """Report progress and results of a training job"""
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return job
 
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: PredictionRequest):
-    """Make predictions using the current model"""
-    global current_model, model_metrics
+    """Make predictions using the requested model version"""
+    model, model_version = await resolve_model(request.model_version)
     
-    if current_model is None:
+    expected = getattr(model, "n_features_in_", len(request.features))
+    if len(request.features) != expected:
         raise HTTPException(
-            status_code=400, 
-            detail="No model available. Please train a model first."
+            status_code=422,
+            detail=f"Expected {expected} features, got {len(request.features)}"
         )
     
+    observe_traffic([request.features])
+    
     try:
-        # Prepare features for prediction
-        features_array = np.array(request.features).reshape(1, -1)
+        cache_key = None
+        if prediction_cache.enabled:
+            cache_key = prediction_cache.key(model_version, request.features)
+            cached = prediction_cache.get(cache_key)
+            if cached is not None:
+                return PredictionResponse(
+                    prediction=cached[0],
+                    confidence=cached[1],
+                    model_version=model_version,
+                    timestamp=datetime.now(),
+                    cached=True
+                )
         
-        # Make prediction
-        prediction = current_model.predict(features_array)[0]
-        
-        # Get prediction confidence (probability)
-        if hasattr(current_model, 'predict_proba'):
-            confidence = float(max(current_model.predict_proba(features_array)[0]))
+        if batcher.running:
+            # Coalesce with concurrent requests into a single model call
+            prediction, confidence = await batcher.submit(model, request.features)
         else:
-            confidence = 1.0  # Default confidence for models without probability
+            # Single predict_proba pass yields both label and confidence
+            features_array = np.array(request.features).reshape(1, -1)
+            labels, confidences = await inference_pool.run(
+                timed_predict, model, features_array
+            )
+            prediction, confidence = labels[0], float(confidences[0])
+        
+        if cache_key is not None:
+            prediction_cache.put(cache_key, (int(prediction), confidence))
         
         logger.info("Prediction made", 
                    prediction=int(prediction), 
@@ -273,80 +582,218 @@ async def predict(request: PredictionRequest):
         return PredictionResponse(
             prediction=int(prediction),
             confidence=confidence,
-            model_version=request.model_version,
+            model_version=model_version,
             timestamp=datetime.now()
         )
         
+    except PoolSaturated as e:
+        logger.warning("Prediction rejected", error=str(e))
+        raise HTTPException(status_code=429, detail=f"Prediction rejected: {str(e)}")
     except Exception as e:
         logger.error("Prediction failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@app.post("/predict/batch")
+async def predict_batch(request: Request, stream: bool = False, model_version: str = "latest"):
+    """Make predictions for many rows in one request
+    
+    Accepts a JSON list of rows (or ``{"features": [...]}``), a NumPy ``.npy``
+    body (``application/x-npy``) or an Arrow IPC stream with one column per
+    feature (``application/vnd.apache.arrow.stream``). Set ``stream=true`` or
+    ``Accept: application/x-ndjson`` to receive one NDJSON line per row.
+    """
+    model, model_version = await resolve_model(model_version)
+    
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    matrix = decode_batch_features(await request.body(), content_type)
+    
+    expected = getattr(model, "n_features_in_", matrix.shape[1])
+    if matrix.shape[1] != expected:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Expected {expected} features per row, got {matrix.shape[1]}"
+        )
+    
+    observe_traffic(matrix)
+    
+    streaming = stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    rows = matrix[:STREAM_CHUNK_ROWS] if streaming else matrix
+    
+    try:
+        labels, confidences = await inference_pool.run(
+            timed_predict, model, rows
+        )
+    except PoolSaturated as e:
+        logger.warning("Batch prediction rejected", error=str(e))
+        raise HTTPException(status_code=429, detail=f"Batch prediction rejected: {str(e)}")
+    except Exception as e:
+        logger.error("Batch prediction failed", error=str(e))
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+    
+    if streaming:
+        return StreamingResponse(
+            iter_batch_predictions(model, matrix, (labels, confidences)),
+            media_type=NDJSON_MEDIA_TYPE
+        )
+    
+    logger.info("Batch prediction made", rows=len(matrix))
+    
+    # Parallel arrays, serialized directly to skip per-row response validation
+    return JSONResponse({
+        "predictions": labels.astype(int).tolist(),
+        "confidences": confidences.astype(float).tolist(),
+        "count": len(matrix),
+        "model_version": model_version,
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.get("/model/info", response_model=ModelInfo)
 async def get_model_info():
     """Get information about the current model"""
-    global current_model, model_metrics
+    model, version = serving_model
     
-    if current_model is None:
+    if model is None:
         raise HTTPException(status_code=400, detail="No model available")
     
+    compiled = isinstance(model, CompiledForest)
     return ModelInfo(
-        model_name="RandomForestClassifier",  # TODO: Make dynamic
-        version="1.0.0",
+        model_name=type(model.estimator if compiled else model).__name__,
+        version=version or "unversioned",
         accuracy=model_metrics.get("accuracy"),
         created_at=model_metrics.get("trained_at", datetime.now()),
-        features_count=len(model_metrics.get("features", []))
+        features_count=len(model_metrics.get("features", [])),
+        compiled=compiled
     )
 
+@app.get("/models")
+async def list_models():
+    """List registered model versions and registry residency"""
+    return {
+        "active_version": serving_model[1],
+        "versions": model_registry.versions(),
+        "registry": model_registry.stats()
+    }
+
 @app.get("/monitoring/drift")
 async def get_drift_report():
-    """Generate data drift report using Evidently"""
-    global reference_data, current_model
+    """Streaming drift statistics of live traffic, plus a cached Evidently report
     
-    if reference_data is None:
+    PSI/KS statistics come from incremental sketches and cost O(features) per
+    call. The full Evidently report over a reservoir sample of live traffic is
+    rebuilt only on a schedule or when drift newly crosses the threshold.
+    """
+    monitor, reports, reference = drift_monitor, drift_reports, reference_data
+    
+    if monitor is None or reference is None:
         raise HTTPException(
             status_code=400, 
             detail="No reference data available. Train a model first."
         )
     
+    summary = monitor.summary(DRIFT_PSI_THRESHOLD)
+    
     try:
-        # TODO: Replace with actual current data
-        # For demo, we'll use slightly modified reference data
-        current_data = reference_data.copy()
-        current_data += np.random.normal(0, 0.1, current_data.shape)  # Add some drift
-        
-        # Create Evidently report
-        report = Report(metrics=[DataDriftSuite()])
-        
-        report.run(
-            reference_data=reference_data, 
-            current_data=current_data
+        rebuilt = await reports.refresh(
+            summary, lambda: drift_pool.run(build_drift_report, reference, monitor.sample())
         )
-        
-        # Convert report to JSON
-        report_json = report.json()
-        
-        logger.info("Drift report generated")
-        
-        return {
-            "message": "Drift report generated successfully",
-            "timestamp": datetime.now().isoformat(),
-            "report": report_json
-        }
-        
+        if rebuilt:
+            logger.info("Drift report generated", samples=summary["samples_observed"],
+                        max_psi=summary["max_psi"])
+    except PoolSaturated as e:
+        logger.warning("Drift report rejected", error=str(e))
+        raise HTTPException(status_code=429, detail=f"Drift report rejected: {str(e)}")
     except Exception as e:
         logger.error("Drift report generation failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Drift report failed: {str(e)}")
+    
+    return {
+        "message": "Drift statistics computed from live traffic",
+        "timestamp": datetime.now().isoformat(),
+        "drift": summary,
+        "report": reports.report,
+        "report_built_at": reports.built_at.isoformat() if reports.built_at else None
+    }
+
+def collect_runtime_metrics():
+    """Point-in-time gauges for /metrics, computed only when scraped"""
+    yield GaugeMetricFamily("mlops_uptime_seconds", "Seconds since startup",
+                            value=time.monotonic() - started_at)
+    yield GaugeMetricFamily("mlops_model_load_seconds", "Duration of the last model load",
+                            value=model_load_seconds)
+    yield GaugeMetricFamily("mlops_model_loaded", "Whether a model is being served",
+                            value=float(serving_model[0] is not None))
+    yield GaugeMetricFamily("mlops_model_accuracy", "Test accuracy of the serving model",
+                            value=model_metrics.get("accuracy", 0))
+    
+    stats = batcher.stats()
+    yield GaugeMetricFamily("mlops_batcher_queue_depth", "Rows waiting for a micro-batch",
+                            value=stats["queue_depth"])
+    batch_sizes = HistogramMetricFamily("mlops_batcher_batch_size", "Rows per micro-batch")
+    batch_sizes.add_metric(
+        [],
+        [(repr(float(bound)), stats["batch_size_buckets"][str(bound)]) for bound in BATCH_SIZE_BUCKETS]
+        + [("+Inf", stats["batch_size_buckets"]["+Inf"])],
+        stats["rows_total"]
+    )
+    yield batch_sizes
+    
+    gauges = {
+        name: GaugeMetricFamily(f"mlops_pool_{name}", doc, labels=["pool"])
+        for name, doc in (
+            ("active", "Tasks running in the pool"),
+            ("queued", "Tasks waiting for a pool worker"),
+            ("utilization", "Busy worker time over available worker time"),
+        )
+    }
+    counters = {
+        name: CounterMetricFamily(f"mlops_pool_{name}", doc, labels=["pool"])
+        for name, doc in (
+            ("completed", "Tasks completed by the pool"),
+            ("failed", "Tasks that raised in the pool"),
+            ("rejected", "Tasks rejected because the pool was saturated"),
+        )
+    }
+    monitor = drift_monitor
+    if monitor is not None:
+        drift = monitor.summary(DRIFT_PSI_THRESHOLD)
+        psi = GaugeMetricFamily("mlops_drift_psi", "Population stability index vs. reference",
+                                labels=["feature"])
+        for name, stats in drift["features"].items():
+            psi.add_metric([name], stats["psi"])
+        yield psi
+        yield GaugeMetricFamily("mlops_drift_samples", "Live rows observed by the drift monitor",
+                                value=drift["samples_observed"])
+    
+    cache_stats = prediction_cache.stats()
+    yield GaugeMetricFamily("mlops_prediction_cache_entries", "Entries in the prediction cache",
+                            value=cache_stats["size"])
+    for name in ("hits", "misses", "evictions", "expirations"):
+        yield CounterMetricFamily(f"mlops_prediction_cache_{name}", f"Prediction cache {name}",
+                                  value=cache_stats[name])
+    
+    registry_stats = model_registry.stats()
+    yield GaugeMetricFamily("mlops_registry_resident_bytes", "Estimated bytes of resident model versions",
+                            value=registry_stats["resident_bytes"])
+    yield GaugeMetricFamily("mlops_registry_resident_versions", "Model versions resident in this worker",
+                            value=len(registry_stats["resident_versions"]))
+    yield CounterMetricFamily("mlops_registry_loads", "Model versions loaded from disk",
+                              value=registry_stats["loads"])
+    yield CounterMetricFamily("mlops_registry_evictions", "Model versions evicted from the LRU",
+                              value=registry_stats["evictions"])
+    
+    for pool in (*executor_pools, job_manager.pool):
+        pool_stats = pool.stats()
+        for name, family in (*gauges.items(), *counters.items()):
+            family.add_metric([pool.name], pool_stats[name])
+    yield from gauges.values()
+    yield from counters.values()
+
+metrics.add_collector(collect_runtime_metrics)
 
 @app.get("/metrics")
 async def get_metrics():
-    """Prometheus-compatible metrics endpoint"""
-    # TODO: Implement Prometheus metrics
-    return {
-        "predictions_total": 0,  # TODO: Track actual metrics
-        "model_accuracy": model_metrics.get("accuracy", 0),
-        "uptime_seconds": 0,  # TODO: Track uptime
-        "errors_total": 0  # TODO: Track errors
-    }
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE_LATEST)
 
 # Startup event
 @app.on_event("startup")
@@ -355,17 +802,25 @@ async def startup_event():
     logger.info("🤖 MLOps FastAPI Template starting up")
     
     # Create necessary directories
-    os.makedirs("/home/user/models", exist_ok=True)
+    os.makedirs(MODELS_DIR, exist_ok=True)
     os.makedirs("/home/user/data", exist_ok=True)
     
-    # Try to load existing model
-    global current_model
-    current_model = load_model()
+    # Serve the latest registered version, falling back to the default model file
+    try:
+        activate_registered_model(model_registry.resolve(LATEST))
+    except ModelNotFound:
+        activate_model(prepare_model(load_model()), None, None, {})
     
     # Set up MLflow tracking
     # TODO: Configure remote MLflow server if needed
     mlflow.set_tracking_uri("file:///home/user/mlruns")
     
+    # Reschedule training jobs interrupted by the last shutdown
+    job_manager.resume()
+    
+    if BATCHING_ENABLED:
+        await batcher.start()
+    
     logger.info("Application initialized successfully")
 
 # Shutdown event
@@ -373,6 +828,10 @@ async def startup_event():
 async def shutdown_event():
     """Clean up on application shutdown"""
     logger.info("🤖 MLOps FastAPI Template shutting down")
+    await batcher.stop()
+    job_manager.shutdown()
+    for pool in executor_pools:
+        pool.shutdown(wait=False)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,193 @@
+"""
+📦 Dynamic micro-batching for model inference
+Coalesces concurrent single-row predictions into one matrix per model call
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+# Upper bounds of the batch-size histogram buckets (last bucket is +Inf)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def predict_with_confidence(model, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return labels and confidences from a single pass over the model"""
+    if hasattr(model, "predict_proba"):
+        proba = model.predict_proba(features)
+        best = proba.argmax(axis=1)
+        labels = model.classes_.take(best, axis=0)
+        confidences = proba[np.arange(len(best)), best]
+        return labels, confidences
+
+    # Models without probabilities get a default confidence
+    labels = model.predict(features)
+    return labels, np.ones(len(labels), dtype=float)
+
+
+class MicroBatcher:
+    """Queue single-row predictions and flush them as one batch.
+
+    A batch is flushed when ``max_batch_size`` rows are pending or
+    ``max_wait_ms`` has elapsed since the first pending row, whichever
+    comes first. Rows are grouped by model and row length so that a
+    malformed request only fails its own group. When an ``executor`` is
+    given, model calls run there instead of on the event loop, one
+    submission per group so that groups are predicted concurrently.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[Any, np.ndarray], Tuple[np.ndarray, np.ndarray]] = predict_with_confidence,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        executor=None,
+    ):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+
+        self._pending: List[Tuple[Any, Sequence[float], asyncio.Future]] = []
+        self._has_items: asyncio.Event = None
+        self._batch_full: asyncio.Event = None
+        self._worker: asyncio.Task = None
+        self._stopping = False
+
+        self.batches_total = 0
+        self.rows_total = 0
+        self.max_queue_depth = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """Start the background flush loop on the running event loop"""
+        if self.running:
+            return
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Micro-batcher started",
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_s * 1000)
+
+    async def stop(self):
+        """Flush outstanding rows and stop the flush loop"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._has_items.set()
+        await self._worker
+        self._worker = None
+        self._stopping = False
+        logger.info("Micro-batcher stopped", batches_total=self.batches_total)
+
+    async def submit(self, model, features: Sequence[float]) -> Tuple[Any, float]:
+        """Enqueue one row and wait for its (label, confidence)"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((model, features, future))
+
+        depth = len(self._pending)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        self._has_items.set()
+        if depth >= self.max_batch_size:
+            self._batch_full.set()
+
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and batch-size histogram snapshot"""
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(BATCH_SIZE_BUCKETS, self.batch_size_counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = cumulative + self.batch_size_counts[-1]
+
+        return {
+            "enabled": self.running,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "batches_total": self.batches_total,
+            "rows_total": self.rows_total,
+            "batch_size_buckets": buckets,
+        }
+
+    async def _run(self):
+        while True:
+            # Checked before waiting too: the final flush clears _has_items
+            if self._stopping and not self._pending:
+                return
+            await self._has_items.wait()
+            if self._stopping and not self._pending:
+                return
+            if not self._stopping and len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_wait_s)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush(self._take_batch())
+
+    def _take_batch(self) -> List[Tuple[Any, Sequence[float], asyncio.Future]]:
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        if not self._pending:
+            self._has_items.clear()
+        if len(self._pending) < self.max_batch_size:
+            self._batch_full.clear()
+        return batch
+
+    async def _flush(self, batch: List[Tuple[Any, Sequence[float], asyncio.Future]]):
+        if not batch:
+            return
+        self._record_batch(len(batch))
+
+        groups: Dict[Tuple[int, int], List[Tuple[Any, Sequence[float], asyncio.Future]]] = {}
+        for item in batch:
+            model, features, _ = item
+            groups.setdefault((id(model), len(features)), []).append(item)
+
+        await asyncio.gather(*(self._predict_group(items) for items in groups.values()))
+
+    async def _predict_group(self, items: List[Tuple[Any, Sequence[float], asyncio.Future]]):
+        live = [item for item in items if not item[2].done()]
+        if not live:
+            return
+        model = live[0][0]
+        try:
+            matrix = np.asarray([features for _, features, _ in live], dtype=float)
+            if self.executor is None:
+                labels, confidences = self.predict_fn(model, matrix)
+            else:
+                labels, confidences = await asyncio.wrap_future(
+                    self.executor.submit(self.predict_fn, model, matrix)
+                )
+        except Exception as e:
+            for _, _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), label, confidence in zip(live, labels, confidences):
+            if not future.done():
+                future.set_result((label, float(confidence)))
+
+    def _record_batch(self, size: int):
+        self.batches_total += 1
+        self.rows_total += size
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.batch_size_counts[i] += 1
+                return
+        self.batch_size_counts[-1] += 1
@@ -0,0 +1,145 @@
+"""
+🌲 Compiled forest inference
+Flattens fitted random forests into array tables walked with vectorized NumPy
+"""
+
+from typing import Optional
+
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+# sklearn >= 1.4 stores class fractions in tree_.value; older versions store
+# counts and normalize them per prediction
+_VALUES_ARE_FRACTIONS = tuple(int(part) for part in sklearn.__version__.split(".")[:2]) >= (1, 4)
+
+
+class UnsupportedModel(TypeError):
+    """Raised for estimators the compiler does not handle"""
+
+
+class CompilationMismatch(AssertionError):
+    """Raised when the compiled forest disagrees with sklearn during the self-check"""
+
+
+class CompiledForest:
+    """A fitted single-output ``RandomForestClassifier`` as flat node tables.
+
+    All trees share one set of arrays with child indices rebased to global
+    node ids, and leaves point at themselves; each vectorized step advances
+    every (row, tree) pair that has not reached its leaf yet. The arithmetic mirrors
+    sklearn's exactly: inputs are cast to float32 and compared with float64
+    thresholds, and tree probabilities are summed in tree order before
+    dividing by the number of trees.
+    """
+
+    def __init__(self, estimator: RandomForestClassifier):
+        if not isinstance(estimator, RandomForestClassifier) or not hasattr(estimator, "estimators_"):
+            raise UnsupportedModel(f"Cannot compile {type(estimator).__name__}")
+        if estimator.n_outputs_ != 1:
+            raise UnsupportedModel("Only single-output forests can be compiled")
+
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.n_trees = len(estimator.estimators_)
+
+        trees = [tree.tree_ for tree in estimator.estimators_]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+
+            proba = np.array(tree.value[:, 0, :len(self.classes_)], dtype=np.float64)
+            if not _VALUES_ARE_FRACTIONS:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba /= normalizer
+            value.append(proba)
+
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.value = np.concatenate(value)
+        self.roots = offsets.astype(np.intp)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+
+    def apply(self, X) -> np.ndarray:
+        """Global leaf id reached by every row in every tree, shape (n_rows, n_trees)"""
+        X = np.asarray(X, dtype=np.float32)
+        node = np.tile(self.roots, len(X))
+        row = np.repeat(np.arange(len(X)), self.n_trees)
+        # Only (row, tree) pairs that have not reached a leaf take another step
+        active = np.arange(len(node))
+        while len(active):
+            current = node[active]
+            go_left = X[row[active], self.feature[current]] <= self.threshold[current]
+            node[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[node[active] != current]
+        return node.reshape(len(X), self.n_trees)
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but the model expects {self.n_features_in_}"
+            )
+        if np.isnan(X).any():
+            # Missing-value routing is left to sklearn
+            return self.estimator.predict_proba(X)
+
+        leaves = self.value[self.apply(X)]
+        # cumsum adds strictly in tree order, matching sklearn's accumulation
+        proba = np.cumsum(leaves, axis=1)[:, -1]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def probe_rows(self, n_rows: int = 512, seed: int = 0) -> np.ndarray:
+        """Inputs that exercise split boundaries: values at, just above and around thresholds"""
+        rng = np.random.default_rng(seed)
+        is_split = self.left != np.arange(self.node_count)
+        columns = []
+        for i in range(self.n_features_in_):
+            thresholds = self.threshold[is_split & (self.feature == i)]
+            if len(thresholds) == 0:
+                columns.append(rng.normal(size=n_rows))
+                continue
+            picked = rng.choice(thresholds, size=n_rows)
+            nudge = rng.integers(-1, 2, size=n_rows)
+            column = np.where(nudge < 0, np.nextafter(picked, -np.inf), picked)
+            column = np.where(nudge > 0, np.nextafter(picked, np.inf), column)
+            spread = max(np.ptp(thresholds), 1.0)
+            outliers = rng.random(n_rows) < 0.1
+            column[outliers] = rng.uniform(thresholds.min() - spread, thresholds.max() + spread, outliers.sum())
+            columns.append(column)
+        return np.column_stack(columns)
+
+    def verify(self, X: Optional[np.ndarray] = None):
+        """Raise CompilationMismatch unless predictions match sklearn bit for bit"""
+        X = self.probe_rows() if X is None else np.asarray(X, dtype=np.float64)
+        expected = self.estimator.predict_proba(X)
+        actual = self.predict_proba(X)
+        if not np.array_equal(expected, actual):
+            worst = float(np.max(np.abs(expected - actual)))
+            raise CompilationMismatch(f"Compiled forest differs from sklearn (max abs diff {worst})")
+
+
+def compile_forest(estimator: RandomForestClassifier, check_rows: Optional[np.ndarray] = None) -> CompiledForest:
+    """Compile ``estimator`` and self-check it against sklearn"""
+    compiled = CompiledForest(estimator)
+    compiled.verify(check_rows)
+    return compiled
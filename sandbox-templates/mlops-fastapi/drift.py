@@ -0,0 +1,264 @@
+"""
+📈 Streaming data-drift monitoring
+Incremental per-feature sketches of live traffic and a cached Evidently report
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from evidently.report import Report
+from evidently.metric_suite import DataDriftSuite
+
+# Guards against log(0) for empty histogram bins
+PSI_EPSILON = 1e-4
+
+# Registry artifact holding the reference bins, statistics and sample of a version
+REFERENCE_ARTIFACT = "drift_reference"
+
+
+def _bin_props(edges: np.ndarray, column: np.ndarray) -> np.ndarray:
+    """Share of ``column`` falling into each bin delimited by ``edges``"""
+    counts = np.bincount(np.searchsorted(edges, column, side="right"), minlength=len(edges) + 1)
+    return counts / max(counts.sum(), 1)
+
+
+class StreamingDriftMonitor:
+    """Compare live feature distributions to a reference, one batch at a time.
+
+    Every feature gets histogram bins at the reference quantiles plus
+    running mean and variance. Incoming rows are buffered and folded in
+    vectorized chunks, so the request path only appends to a list. A
+    bounded reservoir sample of raw rows is kept for full reports.
+    """
+
+    def __init__(
+        self,
+        reference: np.ndarray,
+        feature_names: Sequence[str],
+        n_bins: int = 10,
+        reservoir_size: int = 2000,
+        fold_rows: int = 256,
+        seed: int = 42,
+    ):
+        reference = np.asarray(reference, dtype=float)
+
+        # Inner bin edges per feature at reference quantiles
+        quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+        edges = [np.unique(np.quantile(reference[:, i], quantiles)) for i in range(reference.shape[1])]
+        self._setup({
+            "feature_names": list(feature_names),
+            "edges": edges,
+            "reference_props": [_bin_props(edges[i], reference[:, i]) for i in range(len(edges))],
+            "reference_mean": reference.mean(axis=0),
+            "reference_std": reference.std(axis=0),
+        }, reservoir_size, fold_rows, seed)
+
+    @classmethod
+    def from_reference_state(
+        cls,
+        state: Dict[str, Any],
+        reservoir_size: int = 2000,
+        fold_rows: int = 256,
+        seed: int = 42,
+    ) -> "StreamingDriftMonitor":
+        """Rebuild a monitor from :meth:`reference_state` without the raw reference"""
+        monitor = cls.__new__(cls)
+        monitor._setup(state, reservoir_size, fold_rows, seed)
+        return monitor
+
+    def _setup(self, state: Dict[str, Any], reservoir_size: int, fold_rows: int, seed: int):
+        self.feature_names = list(state["feature_names"])
+        self.n_features = len(self.feature_names)
+        self.reservoir_size = reservoir_size
+        self.fold_rows = fold_rows
+
+        self._edges = [np.asarray(edges, dtype=float) for edges in state["edges"]]
+        self._reference_props = [np.asarray(props, dtype=float) for props in state["reference_props"]]
+        self._reference_mean = np.asarray(state["reference_mean"], dtype=float)
+        self._reference_std = np.asarray(state["reference_std"], dtype=float)
+
+        self._counts = [np.zeros(len(edges) + 1) for edges in self._edges]
+        self._n = 0
+        self._mean = np.zeros(self.n_features)
+        self._m2 = np.zeros(self.n_features)
+
+        self._reservoir = np.empty((reservoir_size, self.n_features))
+        self._rng = np.random.default_rng(seed)
+
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+
+    def reference_state(self) -> Dict[str, Any]:
+        """Reference bins and statistics, enough to rebuild the monitor elsewhere"""
+        return {
+            "feature_names": list(self.feature_names),
+            "edges": [edges.copy() for edges in self._edges],
+            "reference_props": [props.copy() for props in self._reference_props],
+            "reference_mean": self._reference_mean.copy(),
+            "reference_std": self._reference_std.copy(),
+        }
+
+    def observe(self, rows) -> None:
+        """Record live feature rows (one row or a 2-D matrix)"""
+        matrix = np.atleast_2d(np.asarray(rows, dtype=float))
+        if matrix.ndim != 2 or matrix.shape[1] != self.n_features:
+            raise ValueError(f"Expected rows of {self.n_features} features, got shape {matrix.shape}")
+        with self._lock:
+            self._pending.append(matrix)
+            self._pending_rows += len(matrix)
+            if self._pending_rows >= self.fold_rows:
+                self._fold()
+
+    def _fold(self):
+        if not self._pending:
+            return
+        batch = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending, self._pending_rows = [], 0
+
+        for i, edges in enumerate(self._edges):
+            self._counts[i] += np.bincount(
+                np.searchsorted(edges, batch[:, i], side="right"), minlength=len(edges) + 1
+            )
+
+        # Chan et al. parallel update of running mean and variance
+        n_a, n_b = self._n, len(batch)
+        batch_mean = batch.mean(axis=0)
+        delta = batch_mean - self._mean
+        total = n_a + n_b
+        self._mean += delta * n_b / total
+        self._m2 += ((batch - batch_mean) ** 2).sum(axis=0) + delta ** 2 * n_a * n_b / total
+
+        # Reservoir sampling (algorithm R), vectorized over the batch
+        seen = n_a + np.arange(n_b)
+        fill = seen < self.reservoir_size
+        self._reservoir[seen[fill]] = batch[fill]
+        slots = (self._rng.random(n_b) * (seen + 1)).astype(np.int64)
+        replace = ~fill & (slots < self.reservoir_size)
+        self._reservoir[slots[replace]] = batch[replace]
+
+        self._n = total
+
+    @property
+    def samples_observed(self) -> int:
+        with self._lock:
+            return self._n + self._pending_rows
+
+    def sample(self) -> pd.DataFrame:
+        """Reservoir sample of live rows as a DataFrame"""
+        with self._lock:
+            self._fold()
+            rows = self._reservoir[:min(self._n, self.reservoir_size)].copy()
+        return pd.DataFrame(rows, columns=self.feature_names)
+
+    def summary(self, psi_threshold: float = 0.2) -> Dict[str, Any]:
+        """PSI and binned KS statistics per feature, computed from the sketches"""
+        with self._lock:
+            self._fold()
+            n = self._n
+            counts = [c.copy() for c in self._counts]
+            mean = self._mean.copy()
+            variance = self._m2 / n if n else np.zeros(self.n_features)
+
+        features = {}
+        for i, name in enumerate(self.feature_names):
+            reference = self._reference_props[i]
+            current = counts[i] / n if n else np.zeros_like(reference)
+            ref_p = np.clip(reference, PSI_EPSILON, None)
+            cur_p = np.clip(current, PSI_EPSILON, None)
+            psi = float(np.sum((cur_p - ref_p) * np.log(cur_p / ref_p))) if n else 0.0
+            ks = float(np.max(np.abs(np.cumsum(current) - np.cumsum(reference)))) if n else 0.0
+            features[name] = {
+                "psi": psi,
+                "ks": ks,
+                "mean": float(mean[i]),
+                "std": float(np.sqrt(variance[i])),
+                "reference_mean": float(self._reference_mean[i]),
+                "reference_std": float(self._reference_std[i]),
+                "drifted": psi >= psi_threshold,
+            }
+
+        max_psi = max((f["psi"] for f in features.values()), default=0.0)
+        return {
+            "samples_observed": n,
+            "psi_threshold": psi_threshold,
+            "max_psi": max_psi,
+            "drift_detected": n > 0 and max_psi >= psi_threshold,
+            "drifted_features": [name for name, f in features.items() if f["drifted"]],
+            "features": features,
+        }
+
+
+class DriftReportCache:
+    """Holds the last full Evidently report and decides when to rebuild it.
+
+    A rebuild is due when no report exists yet, when ``refresh_seconds``
+    have passed, or when the streaming summary has newly crossed the drift
+    threshold since the last build. Concurrent callers of :meth:`refresh`
+    share a single in-flight rebuild.
+    """
+
+    def __init__(self, refresh_seconds: float = 300.0, min_samples: int = 100):
+        self.refresh_seconds = refresh_seconds
+        self.min_samples = min_samples
+        self.report: Optional[str] = None
+        self.built_at: Optional[datetime] = None
+        self.builds = 0
+        self._built_monotonic = 0.0
+        self._built_with_drift = False
+        self._rebuild: Optional[asyncio.Future] = None
+
+    def needs_rebuild(self, summary: Dict[str, Any]) -> bool:
+        if summary["samples_observed"] < self.min_samples:
+            return False
+        if self.report is None:
+            return True
+        if time.monotonic() - self._built_monotonic >= self.refresh_seconds:
+            return True
+        return summary["drift_detected"] and not self._built_with_drift
+
+    def store(self, report: str, summary: Dict[str, Any]):
+        self.report = report
+        self.built_at = datetime.now()
+        self.builds += 1
+        self._built_monotonic = time.monotonic()
+        self._built_with_drift = summary["drift_detected"]
+
+    async def refresh(self, summary: Dict[str, Any], build: Callable[[], Awaitable[str]]) -> bool:
+        """Rebuild with ``build`` if due, or wait for the rebuild already running
+
+        Returns True only to the caller that started a rebuild.
+        """
+        if self._rebuild is not None:
+            await asyncio.shield(self._rebuild)
+            return False
+        if not self.needs_rebuild(summary):
+            return False
+        self._rebuild = asyncio.ensure_future(self._run_rebuild(summary, build))
+        await asyncio.shield(self._rebuild)
+        return True
+
+    async def _run_rebuild(self, summary: Dict[str, Any], build: Callable[[], Awaitable[str]]):
+        try:
+            self.store(await build(), summary)
+        finally:
+            self._rebuild = None
+
+
+def build_drift_report(reference: pd.DataFrame, current: pd.DataFrame) -> str:
+    """Run the Evidently drift report; runs inside the drift process pool"""
+    # Create Evidently report
+    report = Report(metrics=[DataDriftSuite()])
+
+    report.run(
+        reference_data=reference,
+        current_data=current
+    )
+
+    # Convert report to JSON
+    return report.json()
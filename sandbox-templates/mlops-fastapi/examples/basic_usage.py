@@ -57,6 +57,24 @@ def get_service_info():
         for endpoint, description in result.get('endpoints', {}).items():
             print(f"   - {endpoint}: {description}")
 
+def wait_for_training_job(job: Dict[str, Any], timeout: float = 300.0) -> Dict[str, Any]:
+    """Poll a queued training job until it completes or fails"""
+    if not job:
+        return {}
+    
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = make_request("GET", job["status_url"])
+        if not status or status["status"] == "failed":
+            print(f"❌ Training job failed: {status.get('error') if status else 'unknown'}")
+            return {}
+        if status["status"] == "completed":
+            return status["result"]
+        time.sleep(0.5)
+    
+    print(f"❌ Training job {job['job_id']} timed out")
+    return {}
+
 def train_model(experiment_name: str = "basic_example"):
     """Train a machine learning model"""
     print(f"\n🚀 Training model for experiment: {experiment_name}")
@@ -71,7 +89,7 @@ def train_model(experiment_name: str = "basic_example"):
     print(f"   Configuration: {json.dumps(training_config, indent=2)}")
     
     start_time = time.time()
-    result = make_request("POST", "/train", training_config)
+    result = wait_for_training_job(make_request("POST", "/train", training_config))
     end_time = time.time()
     
     if result:
@@ -170,16 +188,25 @@ def get_metrics():
     """Get service metrics"""
     print("\n📊 Getting service metrics...")
     
-    result = make_request("GET", "/metrics")
-    
-    if result:
-        print(f"✅ Service metrics:")
-        for metric, value in result.items():
-            print(f"   {metric}: {value}")
-        return result
-    else:
-        print("❌ Failed to get metrics")
+    try:
+        response = requests.get(f"{BASE_URL}/metrics")
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Failed to get metrics: {e}")
         return None
+    
+    # Prometheus text format: show plain samples, skip histogram buckets
+    result = {}
+    for line in response.text.splitlines():
+        if line.startswith("#") or "_bucket{" in line or not line.strip():
+            continue
+        metric, value = line.rsplit(" ", 1)
+        result[metric] = float(value)
+    
+    print(f"✅ Service metrics:")
+    for metric, value in result.items():
+        print(f"   {metric}: {value}")
+    return result
 
 def run_basic_workflow():
     """Run a complete basic workflow"""
@@ -238,7 +265,7 @@ def run_advanced_examples():
     results = []
     for config in model_configs:
         print(f"\n   Training {config['experiment_name']}...")
-        result = make_request("POST", "/train", config)
+        result = wait_for_training_job(make_request("POST", "/train", config))
         if result:
             results.append({
                 "name": config["experiment_name"],
@@ -262,15 +289,18 @@ def run_advanced_examples():
         [2.0, 1.0, -1.0, 0.5]
     ]
     
+    # One request for all rows instead of one request per row
     batch_results = []
-    for i, features in enumerate(batch_features):
-        result = make_request("POST", "/predict", {"features": features})
-        if result:
+    result = make_request("POST", "/predict/batch", {"features": batch_features})
+    if result:
+        for i, (features, prediction, confidence) in enumerate(
+            zip(batch_features, result["predictions"], result["confidences"])
+        ):
             batch_results.append({
                 "id": i+1,
                 "features": features,
-                "prediction": result["prediction"],
-                "confidence": result["confidence"]
+                "prediction": prediction,
+                "confidence": confidence
             })
     
     if batch_results:
@@ -303,7 +333,7 @@ def error_handling_examples():
     result = make_request("GET", "/non-existent")
 
 def performance_testing():
-    """Basic performance testing"""
+    """Basic performance testing (see examples/benchmark.py for load tests)"""
     print("\n⚡ Performance Testing")
     print("=" * 30)
     
@@ -0,0 +1,254 @@
+"""
+⚡ MLOps FastAPI Template - Load Testing & Benchmarks
+Drives the service with concurrent async requests and records latency percentiles
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+SCENARIOS = ("predict", "predict_batch", "predict_batch_stream", "train", "drift")
+
+# Scenario metrics compared against a baseline: (key, True if higher is better)
+REGRESSION_KEYS = (("p95_ms", False), ("p99_ms", False), ("throughput_rps", True))
+
+
+async def open_client(stack: AsyncExitStack, base_url: Optional[str], concurrency: int) -> httpx.AsyncClient:
+    """Pooled async client for a running server, or the in-process app over ASGI when no URL is given"""
+    if base_url:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        return await stack.enter_async_context(
+            httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0)
+        )
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from app import app
+    # Run startup/shutdown so the in-process app is configured like a served one
+    await stack.enter_async_context(app.router.lifespan_context(app))
+    return await stack.enter_async_context(
+        httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60.0)
+    )
+
+
+def summarize(latencies: List[float], errors: int, duration: float, rows: int = 0) -> Dict[str, Any]:
+    """Latency percentiles (ms) and throughput for one scenario"""
+    completed = len(latencies)
+    result = {
+        "requests": completed + errors,
+        "errors": errors,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(completed / duration, 2) if duration else 0.0,
+    }
+    if latencies:
+        ms = np.asarray(latencies) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        result.update(
+            mean_ms=round(float(ms.mean()), 3),
+            p50_ms=round(float(p50), 3),
+            p95_ms=round(float(p95), 3),
+            p99_ms=round(float(p99), 3),
+            max_ms=round(float(ms.max()), 3),
+        )
+    if rows:
+        result["rows_per_s"] = round(rows / duration, 2) if duration else 0.0
+    return result
+
+
+async def run_load(call: Callable[[int], Awaitable[int]], total: int, concurrency: int,
+                   warmup: int = 0) -> Dict[str, Any]:
+    """Run ``total`` calls with at most ``concurrency`` in flight.
+
+    ``call(i)`` returns the number of rows it scored (0 for non-prediction
+    calls) and raises on failure.
+    """
+    for i in range(warmup):
+        await call(i)
+
+    latencies: List[float] = []
+    errors = 0
+    rows = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, rows, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                scored = await call(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            rows += scored
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    return summarize(latencies, errors, time.perf_counter() - started, rows)
+
+
+async def wait_for_job(client: httpx.AsyncClient, job: Dict[str, Any], timeout: float = 300.0) -> Dict[str, Any]:
+    """Poll a training job until it finishes"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get(job["status_url"])
+        response.raise_for_status()
+        status = response.json()
+        if status["status"] == "completed":
+            return status
+        if status["status"] == "failed":
+            raise RuntimeError(status.get("error"))
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Training job {job['job_id']} did not finish")
+
+
+async def train(client: httpx.AsyncClient, n_estimators: int) -> Dict[str, Any]:
+    response = await client.post("/train", json={"experiment_name": "benchmark", "n_estimators": n_estimators})
+    response.raise_for_status()
+    return await wait_for_job(client, response.json())
+
+
+async def run_benchmark(base_url: Optional[str] = None, scenarios=SCENARIOS, requests: int = 500,
+                        concurrency: int = 16, batch_size: int = 256, train_jobs: int = 4,
+                        n_estimators: int = 50, warmup: int = 10, seed: int = 42) -> Dict[str, Any]:
+    """Run the selected scenarios and return a JSON-serializable result document"""
+    rng = np.random.default_rng(seed)
+    # A fixed pool of distinct rows, so the prediction cache sees realistic reuse
+    features = rng.normal(size=(max(requests, batch_size), 4)).round(4).tolist()
+    results: Dict[str, Any] = {}
+
+    async with AsyncExitStack() as stack:
+        client = await open_client(stack, base_url, concurrency)
+        # Every prediction scenario needs a served model
+        await train(client, n_estimators)
+
+        async def predict(i):
+            response = await client.post("/predict", json={"features": features[i % len(features)]})
+            response.raise_for_status()
+            return 1
+
+        async def predict_batch(i):
+            response = await client.post("/predict/batch", json={"features": features[:batch_size]})
+            response.raise_for_status()
+            return len(response.json()["predictions"])
+
+        async def predict_batch_stream(i):
+            rows = 0
+            async with client.stream("POST", "/predict/batch?stream=true",
+                                     json={"features": features[:batch_size]}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    rows += bool(line)
+            return rows
+
+        async def train_job(i):
+            await train(client, n_estimators)
+            return 0
+
+        async def drift(i):
+            response = await client.get("/monitoring/drift")
+            response.raise_for_status()
+            return 0
+
+        calls = {
+            "predict": (predict, requests),
+            "predict_batch": (predict_batch, max(requests // 10, 1)),
+            "predict_batch_stream": (predict_batch_stream, max(requests // 10, 1)),
+            "train": (train_job, train_jobs),
+            "drift": (drift, max(requests // 10, 1)),
+        }
+        for name in scenarios:
+            call, total = calls[name]
+            scenario_warmup = 0 if name == "train" else min(warmup, total)
+            results[name] = await run_load(call, total, concurrency, scenario_warmup)
+            print(f"   {name}: {json.dumps(results[name])}")
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "target": base_url or "in-process",
+        "config": {
+            "requests": requests,
+            "concurrency": concurrency,
+            "batch_size": batch_size,
+            "train_jobs": train_jobs,
+            "n_estimators": n_estimators,
+            "warmup": warmup,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "scenarios": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1) -> List[str]:
+    """Return a message for every metric that regressed by more than ``tolerance``"""
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        now = current["scenarios"].get(name)
+        if not now:
+            continue
+        for key, higher_is_better in REGRESSION_KEYS:
+            if not base.get(key) or key not in now:
+                continue
+            change = (now[key] - base[key]) / base[key]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}.{key}: {base[key]} -> {now[key]} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MLOps FastAPI service")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=500, help="Requests for the /predict scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--train-jobs", type=int, default=4)
+    parser.add_argument("--n-estimators", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print("⚡ MLOps FastAPI Benchmark")
+    print("=" * 40)
+    results = asyncio.run(run_benchmark(
+        base_url=args.url, scenarios=scenarios, requests=args.requests, concurrency=args.concurrency,
+        batch_size=args.batch_size, train_jobs=args.train_jobs, n_estimators=args.n_estimators,
+        warmup=args.warmup,
+    ))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for message in regressions:
+                print(f"   {message}")
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+⚙️ Bounded executor pools
+Keeps blocking model work off the event loop with backpressure and utilization metrics
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool has no free worker or queue slot"""
+
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[float, Any]:
+    """Run ``fn`` and report its busy time (module-level so it pickles)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+class BoundedPool:
+    """A thread or process pool that rejects work instead of queueing forever.
+
+    At most ``max_workers`` tasks run and ``max_queue`` more may wait; any
+    further submission raises :class:`PoolSaturated` immediately. The
+    underlying executor is created lazily on first use.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 64,
+        start_method: str = "spawn",
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.start_method = start_method
+
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._created_at = time.monotonic()
+
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "thread":
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix=f"{self.name}-pool"
+                    )
+                else:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.start_method)
+                    )
+                logger.info("Executor pool created", pool=self.name, kind=self.kind,
+                            max_workers=self.max_workers, max_queue=self.max_queue)
+            return self._executor
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Schedule ``fn(*args)`` or raise :class:`PoolSaturated`"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(f"{self.name} pool is saturated")
+
+        with self._lock:
+            self.in_flight += 1
+
+        outer: Future = Future()
+        try:
+            inner = self._get_executor().submit(_timed_call, fn, args)
+        except Exception:
+            self._release(0.0, failed=True)
+            raise
+        inner.add_done_callback(lambda done: self._resolve(done, outer))
+        return outer
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Await ``fn(*args)`` on the pool from the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _resolve(self, inner: Future, outer: Future):
+        try:
+            elapsed, result = inner.result()
+        except BaseException as e:
+            self._release(0.0, failed=True)
+            outer.set_exception(e)
+            return
+        self._release(elapsed, failed=False)
+        outer.set_result(result)
+
+    def _release(self, elapsed: float, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.busy_seconds += elapsed
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue, throughput and utilization snapshot"""
+        with self._lock:
+            in_flight = self.in_flight
+            active = min(in_flight, self.max_workers)
+            uptime = max(time.monotonic() - self._created_at, 1e-9)
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": active,
+                "queued": in_flight - active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "busy_seconds": round(self.busy_seconds, 6),
+                "utilization": round(self.busy_seconds / (self.max_workers * uptime), 6),
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
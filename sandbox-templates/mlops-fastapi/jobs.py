@@ -0,0 +1,263 @@
+"""
+🗂️ Training job subsystem
+SQLite-backed job store and a bounded worker pool for asynchronous training
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+from executors import BoundedPool, PoolSaturated
+
+logger = structlog.get_logger()
+
+# Job lifecycle states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+UNFINISHED = (QUEUED, RUNNING)
+
+# Columns added after the first release, migrated in place on open
+LEASE_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+
+
+class JobStore:
+    """Persist job state in a local SQLite file.
+
+    A fresh connection is opened per call so the store can be used from
+    request handlers, job threads and training worker processes alike.
+    Running jobs carry a lease (``owner`` plus ``heartbeat_at``) so that
+    several workers sharing the file never run the same job twice.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, column_type in LEASE_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, QUEUED, json.dumps(params), now, now)
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def set_progress(self, job_id: str, stage: str, progress: float):
+        self.update(job_id, stage=stage, progress=progress)
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Atomically move a queued job to running under ``owner``"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, owner = ?, heartbeat_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (RUNNING, RUNNING, owner, time.time(), datetime.now().isoformat(), job_id, QUEUED)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Extend the lease; False once the job is no longer held by ``owner``"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time(), job_id, owner, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, owner: str, **fields) -> bool:
+        """Record the final state, unless the lease was lost to another worker"""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ? AND status = ?",
+                (*fields.values(), job_id, owner, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def requeue_expired(self, lease_s: float) -> int:
+        """Return running jobs whose lease expired (their worker died) to the queue"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, owner = NULL, heartbeat_at = NULL, "
+                "updated_at = ? WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (QUEUED, QUEUED, datetime.now().isoformat(), RUNNING, time.time() - lease_s)
+            )
+        return cursor.rowcount
+
+    def queued(self) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                UNFINISHED
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobManager:
+    """Run jobs on a bounded worker pool and record their lifecycle.
+
+    ``runner(job_id, params)`` does the work and returns its output;
+    ``on_complete(job_id, output)`` publishes it (e.g. hot-swaps the model)
+    and returns the JSON-serializable summary stored as the job result.
+    A job only runs after this manager claims it in the store, and its
+    lease is renewed every ``lease_s / 3`` seconds while it runs.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: Callable[[str, Dict[str, Any]], Any],
+        on_complete: Callable[[str, Any], Dict[str, Any]],
+        max_concurrency: int = 1,
+        max_pending: int = 16,
+        lease_s: float = 60.0,
+    ):
+        self.store = store
+        self.runner = runner
+        self.on_complete = on_complete
+        self.lease_s = lease_s
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.pool = BoundedPool("jobs", kind="thread",
+                                max_workers=max_concurrency, max_queue=max_pending)
+
+    def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a new job and schedule it; raises PoolSaturated when full"""
+        job = self.store.create(params)
+        try:
+            self.pool.submit(self._execute, job["id"], params)
+        except Exception as e:
+            self.store.update(job["id"], status=FAILED, stage=FAILED, error=str(e))
+            raise
+        logger.info("Job queued", job_id=job["id"])
+        return job
+
+    def resume(self) -> int:
+        """Reschedule queued jobs and running jobs whose worker lost its lease
+
+        Jobs held by a live worker keep running there; every worker may
+        schedule the same queued job, but only the first claim runs it.
+        """
+        expired = self.store.requeue_expired(self.lease_s)
+        if expired:
+            logger.warning("Expired job leases requeued", count=expired)
+        resumed = 0
+        for job in self.store.queued():
+            try:
+                self.pool.submit(self._execute, job["id"], job["params"])
+            except PoolSaturated:
+                # Remaining jobs stay queued in the store for the next restart
+                break
+            resumed += 1
+        if resumed:
+            logger.info("Jobs resumed", count=resumed)
+        return resumed
+
+    def _execute(self, job_id: str, params: Dict[str, Any]):
+        if not self.store.claim(job_id, self.owner):
+            logger.info("Job already claimed", job_id=job_id)
+            return
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop),
+                                     name=f"job-heartbeat-{job_id}", daemon=True)
+        heartbeat.start()
+        try:
+            summary = self.on_complete(job_id, self.runner(job_id, params))
+        except Exception as e:
+            logger.error("Job failed", job_id=job_id, error=str(e))
+            self.store.finish(job_id, self.owner, status=FAILED, stage=FAILED, error=str(e))
+            return
+        finally:
+            stop.set()
+            heartbeat.join()
+        if not self.store.finish(job_id, self.owner, status=COMPLETED, stage=COMPLETED,
+                                 progress=1.0, result=summary):
+            logger.warning("Job lease lost before completion", job_id=job_id)
+            return
+        logger.info("Job completed", job_id=job_id)
+
+    def _heartbeat(self, job_id: str, stop: threading.Event):
+        while not stop.wait(self.lease_s / 3):
+            if not self.store.heartbeat(job_id, self.owner):
+                logger.warning("Job lease lost", job_id=job_id)
+                return
+
+    def shutdown(self, wait: bool = False):
+        self.pool.shutdown(wait=wait)
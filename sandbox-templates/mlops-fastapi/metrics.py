@@ -0,0 +1,233 @@
+"""
+📊 Low-overhead Prometheus instrumentation
+Per-thread sharded counters and histograms rendered in the Prometheus text format
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+
+# Default latency buckets in seconds, tuned for sub-millisecond inference
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class _Shards:
+    """One mutable cell per thread.
+
+    Each thread only ever writes its own cell, so updates need no lock; the
+    lock is taken once per thread to register the cell and when collecting.
+    """
+
+    def __init__(self, cell_factory: Callable[[], List[float]]):
+        self._cell_factory = cell_factory
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._cell_factory()
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def snapshot(self) -> List[List[float]]:
+        with self._lock:
+            return [list(cell) for cell in self._cells]
+
+
+class CounterChild:
+    """A single labelled counter series"""
+
+    def __init__(self):
+        self._shards = _Shards(lambda: [0.0])
+
+    def inc(self, amount: float = 1.0):
+        self._shards.cell()[0] += amount
+
+    def value(self) -> float:
+        return sum(cell[0] for cell in self._shards.snapshot())
+
+
+class HistogramChild:
+    """A single labelled histogram series"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self._bounds = tuple(buckets)
+        # Cell layout: one slot per bucket, one for +Inf, then the sum
+        size = len(self._bounds) + 2
+        self._shards = _Shards(lambda: [0.0] * size)
+
+    def observe(self, value: float):
+        cell = self._shards.cell()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def value(self) -> Tuple[List[Tuple[str, float]], float]:
+        totals = [0.0] * (len(self._bounds) + 2)
+        for cell in self._shards.snapshot():
+            for i, v in enumerate(cell):
+                totals[i] += v
+
+        buckets, cumulative = [], 0.0
+        for bound, count in zip(self._bounds, totals):
+            cumulative += count
+            buckets.append((repr(float(bound)), cumulative))
+        buckets.append(("+Inf", cumulative + totals[-2]))
+        return buckets, totals[-1]
+
+
+class _Timer:
+    def __init__(self, histogram: HistogramChild):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started)
+
+
+class _Family:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], child_factory):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._child_factory = child_factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics are exported as zero before the first update
+            self.labels()
+
+    def labels(self, *values: str):
+        try:
+            return self._children[values]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(values, self._child_factory())
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Family):
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames, CounterChild)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, child in self.children():
+            family.add_metric(values, child.value())
+        return family
+
+
+class Histogram(_Family):
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames, lambda: HistogramChild(buckets))
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def collect(self):
+        family = HistogramMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, child in self.children():
+            buckets, total = child.value()
+            family.add_metric(values, buckets, total)
+        return family
+
+
+class MetricsRegistry:
+    """Holds sharded metrics plus callback collectors for point-in-time values"""
+
+    def __init__(self):
+        self._metrics: List[_Family] = []
+        self._collectors: List[Callable[[], Iterable]] = []
+        self._registry = CollectorRegistry(auto_describe=False)
+        self._registry.register(self)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable]):
+        """Register a callable yielding prometheus_client metric families"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        for metric in self._metrics:
+            yield metric.collect()
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self) -> bytes:
+        return generate_latest(self._registry)
+
+
+def route_label(scope) -> str:
+    """Low-cardinality endpoint label: the matched route template"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware timing every HTTP request per endpoint"""
+
+    def __init__(self, app, latency: Histogram, errors: Counter):
+        self.app = app
+        self.latency = latency
+        self.errors = errors
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = route_label(scope)
+            self.latency.labels(endpoint, scope["method"]).observe(time.perf_counter() - started)
+            if status[0] >= 400:
+                self.errors.labels(endpoint, str(status[0])).inc()
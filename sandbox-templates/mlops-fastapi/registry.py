@@ -0,0 +1,209 @@
+"""
+🗃️ Versioned model registry
+Indexes saved models by version and keeps an LRU of resident models
+"""
+
+import fcntl
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import structlog
+
+logger = structlog.get_logger()
+
+LATEST = "latest"
+
+
+class ModelNotFound(KeyError):
+    """Raised when a requested model version is not registered"""
+
+
+class ModelRegistry:
+    """File-backed model index shared by every worker on the box.
+
+    Models are dumped uncompressed and loaded with ``mmap_mode``, which
+    only shares plain ndarray attributes such as ``classes_`` through the
+    page cache. sklearn's ``Tree.__setstate__`` copies the node and value
+    arrays, so every worker still holds its own copy of the trees.
+
+    Resident models are kept in an LRU bounded by ``memory_budget_bytes``
+    (estimated from file sizes); the most recently used model is never
+    evicted. ``prepare`` is applied to every freshly loaded model before
+    it becomes resident.
+    """
+
+    def __init__(self, models_dir: str, memory_budget_bytes: int = 1024 ** 3, mmap_mode: Optional[str] = "r",
+                 prepare: Optional[Callable[[Any], Any]] = None):
+        self.models_dir = models_dir
+        self.index_path = os.path.join(models_dir, "registry.json")
+        self.memory_budget_bytes = memory_budget_bytes
+        self.mmap_mode = mmap_mode
+        self.prepare = prepare
+
+        self._index: Dict[str, Any] = {"latest": None, "versions": {}}
+        self._index_mtime = None
+        self._resident: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @contextmanager
+    def _index_lock(self):
+        os.makedirs(self.models_dir, exist_ok=True)
+        with open(self.index_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        """Re-read the index if another process has changed it"""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def _dump(self, obj, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(obj, tmp_path)  # uncompressed so it can be memory-mapped
+        os.replace(tmp_path, path)
+
+    def register(self, model, version: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None,
+                 make_latest: bool = True, artifacts: Optional[Dict[str, Any]] = None) -> str:
+        """Save ``model`` under ``version`` and record it in the index
+
+        ``artifacts`` are extra objects stored next to the model (e.g. the
+        drift reference) that any worker can load with :meth:`load_artifact`.
+        """
+        version = version or datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.models_dir, f"model_{version}.joblib")
+
+        os.makedirs(self.models_dir, exist_ok=True)
+        self._dump(model, path)
+        artifact_paths = {}
+        for name, artifact in (artifacts or {}).items():
+            artifact_paths[name] = os.path.join(self.models_dir, f"model_{version}.{name}.joblib")
+            self._dump(artifact, artifact_paths[name])
+
+        with self._lock, self._index_lock():
+            self._index_mtime = None
+            self._refresh_index()
+            self._index["versions"][version] = {
+                "path": path,
+                "size_bytes": os.path.getsize(path),
+                "created_at": datetime.now().isoformat(),
+                "metadata": metadata or {},
+                "artifacts": artifact_paths,
+            }
+            if make_latest:
+                self._index["latest"] = version
+            self._write_index()
+
+        logger.info("Model registered", version=version, model_path=path)
+        return version
+
+    def resolve(self, version: Optional[str] = LATEST) -> str:
+        """Map ``latest`` (or None) to a concrete registered version"""
+        with self._lock:
+            self._refresh_index()
+            if version in (None, LATEST):
+                version = self._index.get("latest")
+                if version is None:
+                    raise ModelNotFound("No model versions registered")
+            if version not in self._index["versions"]:
+                raise ModelNotFound(f"Model version {version} not found")
+            return version
+
+    def info(self, version: Optional[str] = LATEST) -> Dict[str, Any]:
+        version = self.resolve(version)
+        with self._lock:
+            return {"version": version, **self._index["versions"][version]}
+
+    def load_artifact(self, version: Optional[str], name: str):
+        """Load an artifact stored with ``version``, or None if it has none by that name"""
+        path = self.info(version).get("artifacts", {}).get(name)
+        if path is None:
+            return None
+        return joblib.load(path)
+
+    def versions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh_index()
+            return [
+                {"version": version, "resident": version in self._resident, **entry}
+                for version, entry in sorted(self._index["versions"].items())
+            ]
+
+    def cached(self, version: Optional[str] = LATEST):
+        """Return a resident model without touching disk, or None"""
+        with self._lock:
+            try:
+                version = self.resolve(version)
+            except ModelNotFound:
+                return None
+            entry = self._resident.get(version)
+            if entry is None:
+                return None
+            self._resident.move_to_end(version)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, version: Optional[str] = LATEST):
+        """Return the model for ``version``, loading it if necessary"""
+        model = self.cached(version)
+        if model is not None:
+            return model
+
+        info = self.info(version)
+        model = joblib.load(info["path"], mmap_mode=self.mmap_mode)
+        if self.prepare is not None:
+            model = self.prepare(model)
+        with self._lock:
+            if info["version"] not in self._resident:
+                self.loads += 1
+                self._resident[info["version"]] = (model, info["size_bytes"])
+                self._resident_bytes += info["size_bytes"]
+                self._evict()
+            self._resident.move_to_end(info["version"])
+            model = self._resident[info["version"]][0]
+        logger.info("Model loaded", version=info["version"], mmap_mode=self.mmap_mode)
+        return model
+
+    def _evict(self):
+        while self._resident_bytes > self.memory_budget_bytes and len(self._resident) > 1:
+            version, (_, size) = self._resident.popitem(last=False)
+            self._resident_bytes -= size
+            self.evictions += 1
+            logger.info("Model evicted", version=version)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resident_versions": list(self._resident),
+                "resident_bytes": self._resident_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -8,6 +8,7 @@ import numpy as np
 import pandas as pd
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
+import io
 import json
 import os
 import sys
@@ -16,10 +17,28 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, generate_sample_data, save_model, load_model
+from batching import MicroBatcher, predict_with_confidence
+from executors import BoundedPool, PoolSaturated
 
 # Create test client
 client = TestClient(app)
 
+def train_and_wait(training_request, timeout: float = 60.0):
+    """Queue a training job and poll until it finishes"""
+    import time
+    
+    response = client.post("/train", json=training_request)
+    assert response.status_code == 202
+    
+    job_id = response.json()["job_id"]
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/train/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Training job {job_id} did not finish in {timeout}s")
+
 class TestMLOpsTemplate:
     """Test class for MLOps FastAPI Template"""
     
@@ -66,11 +85,11 @@ class TestMLOpsTemplate:
             "n_estimators": 10  # Small for fast testing
         }
         
-        response = client.post("/train", json=training_request)
-        assert response.status_code == 200
+        job = train_and_wait(training_request)
+        assert job["status"] == "completed"
+        assert job["progress"] == 1.0
         
-        data = response.json()
-        assert "message" in data
+        data = job["result"]
         assert "accuracy" in data
         assert "model_path" in data
         assert data["accuracy"] > 0  # Should be positive
@@ -118,14 +137,23 @@ class TestMLOpsTemplate:
     
     def test_metrics_endpoint(self):
         """Test metrics endpoint"""
+        sample = 'mlops_http_errors_total{endpoint="/train/{job_id}",status="404"} '
+        
+        def errors_counted(body: str) -> float:
+            lines = [line for line in body.splitlines() if line.startswith(sample)]
+            return float(lines[0][len(sample):]) if lines else 0.0
+        
+        before = errors_counted(client.get("/metrics").text)
+        assert client.get("/train/no-such-job").status_code == 404
         response = client.get("/metrics")
         assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
         
-        data = response.json()
-        assert "predictions_total" in data
-        assert "model_accuracy" in data
-        assert "uptime_seconds" in data
-        assert "errors_total" in data
+        body = response.text
+        assert "mlops_predictions_total" in body
+        assert "mlops_model_accuracy" in body
+        assert "mlops_uptime_seconds" in body
+        assert errors_counted(body) == before + 1
     
     def test_save_and_load_model(self):
         """Test model saving and loading utilities"""
@@ -157,6 +185,76 @@ class TestMLOpsTemplate:
         if os.path.exists(model_path):
             os.remove(model_path)
 
+class TestTrainingJobs:
+    """Tests for the asynchronous training job subsystem"""
+    
+    def test_train_returns_job_id_immediately(self):
+        """/train answers 202 with a job id and a status URL"""
+        response = client.post("/train", json={"experiment_name": "job_test", "n_estimators": 5})
+        assert response.status_code == 202
+        
+        data = response.json()
+        assert data["status"] == "queued"
+        assert data["status_url"] == f"/train/{data['job_id']}"
+    
+    def test_unknown_job_returns_404(self):
+        """Polling an unknown job id returns 404"""
+        response = client.get("/train/does-not-exist")
+        assert response.status_code == 404
+    
+    def test_completed_job_hot_swaps_model(self):
+        """A completed job replaces the serving model"""
+        import app as app_module
+        
+        previous_model, _ = app_module.serving_model
+        job = train_and_wait({"experiment_name": "swap_test", "n_estimators": 3})
+        
+        assert job["status"] == "completed"
+        assert app_module.serving_model[0] is not previous_model
+        assert app_module.serving_model[1] == job["result"]["model_version"]
+        assert app_module.model_metrics["model_path"] == job["result"]["model_path"]
+    
+    def test_unfinished_jobs_are_resumed(self, tmp_path):
+        """Jobs left queued by a previous process are rescheduled"""
+        from jobs import JobManager, JobStore
+        
+        store = JobStore(str(tmp_path / "jobs.db"))
+        stale = store.create({"n_estimators": 1})
+        store.update(stale["id"], status="running")
+        
+        manager = JobManager(store, runner=lambda job_id, params: params,
+                             on_complete=lambda job_id, output: {"echo": output})
+        try:
+            assert manager.resume() == 1
+            manager.pool.shutdown(wait=True)
+        finally:
+            manager.shutdown()
+        
+        job = store.get(stale["id"])
+        assert job["status"] == "completed"
+        assert job["result"] == {"echo": {"n_estimators": 1}}
+    
+    def test_jobs_leased_by_live_workers_are_not_resumed(self, tmp_path):
+        """Only the first claim runs a job; live leases survive another worker's resume"""
+        from jobs import JobManager, JobStore
+        
+        store = JobStore(str(tmp_path / "jobs.db"))
+        job = store.create({"n_estimators": 1})
+        assert store.claim(job["id"], "worker-a")
+        assert not store.claim(job["id"], "worker-b")
+        
+        manager = JobManager(store, runner=lambda job_id, params: params,
+                             on_complete=lambda job_id, output: {"echo": output})
+        try:
+            assert manager.resume() == 0
+        finally:
+            manager.shutdown()
+        assert store.get(job["id"])["owner"] == "worker-a"
+        
+        # Once the heartbeat is older than the lease the job goes back to the queue
+        assert store.requeue_expired(lease_s=-1) == 1
+        assert store.get(job["id"])["status"] == "queued"
+
 class TestIntegrationFlow:
     """Integration tests for complete ML workflow"""
     
@@ -171,11 +269,9 @@ class TestIntegrationFlow:
             "n_estimators": 10
         }
         
-        train_response = client.post("/train", json=training_request)
-        assert train_response.status_code == 200
-        
-        train_data = train_response.json()
-        assert "accuracy" in train_data
+        train_job = train_and_wait(training_request)
+        assert train_job["status"] == "completed"
+        assert "accuracy" in train_job["result"]
         
         # Step 2: Make prediction
         prediction_request = {
@@ -220,7 +316,7 @@ class TestErrorHandling:
             "experiment_name": "error_test",
             "n_estimators": 5
         }
-        client.post("/train", json=training_request)
+        train_and_wait(training_request)
         
         # Try prediction with wrong feature count
         prediction_request = {
@@ -269,6 +365,558 @@ class TestSecurityAndValidation:
         )
         assert response.status_code == 422
 
+class TestBatchPrediction:
+    """Tests for the /predict/batch endpoint"""
+    
+    rows = [[1.0, -0.5, 0.8, 2.1], [-1.0, -2.0, 0.3, 0.4], [0.5, 0.5, 0.0, 0.0]]
+    
+    @pytest.fixture(autouse=True)
+    def trained_model(self):
+        train_and_wait({"experiment_name": "batch_test", "n_estimators": 5})
+    
+    def test_json_batch_matches_single_predictions(self):
+        """Batch results line up with single-row predictions"""
+        response = client.post("/predict/batch", json={"features": self.rows})
+        assert response.status_code == 200
+        
+        data = response.json()
+        assert data["count"] == 3
+        assert len(data["predictions"]) == len(data["confidences"]) == 3
+        for row, prediction in zip(self.rows, data["predictions"]):
+            single = client.post("/predict", json={"features": row}).json()
+            assert single["prediction"] == prediction
+    
+    def test_npy_batch(self):
+        """NumPy .npy bodies are accepted"""
+        buffer = io.BytesIO()
+        np.save(buffer, np.array(self.rows))
+        
+        response = client.post(
+            "/predict/batch",
+            content=buffer.getvalue(),
+            headers={"Content-Type": "application/x-npy"}
+        )
+        assert response.status_code == 200
+        assert response.json()["count"] == 3
+    
+    def test_arrow_batch(self):
+        """Arrow IPC streams with one column per feature are accepted"""
+        pa = pytest.importorskip("pyarrow")
+        columns = list(zip(*self.rows))
+        table = pa.table({f"feature_{i}": list(col) for i, col in enumerate(columns, 1)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        
+        response = client.post(
+            "/predict/batch",
+            content=sink.getvalue().to_pybytes(),
+            headers={"Content-Type": "application/vnd.apache.arrow.stream"}
+        )
+        assert response.status_code == 200
+        assert response.json()["count"] == 3
+    
+    def test_ndjson_streaming(self):
+        """Streaming mode returns one NDJSON line per row"""
+        response = client.post("/predict/batch?stream=true", json=self.rows)
+        assert response.status_code == 200
+        
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["index"] for line in lines] == [0, 1, 2]
+    
+    def test_invalid_batch_shape(self):
+        """Ragged or wrongly sized rows are rejected"""
+        assert client.post("/predict/batch", json=[[1.0, 2.0]]).status_code == 422
+        assert client.post("/predict/batch", json=[1.0, 2.0]).status_code == 422
+
+class TestPredictionCache:
+    """Tests for the LRU/TTL prediction cache"""
+    
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first"""
+        from cache import PredictionCache
+        
+        cache = PredictionCache(max_entries=2)
+        keys = [PredictionCache.key("v1", [float(i)]) for i in range(3)]
+        cache.put(keys[0], (0, 0.9))
+        cache.put(keys[1], (1, 0.8))
+        cache.get(keys[0])
+        cache.put(keys[2], (1, 0.7))
+        
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) == (0, 0.9)
+        assert cache.stats()["evictions"] == 1
+    
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are treated as misses"""
+        from cache import PredictionCache
+        
+        cache = PredictionCache(ttl_seconds=0)
+        key = PredictionCache.key("v1", [1.0])
+        cache.put(key, (1, 0.5))
+        
+        assert cache.get(key) is None
+        assert cache.stats()["expirations"] == 1
+    
+    def test_key_depends_on_model_version(self):
+        """The same features under different versions never collide"""
+        from cache import PredictionCache
+        
+        assert PredictionCache.key("v1", [1.0, 2.0]) != PredictionCache.key("v2", [1.0, 2.0])
+        assert PredictionCache.key("v1", [1, 2]) == PredictionCache.key("v1", [1.0, 2.0])
+
+class TestStreamingDrift:
+    """Tests for incremental drift monitoring"""
+    
+    @staticmethod
+    def _monitor(**kwargs):
+        from drift import StreamingDriftMonitor
+        
+        reference = np.random.default_rng(0).normal(0, 1, (5000, 2))
+        return StreamingDriftMonitor(reference, ["a", "b"], fold_rows=64, **kwargs)
+    
+    def test_matching_traffic_has_low_psi(self):
+        """Traffic from the reference distribution shows no drift"""
+        monitor = self._monitor()
+        monitor.observe(np.random.default_rng(1).normal(0, 1, (5000, 2)))
+        
+        summary = monitor.summary()
+        assert summary["samples_observed"] == 5000
+        assert not summary["drift_detected"]
+        assert abs(summary["features"]["a"]["mean"]) < 0.1
+    
+    def test_shifted_traffic_is_detected(self):
+        """A shifted feature crosses the PSI threshold"""
+        monitor = self._monitor()
+        traffic = np.random.default_rng(1).normal(0, 1, (2000, 2))
+        traffic[:, 1] += 1.5
+        for row in traffic:
+            monitor.observe(row)
+        
+        summary = monitor.summary()
+        assert summary["drifted_features"] == ["b"]
+        assert summary["features"]["b"]["ks"] > 0.3
+        assert abs(summary["features"]["b"]["mean"] - traffic[:, 1].mean()) < 1e-9
+    
+    def test_reservoir_is_bounded(self):
+        """The raw sample never exceeds the reservoir size"""
+        monitor = self._monitor(reservoir_size=100)
+        monitor.observe(np.zeros((1000, 2)))
+        assert len(monitor.sample()) == 100
+    
+    def test_concurrent_rebuilds_are_coalesced(self):
+        """Parallel callers on a stale cache share one in-flight rebuild"""
+        import asyncio
+        from drift import DriftReportCache
+        
+        cache = DriftReportCache(refresh_seconds=3600, min_samples=10)
+        summary = {"samples_observed": 50, "drift_detected": False}
+        calls = []
+        
+        async def build():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "{}"
+        
+        async def refresh_concurrently():
+            return await asyncio.gather(*(cache.refresh(summary, build) for _ in range(5)))
+        
+        started = asyncio.run(refresh_concurrently())
+        assert len(calls) == 1 and cache.builds == 1
+        assert sorted(started) == [False] * 4 + [True]
+        assert cache.report == "{}"
+    
+    def test_reference_state_round_trip(self):
+        """A monitor rebuilt from the persisted reference state scores traffic identically"""
+        from drift import StreamingDriftMonitor
+        
+        original = self._monitor()
+        restored = StreamingDriftMonitor.from_reference_state(original.reference_state(), fold_rows=64)
+        traffic = np.random.default_rng(3).normal(0.5, 1, (1000, 2))
+        original.observe(traffic)
+        restored.observe(traffic)
+        
+        assert restored.summary() == original.summary()
+    
+    def test_report_cache_rebuild_policy(self):
+        """Reports rebuild on first use and when drift newly appears"""
+        from drift import DriftReportCache
+        
+        cache = DriftReportCache(refresh_seconds=3600, min_samples=10)
+        calm = {"samples_observed": 50, "drift_detected": False}
+        drifting = {"samples_observed": 60, "drift_detected": True}
+        
+        assert not cache.needs_rebuild({"samples_observed": 5, "drift_detected": False})
+        assert cache.needs_rebuild(calm)
+        cache.store("{}", calm)
+        assert not cache.needs_rebuild(calm)
+        assert cache.needs_rebuild(drifting)
+        cache.store("{}", drifting)
+        assert not cache.needs_rebuild(drifting)
+    
+    def test_rows_of_the_wrong_width_are_rejected(self):
+        """Rows are never reshaped into several drift rows"""
+        monitor = self._monitor()
+        with pytest.raises(ValueError):
+            monitor.observe([1.0, 2.0, 3.0, 4.0])
+        assert monitor.samples_observed == 0
+    
+    def test_only_valid_predictions_are_observed(self):
+        """Invalid requests don't reach the drift window; each valid one adds one row"""
+        import app as app_module
+        
+        train_and_wait({"experiment_name": "drift_observe_test", "n_estimators": 3})
+        before = app_module.drift_monitor.samples_observed
+        
+        assert client.post("/predict", json={"features": [1.0] * 8}).status_code == 422
+        assert client.post("/predict", json={"features": [1.0] * 4}).status_code == 200
+        assert app_module.drift_monitor.samples_observed == before + 1
+    
+    def test_drift_endpoint_reports_live_statistics(self):
+        """/monitoring/drift reflects predictions made since training"""
+        train_and_wait({"experiment_name": "drift_test", "n_estimators": 3})
+        client.post("/predict/batch", json=np.random.default_rng(2).normal(0, 1, (200, 4)).tolist())
+        
+        data = client.get("/monitoring/drift").json()
+        assert data["drift"]["samples_observed"] == 200
+        assert set(data["drift"]["features"]) == {"feature_1", "feature_2", "feature_3", "feature_4"}
+        assert data["report"] is not None
+
+class TestModelRegistry:
+    """Tests for the versioned, memory-mapped model registry"""
+    
+    @staticmethod
+    def _model(n_estimators: int):
+        from sklearn.ensemble import RandomForestClassifier
+        
+        data = generate_sample_data(100)
+        model = RandomForestClassifier(n_estimators=n_estimators, random_state=42)
+        return model.fit(data.drop('target', axis=1).values, data['target'])
+    
+    def test_register_and_resolve_versions(self, tmp_path):
+        """Versions are indexed and latest points at the newest registration"""
+        from registry import ModelRegistry
+        
+        registry = ModelRegistry(str(tmp_path))
+        first = registry.register(self._model(2), version="v1")
+        second = registry.register(self._model(3), version="v2")
+        
+        assert registry.resolve("latest") == second
+        assert registry.get(first).n_estimators == 2
+        assert [v["version"] for v in registry.versions()] == ["v1", "v2"]
+        
+        # A second registry instance (another worker) sees the same index
+        assert ModelRegistry(str(tmp_path)).resolve("latest") == "v2"
+    
+    def test_plain_array_attributes_are_memory_mapped(self, tmp_path):
+        """Plain ndarray attributes stay mapped (tree arrays are copied by sklearn)"""
+        from registry import ModelRegistry
+        
+        registry = ModelRegistry(str(tmp_path))
+        registry.register(self._model(2), version="v1")
+        assert isinstance(registry.get("v1").classes_, np.memmap)
+    
+    def test_lru_respects_memory_budget(self, tmp_path):
+        """Least recently used versions are evicted beyond the budget"""
+        from registry import ModelRegistry
+        
+        registry = ModelRegistry(str(tmp_path), memory_budget_bytes=1)
+        registry.register(self._model(2), version="v1")
+        registry.register(self._model(2), version="v2")
+        
+        registry.get("v1")
+        registry.get("v2")
+        
+        stats = registry.stats()
+        assert stats["resident_versions"] == ["v2"]
+        assert stats["evictions"] == 1
+    
+    def test_predict_routes_by_model_version(self):
+        """/predict serves the requested version and 404s unknown ones"""
+        job = train_and_wait({"experiment_name": "registry_test", "n_estimators": 3})
+        version = job["result"]["model_version"]
+        
+        response = client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0], "model_version": version})
+        assert response.status_code == 200
+        assert response.json()["model_version"] == version
+        
+        response = client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0], "model_version": "missing"})
+        assert response.status_code == 404
+        
+        assert version in [v["version"] for v in client.get("/models").json()["versions"]]
+    
+    def test_latest_registered_by_another_worker_is_served(self):
+        """A worker picks up a newer latest version written by another process"""
+        import app as app_module
+        from registry import ModelRegistry
+        
+        version = ModelRegistry(app_module.MODELS_DIR).register(self._model(2), metadata={"accuracy": 0.5})
+        app_module.last_model_refresh = 0.0
+        
+        response = client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0]})
+        assert response.status_code == 200
+        assert response.json()["model_version"] == version
+        assert client.get("/models").json()["active_version"] == version
+
+    def test_drift_reference_is_restored_from_registry(self):
+        """Workers that did not train a version still monitor drift against its reference"""
+        import app as app_module
+        from drift import REFERENCE_ARTIFACT, StreamingDriftMonitor
+        from registry import ModelRegistry
+        
+        reference = generate_sample_data(200).drop('target', axis=1)
+        state = StreamingDriftMonitor(reference.values, list(reference.columns)).reference_state()
+        version = ModelRegistry(app_module.MODELS_DIR).register(
+            self._model(2), artifacts={REFERENCE_ARTIFACT: {"state": state, "sample": reference}}
+        )
+        app_module.last_model_refresh = 0.0
+        
+        client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0]})
+        assert app_module.serving_model[1] == version
+        assert app_module.drift_monitor.feature_names == list(reference.columns)
+        assert app_module.drift_monitor.samples_observed == 1
+        assert app_module.reference_data.equals(reference)
+
+class TestCompiledForest:
+    """Tests for the compiled NumPy forest inference path"""
+    
+    @staticmethod
+    def _model(n_estimators: int = 20, **kwargs):
+        from sklearn.ensemble import RandomForestClassifier
+        
+        data = generate_sample_data(300)
+        model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, **kwargs)
+        return model.fit(data.drop('target', axis=1).values, data['target'])
+    
+    def test_matches_sklearn_exactly(self):
+        """Probabilities and labels are bit-identical to sklearn's"""
+        from compiled import compile_forest
+        
+        model = self._model()
+        compiled = compile_forest(model)
+        X = np.random.default_rng(0).normal(scale=3, size=(1000, 4))
+        
+        assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+        assert np.array_equal(compiled.predict(X), model.predict(X))
+        # Rows sitting exactly on split thresholds take the same branch
+        probes = compiled.probe_rows()
+        assert np.array_equal(compiled.predict_proba(probes), model.predict_proba(probes))
+    
+    def test_self_check_detects_mismatch(self):
+        """verify() raises when the compiled tables disagree with sklearn"""
+        from compiled import CompilationMismatch, CompiledForest
+        
+        compiled = CompiledForest(self._model(n_estimators=3))
+        compiled.value = compiled.value[:, ::-1].copy()
+        
+        with pytest.raises(CompilationMismatch):
+            compiled.verify()
+    
+    def test_unsupported_models_are_served_unchanged(self):
+        """prepare_model leaves non-forest models to sklearn"""
+        from sklearn.linear_model import LogisticRegression
+        import app as app_module
+        
+        model = LogisticRegression()
+        with patch.object(app_module, "COMPILE_FORESTS", True):
+            assert app_module.prepare_model(model) is model
+            assert app_module.prepare_model(None) is None
+    
+    def test_registry_compiles_on_load(self, tmp_path):
+        """With compilation enabled the registry serves the compiled forest"""
+        from compiled import CompiledForest
+        from registry import ModelRegistry
+        import app as app_module
+        
+        with patch.object(app_module, "COMPILE_FORESTS", True):
+            registry = ModelRegistry(str(tmp_path), prepare=app_module.prepare_model)
+            registry.register(self._model(n_estimators=5), version="v1")
+            model = registry.get("v1")
+        
+        assert isinstance(model, CompiledForest)
+        labels, confidences = predict_with_confidence(model, np.zeros((3, 4)))
+        assert len(labels) == 3 and np.all(confidences >= 0.5)
+
+class TestPrometheusMetrics:
+    """Tests for Prometheus instrumentation"""
+    
+    @staticmethod
+    def _sample(body: str, prefix: str) -> float:
+        for line in body.splitlines():
+            if line.startswith(prefix):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+    
+    def test_predictions_and_latency_are_recorded(self):
+        """Predictions increment counters and per-endpoint latency histograms"""
+        train_and_wait({"experiment_name": "metrics_test", "n_estimators": 3})
+        before = self._sample(client.get("/metrics").text, "mlops_predictions_total")
+        
+        client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0]})
+        client.post("/predict/batch", json=[[1.0, 2.0, 3.0, 4.0], [0.0, 0.0, 0.0, 0.0]])
+        body = client.get("/metrics").text
+        
+        assert self._sample(body, "mlops_predictions_total") == before + 3
+        assert 'mlops_http_request_duration_seconds_count{endpoint="/predict",method="POST"}' in body
+        assert "mlops_model_inference_seconds_count" in body
+        assert "mlops_request_validation_seconds_count" in body
+    
+    def test_errors_are_counted_per_endpoint(self):
+        """4xx/5xx responses are counted with endpoint and status labels"""
+        client.post("/predict", json={"features": []})
+        body = client.get("/metrics").text
+        assert 'mlops_http_errors_total{endpoint="/predict",status="422"}' in body
+    
+    def test_sharded_counter_sums_across_threads(self):
+        """Per-thread shards add up to the total"""
+        import threading
+        from metrics import MetricsRegistry
+        
+        counter = MetricsRegistry().counter("test_events", "Test events")
+        threads = [
+            threading.Thread(target=lambda: [counter.inc() for _ in range(1000)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert counter.labels().value() == 4000
+
+class TestMicroBatching:
+    """Tests for dynamic micro-batching of predictions"""
+    
+    @staticmethod
+    def _train_small_model():
+        from sklearn.ensemble import RandomForestClassifier
+        
+        data = generate_sample_data(200)
+        X = data.drop('target', axis=1)
+        model = RandomForestClassifier(n_estimators=5, random_state=42)
+        model.fit(X.values, data['target'])
+        return model, X.values
+    
+    def test_predict_with_confidence_matches_sklearn(self):
+        """Single predict_proba pass matches predict and max probability"""
+        model, X = self._train_small_model()
+        
+        labels, confidences = predict_with_confidence(model, X[:20])
+        
+        np.testing.assert_array_equal(labels, model.predict(X[:20]))
+        np.testing.assert_array_equal(confidences, model.predict_proba(X[:20]).max(axis=1))
+    
+    def test_concurrent_requests_share_one_batch(self):
+        """Concurrent submissions are flushed through one model call"""
+        import asyncio
+        
+        model, X = self._train_small_model()
+        calls = []
+        
+        def counting_predict(m, features):
+            calls.append(len(features))
+            return predict_with_confidence(m, features)
+        
+        async def run():
+            batcher = MicroBatcher(counting_predict, max_batch_size=8, max_wait_ms=50)
+            await batcher.start()
+            try:
+                return await asyncio.gather(*[batcher.submit(model, row) for row in X[:8]]), batcher.stats()
+            finally:
+                await batcher.stop()
+        
+        results, stats = asyncio.run(run())
+        
+        assert calls == [8]
+        assert [label for label, _ in results] == list(model.predict(X[:8]))
+        assert stats["batches_total"] == 1
+        assert stats["batch_size_buckets"]["8"] == 1
+    
+    def test_stop_drains_pending_rows_and_returns(self):
+        """stop() flushes rows still queued and then finishes"""
+        import asyncio
+        
+        model, X = self._train_small_model()
+        
+        async def run():
+            batcher = MicroBatcher(max_batch_size=64, max_wait_ms=1000)
+            await batcher.start()
+            pending = [asyncio.ensure_future(batcher.submit(model, row)) for row in X[:3]]
+            await asyncio.sleep(0)
+            await asyncio.wait_for(batcher.stop(), timeout=5)
+            return await asyncio.gather(*pending), batcher.running
+        
+        results, running = asyncio.run(run())
+        
+        assert [label for label, _ in results] == list(model.predict(X[:3]))
+        assert not running
+    
+    def test_malformed_row_only_fails_its_group(self):
+        """A row with the wrong feature count does not fail the whole batch"""
+        import asyncio
+        
+        model, X = self._train_small_model()
+        
+        async def run():
+            batcher = MicroBatcher(max_batch_size=4, max_wait_ms=20)
+            await batcher.start()
+            try:
+                return await asyncio.gather(
+                    batcher.submit(model, X[0]),
+                    batcher.submit(model, [1.0, 2.0]),
+                    return_exceptions=True
+                )
+            finally:
+                await batcher.stop()
+        
+        good, bad = asyncio.run(run())
+        
+        assert good[0] == model.predict(X[:1])[0]
+        assert isinstance(bad, Exception)
+
+class TestExecutorPools:
+    """Tests for bounded executor pools and backpressure"""
+    
+    def test_pool_rejects_when_saturated(self):
+        """Submissions beyond workers + queue raise PoolSaturated"""
+        import threading
+        
+        release = threading.Event()
+        pool = BoundedPool("test", kind="thread", max_workers=1, max_queue=1)
+        try:
+            running = pool.submit(release.wait)
+            queued = pool.submit(release.wait)
+            
+            with pytest.raises(PoolSaturated):
+                pool.submit(release.wait)
+            
+            stats = pool.stats()
+            assert stats["active"] == 1
+            assert stats["queued"] == 1
+            assert stats["rejected"] == 1
+            
+            release.set()
+            running.result(timeout=5)
+            queued.result(timeout=5)
+            assert pool.stats()["completed"] == 2
+        finally:
+            release.set()
+            pool.shutdown()
+    
+    def test_saturated_inference_pool_returns_429(self):
+        """Prediction requests get 429 when the inference pool is full"""
+        train_and_wait({"experiment_name": "pool_test", "n_estimators": 5})
+        
+        with patch("app.inference_pool.submit", side_effect=PoolSaturated("inference pool is saturated")):
+            response = client.post("/predict", json={"features": [1.0, 2.0, 3.0, 4.0]})
+        assert response.status_code == 429
+    
+    def test_metrics_report_pool_utilization(self):
+        """Per-pool utilization is exposed on /metrics"""
+        body = client.get("/metrics").text
+        for pool in ("inference", "training", "drift", "jobs"):
+            assert f'mlops_pool_utilization{{pool="{pool}"}}' in body
+
 # TODO: Add more tests
 class TestTODOItems:
     """Tests for TODO items and future features"""
@@ -288,10 +936,25 @@ class TestTODOItems:
         """Test API rate limiting"""
         pass
     
-    @pytest.mark.skip(reason="TODO: Implement caching")
     def test_prediction_caching(self):
         """Test prediction result caching"""
-        pass
+        import app as app_module
+        
+        train_and_wait({"experiment_name": "cache_test", "n_estimators": 3})
+        request = {"features": [0.3, -0.2, 0.1, 0.9]}
+        
+        first = client.post("/predict", json=request).json()
+        second = client.post("/predict", json=request).json()
+        
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["prediction"] == first["prediction"]
+        assert second["confidence"] == first["confidence"]
+        
+        # Swapping in a new model invalidates cached results
+        train_and_wait({"experiment_name": "cache_test", "n_estimators": 4})
+        assert app_module.prediction_cache.stats()["size"] == 0
+        assert client.post("/predict", json=request).json()["cached"] is False
 
 # Performance tests
 class TestPerformance:
@@ -303,7 +966,7 @@ class TestPerformance:
         
         # Train model first
         training_request = {"experiment_name": "perf_test", "n_estimators": 5}
-        client.post("/train", json=training_request)
+        train_and_wait(training_request)
         
         # Measure prediction time
         prediction_request = {"features": [1.0, 2.0, 3.0, 4.0]}
@@ -325,7 +988,7 @@ class TestPerformance:
         
         # Train model first
         training_request = {"experiment_name": "concurrent_test", "n_estimators": 5}
-        client.post("/train", json=training_request)
+        train_and_wait(training_request)
         
         prediction_request = {"features": [1.0, 2.0, 3.0, 4.0]}
         
@@ -334,6 +997,42 @@ class TestPerformance:
             response = client.post("/predict", json=prediction_request)
             assert response.status_code == 200
 
+class TestBenchmarkHarness:
+    """Tests for the load-testing harness in examples/benchmark.py"""
+    
+    def test_run_load_reports_percentiles(self):
+        """run_load tracks latency percentiles, rows and errors"""
+        import asyncio
+        sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples"))
+        from benchmark import run_load
+        
+        async def call(i):
+            await asyncio.sleep(0.001)
+            if i == 3:
+                raise RuntimeError("boom")
+            return 2
+        
+        result = asyncio.run(run_load(call, total=20, concurrency=4))
+        
+        assert result["requests"] == 20
+        assert result["errors"] == 1
+        assert result["rows_per_s"] > 0
+        assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+    
+    def test_compare_flags_regressions(self):
+        """Latency increases and throughput drops beyond the tolerance are reported"""
+        sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples"))
+        from benchmark import compare
+        
+        baseline = {"scenarios": {"predict": {"p95_ms": 10.0, "p99_ms": 20.0, "throughput_rps": 100.0}}}
+        steady = {"scenarios": {"predict": {"p95_ms": 10.5, "p99_ms": 19.0, "throughput_rps": 98.0}}}
+        slower = {"scenarios": {"predict": {"p95_ms": 15.0, "p99_ms": 20.0, "throughput_rps": 70.0}}}
+        
+        assert compare(steady, baseline, tolerance=0.1) == []
+        regressions = compare(slower, baseline, tolerance=0.1)
+        assert len(regressions) == 2
+        assert regressions[0].startswith("predict.p95_ms")
+
 if __name__ == "__main__":
     # Run tests if script is executed directly
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+🏋️ Model training worker
+Side-effect-free training code for the spawned training process pool
+"""
+
+from typing import Any, Dict, Optional
+
+import mlflow
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from drift import REFERENCE_ARTIFACT, StreamingDriftMonitor
+from jobs import JobStore
+from registry import ModelRegistry
+
+
+def generate_sample_data(n_samples: int = 1000) -> pd.DataFrame:
+    """Generate sample dataset for demonstration"""
+    np.random.seed(42)
+
+    # TODO: Replace with your actual data loading logic
+    data = {
+        'feature_1': np.random.normal(0, 1, n_samples),
+        'feature_2': np.random.normal(0, 1, n_samples),
+        'feature_3': np.random.normal(0, 1, n_samples),
+        'feature_4': np.random.normal(0, 1, n_samples),
+    }
+
+    df = pd.DataFrame(data)
+
+    # Create target variable (binary classification)
+    df['target'] = (df['feature_1'] + df['feature_2'] > 0).astype(int)
+
+    return df
+
+
+def fit_and_log_model(
+    params: Dict[str, Any],
+    tracking_uri: str,
+    models_dir: str,
+    job_id: Optional[str] = None,
+    jobs_db_path: Optional[str] = None,
+    drift_bins: int = 10
+) -> Dict[str, Any]:
+    """Fit, evaluate and log a model; runs inside the training process pool
+
+    Spawned workers import only this module, never ``app``, so no pools,
+    job stores or registries of the serving process are built in them.
+    """
+    def report_progress(stage: str, progress: float):
+        if job_id is not None:
+            JobStore(jobs_db_path).set_progress(job_id, stage, progress)
+
+    mlflow.set_tracking_uri(tracking_uri)
+    mlflow.set_experiment(params["experiment_name"])
+
+    with mlflow.start_run():
+        # Generate or load training data
+        # TODO: Replace with your actual data loading logic
+        data = generate_sample_data(1000)
+
+        X = data.drop('target', axis=1)
+        y = data['target']
+
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=params["test_size"], random_state=params["random_state"]
+        )
+
+        # Train model
+        report_progress("fitting", 0.1)
+        model = RandomForestClassifier(
+            n_estimators=params["n_estimators"],
+            random_state=params["random_state"]
+        )
+        model.fit(X_train, y_train)
+
+        # Evaluate model
+        report_progress("evaluating", 0.6)
+        y_pred = model.predict(X_test)
+        accuracy = accuracy_score(y_test, y_pred)
+
+        # Log parameters and metrics to MLflow
+        report_progress("logging", 0.7)
+        mlflow.log_param("n_estimators", params["n_estimators"])
+        mlflow.log_param("test_size", params["test_size"])
+        mlflow.log_param("random_state", params["random_state"])
+        mlflow.log_metric("accuracy", accuracy)
+
+        # Log model
+        mlflow.sklearn.log_model(model, "model")
+
+        # Register model locally; the serving process maps it from disk.
+        # The drift reference goes with it so every worker can rebuild
+        # the monitor for this version, not just the one that trained it.
+        report_progress("saving", 0.9)
+        mlflow_run_id = mlflow.active_run().info.run_id
+        reference = StreamingDriftMonitor(X_train.values, list(X.columns), n_bins=drift_bins)
+        registry = ModelRegistry(models_dir)
+        model_version = registry.register(model, metadata={
+            "accuracy": accuracy,
+            "features": list(X.columns),
+            "experiment_name": params["experiment_name"],
+            "mlflow_run_id": mlflow_run_id
+        }, artifacts={
+            REFERENCE_ARTIFACT: {"state": reference.reference_state(), "sample": X_train}
+        })
+
+        return {
+            "model_version": model_version,
+            "accuracy": accuracy,
+            "features": list(X.columns),
+            "model_path": registry.info(model_version)["path"],
+            "mlflow_run_id": mlflow_run_id
+        }